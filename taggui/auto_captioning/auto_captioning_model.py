@@ -1,7 +1,8 @@
-import gc
 import re
+import threading
 from contextlib import nullcontext
 from datetime import datetime
+from typing import Callable
 
 import numpy as np
 import torch
@@ -34,6 +35,23 @@ def replace_template_variables(text: str, image: Image) -> str:
     return text
 
 
+def get_new_token_count(model_inputs: BatchFeature | dict,
+                        generated_token_ids: torch.Tensor) -> int:
+    """Get the number of tokens generated for the first input."""
+    generated_token_count = generated_token_ids.shape[-1]
+    input_ids = (model_inputs.get('input_ids')
+                 if isinstance(model_inputs, (BatchFeature, dict)) else None)
+    if input_ids is None:
+        return generated_token_count
+    # Decoder-only models also output the input tokens.
+    input_token_count = input_ids.shape[-1]
+    if (generated_token_count >= input_token_count
+            and torch.equal(generated_token_ids[0, :input_token_count].cpu(),
+                            input_ids[0].cpu())):
+        return generated_token_count - input_token_count
+    return generated_token_count
+
+
 class AutoCaptioningModel:
     model_load_context_manager = nullcontext()
     transformers_model_class = AutoModelForVision2Seq
@@ -61,6 +79,8 @@ class AutoCaptioningModel:
         self.processor = None
         self.model = None
         self.tokenizer = None
+        # The usage lock of the model in the model registry.
+        self.usage_lock: threading.Lock | None = None
 
     def get_device(self) -> torch.device:
         if (self.device_setting == CaptionDevice.GPU
@@ -106,7 +126,12 @@ class AutoCaptioningModel:
         model.eval()
         return model
 
-    def load_processor_and_model(self):
+    def load_processor_and_model(
+            self, should_cancel: Callable[[], bool] | None = None) -> bool:
+        """
+        Load the processor and model, or get them from the model registry if
+        they were previously loaded. Return `False` if loading was canceled.
+        """
         models_directory_path = self.thread.models_directory_path
         if models_directory_path:
             config_path = models_directory_path / self.model_id / 'config.json'
@@ -114,37 +139,31 @@ class AutoCaptioningModel:
                          / 'selected_tags.csv')
             if config_path.is_file() or tags_path.is_file():
                 self.model_id = str(models_directory_path / self.model_id)
-        # If the processor and model were previously loaded, use them.
-        processor = self.thread_parent.processor
-        model = self.thread_parent.model
         # Only GPUs support 4-bit quantization.
         self.load_in_4_bit = self.load_in_4_bit and self.device.type == 'cuda'
-        if (model and self.thread_parent.model_id == self.model_id
-                and (self.thread_parent.model_device_type
-                     == self.device.type)
-                and (self.thread_parent.is_model_loaded_in_4_bit
-                     == self.load_in_4_bit)):
-            self.processor = processor
-            self.model = model
-            return
-        # Load the new processor and model.
-        if model:
-            # Garbage collect the previous processor and model to free up
-            # memory.
-            self.thread_parent.processor = None
-            self.thread_parent.model = None
-            del processor
-            del model
-            gc.collect()
+        model_key = (self.model_id, str(self.device), self.load_in_4_bit)
+        model_registry = self.thread_parent.model_registry
+        # If the processor and model were previously loaded, use them.
+        # Otherwise, load them, unloading the least recently used models if
+        # the memory budget would be exceeded.
+        resident_model = model_registry.get_or_load(
+            model_key, self.load_new_processor_and_model, should_cancel)
+        if resident_model is None:
+            return False
+        self.processor = resident_model.processor
+        self.model = resident_model.model
+        self.usage_lock = resident_model.usage_lock
+        loaded_models_summary = model_registry.get_loaded_models_summary()
+        if len(loaded_models_summary) > 1:
+            print('Loaded models:\n' + '\n'.join(loaded_models_summary))
+        return True
+
+    def load_new_processor_and_model(self) -> tuple:
         self.thread.clear_console_text_edit_requested.emit()
         print(f'Loading {self.model_id}...')
-        self.processor = self.get_processor()
-        self.thread_parent.processor = self.processor
-        self.model = self.get_model()
-        self.thread_parent.model = self.model
-        self.thread_parent.model_id = self.model_id
-        self.thread_parent.model_device_type = self.device.type
-        self.thread_parent.is_model_loaded_in_4_bit = self.load_in_4_bit
+        processor = self.get_processor()
+        model = self.get_model()
+        return processor, model
 
     def monkey_patch_after_loading(self):
         pass
@@ -189,19 +208,21 @@ class AutoCaptioningModel:
         return text
 
     def load_image(self, image: Image) -> PilImage:
-        pil_image = PilImage.open(image.path)
-        # Rotate the image according to the orientation tag.
-        pil_image = exif_transpose(pil_image)
-        pil_image = pil_image.convert(self.image_mode)
+        with self.thread.profiler.time_stage('image loading'):
+            pil_image = PilImage.open(image.path)
+            # Rotate the image according to the orientation tag.
+            pil_image = exif_transpose(pil_image)
+            pil_image = pil_image.convert(self.image_mode)
         return pil_image
 
     def get_model_inputs(self, image_prompt: str,
                          image: Image) -> BatchFeature | dict | np.ndarray:
         text = self.get_input_text(image_prompt)
         pil_image = self.load_image(image)
-        model_inputs = (self.processor(text=text, images=pil_image,
-                                       return_tensors='pt')
-                        .to(self.device, **self.dtype_argument))
+        model_inputs = self.processor(text=text, images=pil_image,
+                                      return_tensors='pt')
+        with self.thread.profiler.time_stage('transfer'):
+            model_inputs = model_inputs.to(self.device, **self.dtype_argument)
         return model_inputs
 
     def get_generation_model(self):
@@ -287,7 +308,10 @@ class AutoCaptioningModel:
                 **model_inputs, bad_words_ids=bad_words_ids,
                 force_words_ids=forced_words_ids, **self.generation_parameters,
                 **additional_generation_parameters)
-        caption = self.get_caption_from_generated_tokens(generated_token_ids,
-                                                         image_prompt)
+        self.thread.profiler.add_generated_tokens(
+            get_new_token_count(model_inputs, generated_token_ids))
+        with self.thread.profiler.time_stage('postprocessing'):
+            caption = self.get_caption_from_generated_tokens(
+                generated_token_ids, image_prompt)
         console_output_caption = caption
         return caption, console_output_caption
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+from utils.utils import get_app_data_directory_path
+
+CACHE_FILE_NAME = 'caption_cache.sqlite3'
+HASH_CHUNK_SIZE = 1024 * 1024
+# The caption settings that do not change the generated caption.
+IGNORED_CAPTION_SETTINGS = ('prompt', 'caption_position', 'gpu_index',
+                            'use_caption_cache')
+
+
+def get_image_content_hash(image_path: Path) -> str:
+    image_hash = hashlib.sha256()
+    with image_path.open('rb') as image_file:
+        while chunk := image_file.read(HASH_CHUNK_SIZE):
+            image_hash.update(chunk)
+    return image_hash.hexdigest()
+
+
+def is_caption_cacheable(caption_settings: dict) -> bool:
+    # Captions generated with sampling are different every time.
+    return not caption_settings['generation_parameters']['do_sample']
+
+
+class CaptionCache:
+    """
+    A persistent cache of generated captions, keyed by the content hash of the
+    image, the resolved prompt and the settings that affect the caption.
+
+    The content hashes of images are also cached by path, modification time
+    and file size so that unchanged images are not read again.
+
+    A cache must be used in the thread that created it.
+    """
+
+    def __init__(self, caption_settings: dict, tag_separator: str):
+        settings = {key: value for key, value in caption_settings.items()
+                    if key not in IGNORED_CAPTION_SETTINGS}
+        settings['tag_separator'] = tag_separator
+        self.settings_string = json.dumps(settings, sort_keys=True,
+                                          default=str)
+        self.hit_count = 0
+        self.lookup_count = 0
+        path = get_app_data_directory_path() / CACHE_FILE_NAME
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS image_hashes (path TEXT PRIMARY '
+                'KEY, modification_time INTEGER, size INTEGER, hash TEXT)')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS captions (key TEXT PRIMARY KEY, '
+                'caption TEXT, console_output_caption TEXT, time TEXT)')
+
+    def get_image_hash(self, image_path: Path) -> str:
+        stat = image_path.stat()
+        row = self.connection.execute(
+            'SELECT hash FROM image_hashes WHERE path = ? AND '
+            'modification_time = ? AND size = ?',
+            (str(image_path), stat.st_mtime_ns, stat.st_size)).fetchone()
+        if row:
+            return row[0]
+        image_hash = get_image_content_hash(image_path)
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO image_hashes VALUES (?, ?, ?, ?)',
+                (str(image_path), stat.st_mtime_ns, stat.st_size,
+                 image_hash))
+        return image_hash
+
+    def get_key(self, image_path: Path, image_prompt: str | None) -> str:
+        key_hash = hashlib.sha256()
+        for part in (self.get_image_hash(image_path), image_prompt or '',
+                     self.settings_string):
+            key_hash.update(part.encode('utf-8'))
+            key_hash.update(b'\0')
+        return key_hash.hexdigest()
+
+    def get(self, key: str) -> tuple[str, str] | None:
+        """Get the caption and the console output caption for a key."""
+        self.lookup_count += 1
+        row = self.connection.execute(
+            'SELECT caption, console_output_caption FROM captions WHERE '
+            'key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        self.hit_count += 1
+        return row[0], row[1]
+
+    def set(self, key: str, caption: str, console_output_caption: str):
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO captions VALUES (?, ?, ?, ?)',
+                (key, caption, console_output_caption,
+                 datetime.now().isoformat(timespec='seconds')))
+
+    def get_hit_rate_message(self) -> str:
+        hit_rate = (self.hit_count / self.lookup_count
+                    if self.lookup_count else 0)
+        return (f'Caption cache: {self.hit_count} / {self.lookup_count} hits '
+                f'({hit_rate:.0%}).')
+
+    def close(self):
+        self.connection.close()
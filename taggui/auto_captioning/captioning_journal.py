@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from utils.utils import get_app_data_directory_path
+
+JOURNALS_DIRECTORY_NAME = 'captioning_journals'
+
+
+def get_settings_hash(caption_settings: dict) -> str:
+    settings_string = json.dumps(caption_settings, sort_keys=True, default=str)
+    return hashlib.sha256(settings_string.encode('utf-8')).hexdigest()
+
+
+def get_job_id(settings_hash: str, image_paths: list[Path]) -> str:
+    """
+    Get an identifier for a captioning job that is the same every time the
+    same images are captioned with the same settings.
+    """
+    job_hash = hashlib.sha256(settings_hash.encode('utf-8'))
+    for image_path in sorted(image_paths):
+        job_hash.update(str(image_path).encode('utf-8'))
+        job_hash.update(b'\0')
+    return job_hash.hexdigest()[:16]
+
+
+class CaptioningJournal:
+    """
+    An append-only record of the progress of a captioning job, stored as JSON
+    Lines so that a canceled or crashed job can be resumed.
+
+    A `generated` record is appended as soon as a caption is generated, and a
+    `written` record is appended once the caption has been added to the tags
+    of the image. Captions that were generated but not written can be
+    recovered without generating them again.
+    """
+
+    def __init__(self, caption_settings: dict, image_paths: list[Path]):
+        self.settings_hash = get_settings_hash(caption_settings)
+        self.job_id = get_job_id(self.settings_hash, image_paths)
+        self.image_count = len(image_paths)
+        self.path = (get_app_data_directory_path() / JOURNALS_DIRECTORY_NAME
+                     / f'{self.job_id}.jsonl')
+        # Maps image paths to captions.
+        self.written_captions: dict[str, str] = {}
+        self.pending_captions: dict[str, str] = {}
+        self.lock = threading.Lock()
+        self.file = None
+        self.read()
+
+    def read(self):
+        if not self.path.is_file():
+            return
+        with self.path.open(encoding='utf-8') as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line is incomplete if the application crashed
+                    # while it was being written.
+                    continue
+                event = record.get('event')
+                if event == 'generated':
+                    self.pending_captions[record['path']] = record['caption']
+                elif event == 'written':
+                    image_path = record['path']
+                    caption = self.pending_captions.pop(image_path, '')
+                    self.written_captions[image_path] = caption
+
+    @property
+    def has_progress(self) -> bool:
+        return bool(self.written_captions or self.pending_captions)
+
+    def discard(self):
+        """Delete the journal to start the job over."""
+        self.close()
+        self.path.unlink(missing_ok=True)
+        self.written_captions.clear()
+        self.pending_captions.clear()
+
+    def append_record(self, record: dict):
+        with self.lock:
+            if self.file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self.file = self.path.open('a', encoding='utf-8')
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            # Make sure the record survives a crash.
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def open(self):
+        event = 'resumed' if self.path.is_file() else 'started'
+        self.append_record({
+            'event': event,
+            'job_id': self.job_id,
+            'settings_hash': self.settings_hash,
+            'image_count': self.image_count,
+            'time': datetime.now().isoformat(timespec='seconds')
+        })
+
+    def record_generated_caption(self, image_path: Path, caption: str):
+        self.append_record({'event': 'generated', 'path': str(image_path),
+                            'caption': caption})
+        with self.lock:
+            self.pending_captions[str(image_path)] = caption
+
+    def record_written_caption(self, image_path: Path):
+        self.append_record({'event': 'written', 'path': str(image_path)})
+        with self.lock:
+            caption = self.pending_captions.pop(str(image_path), '')
+            self.written_captions[str(image_path)] = caption
+
+    def close(self, is_job_finished: bool = False):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+        # There is nothing left to resume once every image is captioned.
+        if is_job_finished:
+            self.path.unlink(missing_ok=True)
@@ -0,0 +1,198 @@
+import csv
+import json
+import math
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from time import perf_counter
+
+try:
+    import resource
+except ImportError:
+    # The `resource` module is not available on Windows.
+    resource = None
+
+STAGES = ('model loading', 'cache lookup', 'image loading', 'preprocessing',
+          'transfer', 'generation', 'postprocessing')
+PERCENTILES = (50, 90, 99)
+
+
+def get_percentile(sorted_values: list[float], percentile: int) -> float:
+    """Get a percentile of sorted values using the nearest-rank method."""
+    if not sorted_values:
+        return 0
+    rank = math.ceil(percentile / 100 * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
+
+
+def get_peak_memory_usage(device) -> int | None:
+    """Get the peak memory usage in bytes of the device or the process."""
+    torch = sys.modules.get('torch')
+    if (device is not None and device.type == 'cuda' and torch is not None
+            and torch.cuda.is_available()):
+        return torch.cuda.max_memory_allocated(device)
+    if resource is None:
+        return None
+    max_resident_set_size = resource.getrusage(
+        resource.RUSAGE_SELF).ru_maxrss
+    # The value is in bytes on macOS and in kilobytes on Linux.
+    if sys.platform == 'darwin':
+        return max_resident_set_size
+    return max_resident_set_size * 1024
+
+
+class CaptioningProfiler:
+    """
+    Record how long each stage of captioning takes for every image.
+
+    Stages can be nested, in which case the time spent in an inner stage is
+    not counted towards the outer stage.
+    """
+
+    def __init__(self):
+        self.model_id = None
+        self.device = None
+        self.model_loading_duration = 0
+        # One record for each image with the duration of each stage in
+        # seconds.
+        self.image_records: list[dict] = []
+        self.current_image_record: dict | None = None
+        # The durations of the inner stages of each stage that is being timed.
+        self.inner_stage_duration_stack: list[float] = []
+        self.start_time = None
+        self.end_time = None
+        self.peak_memory_usage = None
+
+    def start(self, model_id: str, device):
+        self.model_id = model_id
+        self.device = device
+        torch = sys.modules.get('torch')
+        if (device is not None and device.type == 'cuda'
+                and torch is not None and torch.cuda.is_available()):
+            torch.cuda.reset_peak_memory_stats(device)
+        self.start_time = perf_counter()
+
+    def finish(self):
+        self.end_time = perf_counter()
+        self.peak_memory_usage = get_peak_memory_usage(self.device)
+
+    @contextmanager
+    def time_stage(self, stage: str):
+        self.inner_stage_duration_stack.append(0)
+        start_time = perf_counter()
+        try:
+            yield
+        finally:
+            duration = perf_counter() - start_time
+            inner_stage_duration = self.inner_stage_duration_stack.pop()
+            if self.inner_stage_duration_stack:
+                self.inner_stage_duration_stack[-1] += duration
+            exclusive_duration = duration - inner_stage_duration
+            if stage == 'model loading':
+                self.model_loading_duration += exclusive_duration
+            elif self.current_image_record is not None:
+                stage_durations = self.current_image_record['stages']
+                stage_durations[stage] = (stage_durations.get(stage, 0)
+                                          + exclusive_duration)
+
+    def start_image(self, image_path: Path):
+        self.current_image_record = {'image': str(image_path), 'stages': {},
+                                     'token_count': 0, 'is_cached': False,
+                                     'start_time': perf_counter()}
+
+    def add_generated_tokens(self, token_count: int):
+        if self.current_image_record is not None:
+            self.current_image_record['token_count'] += token_count
+
+    def finish_image(self, is_cached: bool = False):
+        record = self.current_image_record
+        if record is None:
+            return
+        record['is_cached'] = is_cached
+        record['duration'] = perf_counter() - record.pop('start_time')
+        self.image_records.append(record)
+        self.current_image_record = None
+
+    def get_summary(self) -> dict:
+        end_time = self.end_time or perf_counter()
+        total_duration = (end_time - self.start_time
+                          if self.start_time is not None else 0)
+        captioning_duration = total_duration - self.model_loading_duration
+        image_count = len(self.image_records)
+        token_count = sum(record['token_count']
+                          for record in self.image_records)
+        generation_duration = sum(record['stages'].get('generation', 0)
+                                  for record in self.image_records)
+        stage_summaries = {}
+        for stage in STAGES[1:]:
+            durations = sorted(record['stages'][stage]
+                               for record in self.image_records
+                               if stage in record['stages'])
+            if not durations:
+                continue
+            stage_summary = {'count': len(durations),
+                             'total': sum(durations),
+                             'mean': sum(durations) / len(durations)}
+            for percentile in PERCENTILES:
+                stage_summary[f'p{percentile}'] = get_percentile(durations,
+                                                                 percentile)
+            stage_summaries[stage] = stage_summary
+        return {
+            'model_id': self.model_id,
+            'device': str(self.device),
+            'image_count': image_count,
+            'cached_image_count': sum(record['is_cached']
+                                      for record in self.image_records),
+            'total_duration': total_duration,
+            'model_loading_duration': self.model_loading_duration,
+            'images_per_second': (image_count / captioning_duration
+                                  if captioning_duration > 0 else 0),
+            'generated_token_count': token_count,
+            'tokens_per_second': (token_count / generation_duration
+                                  if generation_duration > 0 else 0),
+            'peak_memory_usage': self.peak_memory_usage,
+            'stages': stage_summaries
+        }
+
+    def format_summary(self) -> str:
+        summary = self.get_summary()
+        lines = [f'{summary["image_count"]} images '
+                 f'({summary["cached_image_count"]} cached), '
+                 f'{summary["images_per_second"]:.2f} images/s']
+        if summary['generated_token_count']:
+            lines.append(f'{summary["generated_token_count"]} tokens, '
+                         f'{summary["tokens_per_second"]:.1f} tokens/s')
+        if summary['model_loading_duration']:
+            lines.append(f'Model loading: '
+                         f'{summary["model_loading_duration"]:.2f} s')
+        if summary['peak_memory_usage'] is not None:
+            lines.append(f'Peak memory: '
+                         f'{summary["peak_memory_usage"] / 1024 ** 3:.2f} GB')
+        for stage, stage_summary in summary['stages'].items():
+            percentiles_string = ', '.join(
+                f'p{percentile} {stage_summary[f"p{percentile}"] * 1000:.0f}'
+                for percentile in PERCENTILES)
+            lines.append(f'{stage.capitalize()}: mean '
+                         f'{stage_summary["mean"] * 1000:.0f}, '
+                         f'{percentiles_string} ms')
+        return '\n'.join(lines)
+
+    def export_json(self, path: Path):
+        profile = {'summary': self.get_summary(),
+                   'images': self.image_records}
+        path.write_text(json.dumps(profile, indent=2), encoding='utf-8')
+
+    def export_csv(self, path: Path):
+        """Export one row for each image with the duration of each stage."""
+        with path.open('w', newline='', encoding='utf-8') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['model_id', 'device', 'image', 'is_cached',
+                             'duration', 'token_count', *STAGES[1:]])
+            for record in self.image_records:
+                writer.writerow([
+                    self.model_id, str(self.device), record['image'],
+                    record['is_cached'], f'{record["duration"]:.6f}',
+                    record['token_count'],
+                    *(f'{record["stages"].get(stage, 0):.6f}'
+                      for stage in STAGES[1:])
+                ])
@@ -1,17 +1,24 @@
+import threading
 from datetime import datetime
 from pathlib import Path
 from time import perf_counter
+from typing import TYPE_CHECKING
 
 from PIL import UnidentifiedImageError
 from PySide6.QtCore import QModelIndex, QThread, Qt, Signal
 
-from auto_captioning.auto_captioning_model import AutoCaptioningModel
+from auto_captioning.caption_cache import CaptionCache, is_caption_cacheable
+from auto_captioning.captioning_profiler import CaptioningProfiler
+from auto_captioning.captioning_journal import CaptioningJournal
 from auto_captioning.models_list import get_model_class
 from models.image_list_model import ImageListModel
 from utils.enums import CaptionPosition
 from utils.image import Image
 from utils.settings import get_tag_separator
 
+if TYPE_CHECKING:
+    from auto_captioning.auto_captioning_model import AutoCaptioningModel
+
 
 def add_caption_to_tags(tags: list[str], caption: str,
                         caption_position: CaptionPosition) -> list[str]:
@@ -36,6 +43,14 @@ def add_caption_to_tags(tags: list[str], caption: str,
     return tags
 
 
+def is_caption_in_tags(tags: list[str], caption: str) -> bool:
+    """Check whether the tags of a caption appear consecutively in tags."""
+    caption_tags = caption.split(get_tag_separator())
+    caption_tag_count = len(caption_tags)
+    return any(tags[index:index + caption_tag_count] == caption_tags
+               for index in range(len(tags) - caption_tag_count + 1))
+
+
 def format_duration(seconds: float) -> str:
     seconds_per_minute = 60
     seconds_per_hour = 60 * seconds_per_minute
@@ -64,20 +79,36 @@ class CaptioningThread(QThread):
     def __init__(self, parent, image_list_model: ImageListModel,
                  selected_image_indices: list[QModelIndex],
                  caption_settings: dict, tag_separator: str,
-                 models_directory_path: Path | None):
+                 models_directory_path: Path | None,
+                 journal: CaptioningJournal | None = None):
         super().__init__(parent)
         self.image_list_model = image_list_model
         self.selected_image_indices = selected_image_indices
         self.caption_settings = caption_settings
         self.tag_separator = tag_separator
         self.models_directory_path = models_directory_path
+        self.journal = journal
         self.is_error = False
         self.is_canceled = False
+        self.is_model_loaded = False
+        # The usage lock of the model, held while captioning.
+        self.model_usage_lock: threading.Lock | None = None
+        self.profiler = CaptioningProfiler()
+
+    def load_model(self, model: 'AutoCaptioningModel'):
+        with self.profiler.time_stage('model loading'):
+            model.load_processor_and_model()
+            # Wait until a warm-up of the preloaded model finishes. The lock
+            # is held until captioning finishes.
+            model.usage_lock.acquire()
+            self.model_usage_lock = model.usage_lock
+            model.monkey_patch_after_loading()
+        self.is_model_loaded = True
 
     def run_captioning(self):
         model_id = self.caption_settings['model_id']
         model_class = get_model_class(model_id)
-        model: AutoCaptioningModel = model_class(
+        model: 'AutoCaptioningModel' = model_class(
             captioning_thread_=self, caption_settings=self.caption_settings)
         error_message = model.get_error_message()
         if error_message:
@@ -85,8 +116,29 @@ class CaptioningThread(QThread):
             self.clear_console_text_edit_requested.emit()
             print(error_message)
             return
-        model.load_processor_and_model()
-        model.monkey_patch_after_loading()
+        self.profiler.start(model_id, model.device)
+        caption_cache = None
+        if (self.caption_settings['use_caption_cache']
+                and is_caption_cacheable(self.caption_settings)):
+            caption_cache = CaptionCache(self.caption_settings,
+                                         self.tag_separator)
+        try:
+            if caption_cache is None:
+                # Without the cache, every image needs the model. Otherwise,
+                # the model is only loaded once a caption is not found in the
+                # cache.
+                self.load_model(model)
+            self.caption_images(model, caption_cache)
+        finally:
+            if self.model_usage_lock is not None:
+                self.model_usage_lock.release()
+                self.model_usage_lock = None
+            self.profiler.finish()
+            if caption_cache:
+                caption_cache.close()
+
+    def caption_images(self, model: 'AutoCaptioningModel',
+                       caption_cache: CaptionCache | None):
         if self.is_canceled:
             print('Canceled captioning.')
             return
@@ -97,6 +149,12 @@ class CaptioningThread(QThread):
         captioning_message = model.get_captioning_message(
             are_multiple_images_selected, captioning_start_datetime)
         print(captioning_message)
+        if self.journal and self.journal.has_progress:
+            completed_image_count = (len(self.journal.written_captions)
+                                     + len(self.journal.pending_captions))
+            print(f'Resuming job {self.journal.job_id} '
+                  f'({completed_image_count} / {self.journal.image_count} '
+                  f'images already captioned).')
         caption_position = self.caption_settings['caption_position']
         for i, image_index in enumerate(self.selected_image_indices):
             start_time = perf_counter()
@@ -105,15 +163,47 @@ class CaptioningThread(QThread):
                 return
             image: Image = self.image_list_model.data(image_index,
                                                       Qt.ItemDataRole.UserRole)
-            image_prompt = model.get_image_prompt(image)
-            try:
-                model_inputs = model.get_model_inputs(image_prompt, image)
-            except UnidentifiedImageError:
-                print(f'Skipping {image.path.name} because its file format is '
-                      'not supported or it is a corrupted image.')
+            if self.journal and self.resume_from_journal(
+                    image_index, image, caption_position):
+                if are_multiple_images_selected:
+                    self.progress_bar_update_requested.emit(i + 1)
                 continue
-            caption, console_output_caption = model.generate_caption(
-                model_inputs, image_prompt)
+            self.profiler.start_image(image.path)
+            image_prompt = model.get_image_prompt(image)
+            cache_key = None
+            cached_caption = None
+            if caption_cache:
+                with self.profiler.time_stage('cache lookup'):
+                    cache_key = caption_cache.get_key(image.path,
+                                                      image_prompt)
+                    cached_caption = caption_cache.get(cache_key)
+            if cached_caption:
+                caption, console_output_caption = cached_caption
+            else:
+                if not self.is_model_loaded:
+                    self.load_model(model)
+                    if self.is_canceled:
+                        print('Canceled captioning.')
+                        return
+                    print(captioning_message)
+                try:
+                    with self.profiler.time_stage('preprocessing'):
+                        model_inputs = model.get_model_inputs(image_prompt,
+                                                              image)
+                except UnidentifiedImageError:
+                    print(f'Skipping {image.path.name} because its file '
+                          f'format is not supported or it is a corrupted '
+                          f'image.')
+                    continue
+                with self.profiler.time_stage('generation'):
+                    caption, console_output_caption = model.generate_caption(
+                        model_inputs, image_prompt)
+                if caption_cache:
+                    caption_cache.set(cache_key, caption,
+                                      console_output_caption)
+            self.profiler.finish_image(is_cached=bool(cached_caption))
+            if self.journal:
+                self.journal.record_generated_caption(image.path, caption)
             tags = add_caption_to_tags(image.tags, caption, caption_position)
             self.caption_generated.emit(image_index, caption, tags)
             if are_multiple_images_selected:
@@ -122,7 +212,9 @@ class CaptioningThread(QThread):
                 self.clear_console_text_edit_requested.emit()
             if console_output_caption is None:
                 console_output_caption = caption
-            print(f'{image.path.name} ({perf_counter() - start_time:.1f} s):\n'
+            duration_string = ('cached' if cached_caption
+                               else f'{perf_counter() - start_time:.1f} s')
+            print(f'{image.path.name} ({duration_string}):\n'
                   f'{console_output_caption}')
         if are_multiple_images_selected:
             captioning_end_datetime = datetime.now()
@@ -135,6 +227,32 @@ class CaptioningThread(QThread):
                   f'{format_duration(total_captioning_duration)} '
                   f'({average_captioning_duration:.1f} s/image) at '
                   f'{captioning_end_datetime.strftime("%Y-%m-%d %H:%M:%S")}.')
+        if caption_cache:
+            print(caption_cache.get_hit_rate_message())
+
+    def resume_from_journal(self, image_index: QModelIndex, image: Image,
+                            caption_position: CaptionPosition) -> bool:
+        """
+        Skip an image that was already captioned in a previous run of the job,
+        and recover its caption if it was generated but not added to the tags.
+        Return whether the image was handled.
+        """
+        image_path = str(image.path)
+        if image_path in self.journal.written_captions:
+            return True
+        caption = self.journal.pending_captions.get(image_path)
+        if caption is None:
+            return False
+        # The caption may have been added to the tags right before the crash.
+        if (caption_position in (CaptionPosition.BEFORE_FIRST_TAG,
+                                 CaptionPosition.AFTER_LAST_TAG)
+                and is_caption_in_tags(image.tags, caption)):
+            tags = image.tags
+        else:
+            tags = add_caption_to_tags(image.tags, caption, caption_position)
+        self.caption_generated.emit(image_index, caption, tags)
+        print(f'{image.path.name} (recovered from journal):\n{caption}')
+        return True
 
     def run(self):
         try:
@@ -0,0 +1,88 @@
+import copy
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import TYPE_CHECKING
+
+from PIL import Image as PilImage
+from PySide6.QtCore import QThread, Signal
+
+from auto_captioning.captioning_profiler import CaptioningProfiler
+from auto_captioning.models_list import get_model_class
+from utils.image import Image
+
+if TYPE_CHECKING:
+    from auto_captioning.auto_captioning_model import AutoCaptioningModel
+
+WARMUP_IMAGE_SIZE = 64
+
+
+class ModelLoadingThread(QThread):
+    """
+    Load an auto-captioning model into the model registry of the parent
+    `AutoCaptioner` in the background, so that captioning can start without
+    waiting for the model to load.
+    """
+    # Used by `AutoCaptioningModel` while loading.
+    clear_console_text_edit_requested = Signal()
+    model_loaded = Signal()
+    # The error message.
+    model_loading_failed = Signal(str)
+
+    def __init__(self, parent, caption_settings: dict, tag_separator: str,
+                 models_directory_path: Path | None, should_warm_up: bool):
+        super().__init__(parent)
+        # Make a copy so that the generation parameters can be changed for the
+        # warmup without affecting the caller.
+        self.caption_settings = copy.deepcopy(caption_settings)
+        self.tag_separator = tag_separator
+        self.models_directory_path = models_directory_path
+        self.should_warm_up = should_warm_up
+        self.is_canceled = False
+        # Used by `AutoCaptioningModel` while warming up.
+        self.profiler = CaptioningProfiler()
+
+    def warm_up(self, model: 'AutoCaptioningModel'):
+        """
+        Generate a single token for a blank image so that the first caption
+        does not include one-time setup costs such as compiling kernels.
+        """
+        generation_parameters = model.generation_parameters
+        generation_parameters['min_new_tokens'] = 1
+        generation_parameters['max_new_tokens'] = 1
+        with TemporaryDirectory() as temporary_directory_path:
+            image_path = Path(temporary_directory_path) / 'warmup.png'
+            PilImage.new('RGB', (WARMUP_IMAGE_SIZE, WARMUP_IMAGE_SIZE),
+                         'white').save(image_path)
+            image = Image(image_path, (WARMUP_IMAGE_SIZE, WARMUP_IMAGE_SIZE))
+            image_prompt = model.get_image_prompt(image)
+            model_inputs = model.get_model_inputs(image_prompt, image)
+            model.generate_caption(model_inputs, image_prompt)
+
+    def run(self):
+        try:
+            model_id = self.caption_settings['model_id']
+            model_class = get_model_class(model_id)
+            model: 'AutoCaptioningModel' = model_class(
+                captioning_thread_=self,
+                caption_settings=self.caption_settings)
+            error_message = model.get_error_message()
+            if error_message:
+                self.model_loading_failed.emit(error_message)
+                return
+            is_loaded = model.load_processor_and_model(
+                should_cancel=lambda: self.is_canceled)
+            if not is_loaded or self.is_canceled:
+                return
+            if self.should_warm_up:
+                # Captioning waits for the warm-up to finish before using the
+                # model.
+                with model.usage_lock:
+                    if self.is_canceled:
+                        return
+                    model.monkey_patch_after_loading()
+                    self.warm_up(model)
+            # Captioning may have started during the warm-up.
+            if not self.is_canceled:
+                self.model_loaded.emit()
+        except Exception as exception:
+            self.model_loading_failed.emit(str(exception))
@@ -0,0 +1,157 @@
+import gc
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from utils.settings import DEFAULT_SETTINGS, get_settings
+
+BYTES_PER_GIGABYTE = 1024 ** 3
+
+# The model ID, the device, and whether the model is loaded in 4-bit.
+ModelKey = tuple[str, str, bool]
+
+
+@dataclass
+class ResidentModel:
+    processor: Any
+    model: Any
+    memory_footprint: int
+    # Held while the model is patched and generates captions, so that a
+    # preload warm-up and captioning do not use the model at the same time.
+    usage_lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+def get_memory_footprint(model) -> int:
+    """Get the number of bytes of memory used by a loaded model."""
+    # Transformers models and `WdTaggerModel` both have this method.
+    if hasattr(model, 'get_memory_footprint'):
+        try:
+            return int(model.get_memory_footprint())
+        except (AttributeError, TypeError, OSError):
+            pass
+    return 0
+
+
+def format_memory_footprint(memory_footprint: int) -> str:
+    return f'{memory_footprint / BYTES_PER_GIGABYTE:.2f} GB'
+
+
+class ModelRegistry:
+    """
+    Keep several auto-captioning models loaded at once, evicting the least
+    recently used models when their total memory footprint exceeds the memory
+    budget set in the settings.
+    """
+
+    def __init__(self):
+        self.resident_models: OrderedDict[ModelKey, ResidentModel] = (
+            OrderedDict())
+        # The memory footprints of models that were loaded before, used to
+        # make room for a model before loading it again.
+        self.known_memory_footprints: dict[ModelKey, int] = {}
+        self.lock = threading.RLock()
+        # Only load one model at a time to avoid running out of memory.
+        self.loading_lock = threading.Lock()
+
+    @staticmethod
+    def get_memory_budget() -> int:
+        settings = get_settings()
+        memory_budget_gigabytes = settings.value(
+            'captioning_model_memory_budget',
+            defaultValue=DEFAULT_SETTINGS['captioning_model_memory_budget'],
+            type=int)
+        return memory_budget_gigabytes * BYTES_PER_GIGABYTE
+
+    def get_total_memory_footprint(self) -> int:
+        with self.lock:
+            return sum(resident_model.memory_footprint
+                       for resident_model in self.resident_models.values())
+
+    def get(self, key: ModelKey) -> ResidentModel | None:
+        with self.lock:
+            resident_model = self.resident_models.get(key)
+            if resident_model is not None:
+                self.resident_models.move_to_end(key)
+            return resident_model
+
+    def evict(self, key: ModelKey):
+        with self.lock:
+            resident_model = self.resident_models.pop(key, None)
+        if resident_model is None:
+            return
+        print(f'Unloading {key[0]} to free up memory...')
+        del resident_model
+        gc.collect()
+        # Only free the GPU memory if PyTorch was already imported by a model.
+        torch = sys.modules.get('torch')
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def evict_until_within_budget(self, memory_budget: int,
+                                  key_to_keep: ModelKey | None = None):
+        """Evict the least recently used models until the budget is met."""
+        while self.get_total_memory_footprint() > memory_budget:
+            with self.lock:
+                evictable_keys = [key for key in self.resident_models
+                                  if key != key_to_keep]
+            if not evictable_keys:
+                return
+            self.evict(evictable_keys[0])
+
+    def get_or_load(self, key: ModelKey,
+                    load_function: Callable[[], tuple[Any, Any]],
+                    should_cancel: Callable[[], bool] | None = None
+                    ) -> ResidentModel | None:
+        """
+        Get a loaded model, loading it with `load_function` if it is not
+        loaded yet. `load_function` must return the processor and the model.
+        Return `None` if loading was canceled before it started.
+        """
+        resident_model = self.get(key)
+        if resident_model is not None:
+            return resident_model
+        with self.loading_lock:
+            # The model may have been loaded by another thread in the
+            # meantime.
+            resident_model = self.get(key)
+            if resident_model is not None:
+                return resident_model
+            if should_cancel and should_cancel():
+                return None
+            memory_budget = self.get_memory_budget()
+            if memory_budget == 0:
+                # A budget of 0 keeps only the most recently used model
+                # loaded.
+                with self.lock:
+                    resident_keys = list(self.resident_models)
+                for resident_key in resident_keys:
+                    self.evict(resident_key)
+            else:
+                self.evict_until_within_budget(
+                    memory_budget - self.known_memory_footprints.get(key, 0))
+            processor, model = load_function()
+            resident_model = ResidentModel(processor, model,
+                                           get_memory_footprint(model))
+            with self.lock:
+                self.resident_models[key] = resident_model
+                self.known_memory_footprints[key] = (
+                    resident_model.memory_footprint)
+            self.evict_until_within_budget(memory_budget, key_to_keep=key)
+            return resident_model
+
+    def get_loaded_models_summary(self) -> list[str]:
+        """Get a line describing each loaded model and its memory use."""
+        with self.lock:
+            items = list(self.resident_models.items())
+        lines = []
+        for (model_id, device, is_loaded_in_4_bit), resident_model in items:
+            device_description = device
+            if is_loaded_in_4_bit:
+                device_description += ', 4-bit'
+            memory_footprint = format_memory_footprint(
+                resident_model.memory_footprint)
+            lines.append(f'{model_id} ({device_description}): '
+                         f'{memory_footprint}')
+        return lines
@@ -37,6 +37,7 @@ class WdTaggerModel:
         if not tags_path.is_file():
             tags_path = huggingface_hub.hf_hub_download(
                 model_id, filename='selected_tags.csv')
+        self.model_path = Path(model_path)
         self.inference_session = InferenceSession(model_path)
         self.tags = []
         self.rating_tags_indices = []
@@ -57,6 +58,10 @@ class WdTaggerModel:
                 elif category == '4':
                     self.character_tags_indices.append(index)
 
+    def get_memory_footprint(self) -> int:
+        # The ONNX model uses about as much memory as the size of its file.
+        return self.model_path.stat().st_size
+
     def generate_tags(self, image_array: np.ndarray,
                       wd_tagger_settings: dict) -> tuple[tuple, tuple]:
         input_name = self.inference_session.get_inputs()[0].name
@@ -1,16 +1,32 @@
-from auto_captioning.auto_captioning_model import AutoCaptioningModel
-from auto_captioning.models.cog import Cogagent, Cogvlm
-from auto_captioning.models.cogvlm2 import Cogvlm2
-from auto_captioning.models.florence_2 import Florence2, Florence2Promptgen
-from auto_captioning.models.kosmos_2 import Kosmos2
-from auto_captioning.models.llava_1_point_5 import Llava1Point5
-from auto_captioning.models.llava_llama_3 import LlavaLlama3
-from auto_captioning.models.llava_next import (LlavaNext34b, LlavaNextMistral,
-                                               LlavaNextVicuna)
-from auto_captioning.models.moondream import Moondream1, Moondream2
-from auto_captioning.models.phi_3_vision import Phi3Vision
-from auto_captioning.models.wd_tagger import WdTagger
-from auto_captioning.models.xcomposer2 import Xcomposer2, Xcomposer2_4khd
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from auto_captioning.auto_captioning_model import AutoCaptioningModel
+
+# The modules of the model classes. They are only imported when a model is
+# used because they import `torch` and `transformers`, which are slow to
+# import.
+MODEL_CLASS_MODULES = {
+    'AutoCaptioningModel': 'auto_captioning.auto_captioning_model',
+    'Cogagent': 'auto_captioning.models.cog',
+    'Cogvlm': 'auto_captioning.models.cog',
+    'Cogvlm2': 'auto_captioning.models.cogvlm2',
+    'Florence2': 'auto_captioning.models.florence_2',
+    'Florence2Promptgen': 'auto_captioning.models.florence_2',
+    'Kosmos2': 'auto_captioning.models.kosmos_2',
+    'Llava1Point5': 'auto_captioning.models.llava_1_point_5',
+    'LlavaLlama3': 'auto_captioning.models.llava_llama_3',
+    'LlavaNext34b': 'auto_captioning.models.llava_next',
+    'LlavaNextMistral': 'auto_captioning.models.llava_next',
+    'LlavaNextVicuna': 'auto_captioning.models.llava_next',
+    'Moondream1': 'auto_captioning.models.moondream',
+    'Moondream2': 'auto_captioning.models.moondream',
+    'Phi3Vision': 'auto_captioning.models.phi_3_vision',
+    'WdTagger': 'auto_captioning.models.wd_tagger',
+    'Xcomposer2': 'auto_captioning.models.xcomposer2',
+    'Xcomposer2_4khd': 'auto_captioning.models.xcomposer2'
+}
 
 MODELS = [
     'internlm/internlm-xcomposer2-vl-7b-4bit',
@@ -59,40 +75,46 @@ MODELS = [
 ]
 
 
-def get_model_class(model_id: str) -> type[AutoCaptioningModel]:
+def get_model_class_name(model_id: str) -> str:
     lowercase_model_id = model_id.lower()
     if 'cogagent' in lowercase_model_id:
-        return Cogagent
+        return 'Cogagent'
     if 'cogvlm2' in lowercase_model_id:
-        return Cogvlm2
+        return 'Cogvlm2'
     if 'cogvlm' in lowercase_model_id:
-        return Cogvlm
+        return 'Cogvlm'
     if 'florence' in lowercase_model_id:
         if 'promptgen' in lowercase_model_id:
-            return Florence2Promptgen
-        return Florence2
+            return 'Florence2Promptgen'
+        return 'Florence2'
     if 'kosmos' in lowercase_model_id:
-        return Kosmos2
+        return 'Kosmos2'
     if 'llava-v1.6-34b' in lowercase_model_id:
-        return LlavaNext34b
+        return 'LlavaNext34b'
     if 'llava-v1.6-mistral' in lowercase_model_id:
-        return LlavaNextMistral
+        return 'LlavaNextMistral'
     if 'llava-v1.6-vicuna' in lowercase_model_id:
-        return LlavaNextVicuna
+        return 'LlavaNextVicuna'
     if 'llava-llama-3' in lowercase_model_id:
-        return LlavaLlama3
+        return 'LlavaLlama3'
     if 'llava' in lowercase_model_id:
-        return Llava1Point5
+        return 'Llava1Point5'
     if 'moondream1' in lowercase_model_id:
-        return Moondream1
+        return 'Moondream1'
     if 'moondream2' in lowercase_model_id:
-        return Moondream2
+        return 'Moondream2'
     if 'phi-3' in lowercase_model_id:
-        return Phi3Vision
+        return 'Phi3Vision'
     if 'wd' in lowercase_model_id and 'tagger' in lowercase_model_id:
-        return WdTagger
+        return 'WdTagger'
     if 'xcomposer2' in lowercase_model_id:
         if '4khd' in lowercase_model_id:
-            return Xcomposer2_4khd
-        return Xcomposer2
-    return AutoCaptioningModel
+            return 'Xcomposer2_4khd'
+        return 'Xcomposer2'
+    return 'AutoCaptioningModel'
+
+
+def get_model_class(model_id: str) -> type['AutoCaptioningModel']:
+    model_class_name = get_model_class_name(model_id)
+    module = importlib.import_module(MODEL_CLASS_MODULES[model_class_name])
+    return getattr(module, model_class_name)
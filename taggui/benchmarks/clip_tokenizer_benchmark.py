@@ -0,0 +1,141 @@
+"""
+Verify CLIP token counts from `utils.clip_tokenizer` against the
+`transformers` tokenizer and benchmark their speed and import time.
+
+Run from the `taggui` directory:
+    python -m benchmarks.clip_tokenizer_benchmark --directory path/to/images
+"""
+import argparse
+import random
+import subprocess
+import sys
+from pathlib import Path
+from time import perf_counter
+
+TAGS = [
+    '1girl', 'solo', 'long hair', 'looking at viewer', 'smile', 'blue eyes',
+    'simple background', 'white background', 'holding a sword', 'outdoors',
+    'sky', 'cloud', 'red dress', 'from side', 'upper body', ':d', '^_^',
+    'café', 'naïve art', 'über-detailed', '東京', 'highres', 'absurdres',
+    '(masterpiece:1.2)', 'best quality', 'no humans', 'scenery', 'sunset',
+    'photo of a dog running on the beach', 'a man riding a horse',
+    'portrait, 85mm lens, f/1.8', 'score_9, score_8_up', 'emoji 😀',
+    'multiple   spaces', 'tab\tseparated', "it's raining", 'U.S.A.'
+]
+TAG_SEPARATOR = ', '
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--directory', type=Path, default=None,
+                        help='Directory with `.txt` caption files to use as '
+                             'the corpus. Defaults to random captions.')
+    parser.add_argument('--caption-count', type=int, default=5000,
+                        help='Number of random captions to generate.')
+    return parser.parse_args()
+
+
+def get_captions(arguments: argparse.Namespace) -> list[str]:
+    if arguments.directory is not None:
+        return [path.read_text(encoding='utf-8', errors='replace')
+                for path in arguments.directory.rglob('*.txt')]
+    random_generator = random.Random(0)
+    captions = [TAG_SEPARATOR.join(
+        random_generator.sample(TAGS, random_generator.randint(0, 30)))
+        for _ in range(arguments.caption_count)]
+    # Include a caption longer than the CLIP context length.
+    captions.append(TAG_SEPARATOR.join(TAGS * 4))
+    return captions
+
+
+def measure_import_time(statement: str) -> float:
+    """Measure the time to run a statement in a new interpreter."""
+    code = (f'from time import perf_counter\n'
+            f'start_time = perf_counter()\n'
+            f'{statement}\n'
+            f'print(perf_counter() - start_time)')
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True,
+                            text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def time_function(function, *args) -> tuple[object, float]:
+    start_time = perf_counter()
+    result = function(*args)
+    return result, perf_counter() - start_time
+
+
+def main():
+    arguments = parse_arguments()
+    captions = get_captions(arguments)
+    print(f'{len(captions)} captions')
+
+    print('\nTime to import and load the tokenizer:')
+    clip_tokenizer_import_time = measure_import_time(
+        'from utils.clip_tokenizer import get_clip_tokenizer\n'
+        'get_clip_tokenizer()')
+    transformers_import_time = measure_import_time(
+        'from transformers import AutoTokenizer\n'
+        'from utils.clip_tokenizer import TOKENIZER_DIRECTORY_PATH\n'
+        'from utils.utils import get_resource_path\n'
+        'AutoTokenizer.from_pretrained('
+        'get_resource_path(TOKENIZER_DIRECTORY_PATH))')
+    print(f'utils.clip_tokenizer: {clip_tokenizer_import_time:.2f} s')
+    print(f'transformers: {transformers_import_time:.2f} s')
+
+    from transformers import AutoTokenizer
+
+    from utils import clip_tokenizer
+    from utils.utils import get_resource_path
+
+    transformers_tokenizer = AutoTokenizer.from_pretrained(
+        get_resource_path(clip_tokenizer.TOKENIZER_DIRECTORY_PATH))
+    clip_tokenizer.get_clip_tokenizer()
+
+    def count_tokens_with_transformers(texts: list[str]) -> list[int]:
+        return [len(transformers_tokenizer(text).input_ids) - 2
+                for text in texts]
+
+    def count_tokens_one_by_one(texts: list[str]) -> list[int]:
+        return [clip_tokenizer.count_clip_tokens(text) for text in texts]
+
+    expected_token_counts, transformers_duration = time_function(
+        count_tokens_with_transformers, captions)
+    clip_tokenizer._token_count_cache.clear()
+    token_counts, one_by_one_duration = time_function(
+        count_tokens_one_by_one, captions)
+    clip_tokenizer._token_count_cache.clear()
+    batch_token_counts, batch_duration = time_function(
+        clip_tokenizer.count_clip_tokens_batch, captions)
+    # The most recently counted captions are cached.
+    cached_captions = captions[-clip_tokenizer.TOKEN_COUNT_CACHE_SIZE:]
+    _, cached_duration = time_function(count_tokens_one_by_one,
+                                       cached_captions)
+
+    print('\nTime to count tokens:')
+    for name, duration, count in (
+            ('transformers', transformers_duration, len(captions)),
+            ('count_clip_tokens', one_by_one_duration, len(captions)),
+            ('count_clip_tokens_batch', batch_duration, len(captions)),
+            ('count_clip_tokens (cached)', cached_duration,
+             len(cached_captions))):
+        print(f'{name}: {duration:.3f} s ({count / duration:.0f} captions/s)')
+
+    mismatch_count = 0
+    for caption, expected_count, count, batch_count in zip(
+            captions, expected_token_counts, token_counts,
+            batch_token_counts):
+        if not expected_count == count == batch_count:
+            mismatch_count += 1
+            if mismatch_count <= 10:
+                print(f'Mismatch for {caption!r}: expected {expected_count}, '
+                      f'got {count} and {batch_count} in batch')
+    if mismatch_count:
+        print(f'\n{mismatch_count} of {len(captions)} token counts differ '
+              f'from transformers.')
+        sys.exit(1)
+    print(f'\nAll {len(captions)} token counts match transformers.')
+
+
+if __name__ == '__main__':
+    main()
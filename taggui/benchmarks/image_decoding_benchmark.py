@@ -0,0 +1,81 @@
+"""
+Benchmark decoding an image for the image viewer at full resolution and at
+the display size.
+
+Run from the `taggui` directory:
+    python -m benchmarks.image_decoding_benchmark --width 7728 --height 5152
+"""
+import argparse
+import statistics
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+from PySide6.QtCore import QSize, Qt
+from PySide6.QtGui import QImage, QImageReader
+
+from benchmarks.image_viewer_resize_benchmark import create_test_image
+from utils.image_prefetcher import read_display_image
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--width', type=int, default=7728,
+                        help='Width of the test image.')
+    parser.add_argument('--height', type=int, default=5152,
+                        help='Height of the test image.')
+    parser.add_argument('--display-width', type=int, default=1920)
+    parser.add_argument('--display-height', type=int, default=1080)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--image-path', default=None,
+                        help='Use an existing image instead of generated '
+                             'JPEG and PNG images.')
+    return parser.parse_args()
+
+
+def read_and_scale_image(image_path: Path, max_size: QSize) -> QImage:
+    """Decode the full image and then scale it down."""
+    image_reader = QImageReader(str(image_path))
+    image_reader.setAutoTransform(True)
+    return image_reader.read().scaled(
+        max_size, Qt.AspectRatioMode.KeepAspectRatio,
+        Qt.TransformationMode.SmoothTransformation)
+
+
+def time_function(function, runs: int) -> float:
+    durations = []
+    for _ in range(runs):
+        start_time = perf_counter()
+        function()
+        durations.append(perf_counter() - start_time)
+    return statistics.median(durations)
+
+
+def main():
+    arguments = parse_arguments()
+    QImageReader.setAllocationLimit(0)
+    max_size = QSize(arguments.display_width, arguments.display_height)
+    with tempfile.TemporaryDirectory() as directory_path:
+        if arguments.image_path:
+            image_paths = [Path(arguments.image_path)]
+        else:
+            image_paths = [Path(directory_path) / f'benchmark.{suffix}'
+                           for suffix in ('jpg', 'png')]
+            for image_path in image_paths:
+                create_test_image(arguments.width, arguments.height,
+                                  image_path)
+        for image_path in image_paths:
+            full_duration = time_function(
+                lambda: read_and_scale_image(image_path, max_size),
+                arguments.runs)
+            scaled_duration = time_function(
+                lambda: read_display_image(image_path, max_size),
+                arguments.runs)
+            print(f'{image_path.name}: full decode and scale '
+                  f'{full_duration * 1000:.0f} ms, scaled decode '
+                  f'{scaled_duration * 1000:.0f} ms '
+                  f'({full_duration / scaled_duration:.1f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
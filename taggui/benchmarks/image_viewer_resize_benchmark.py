@@ -0,0 +1,107 @@
+"""
+Benchmark the cost of rescaling the image in the image viewer while the
+viewer is being resized.
+
+Run from the `taggui` directory:
+    python -m benchmarks.image_viewer_resize_benchmark --width 7680 --height 4320
+"""
+import argparse
+import os
+import statistics
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+from PySide6.QtCore import QSize, Qt
+from PySide6.QtGui import QColor, QImage, QImageReader, QPainter
+from PySide6.QtWidgets import QApplication
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--width', type=int, default=7680,
+                        help='Width of the test image.')
+    parser.add_argument('--height', type=int, default=4320,
+                        help='Height of the test image.')
+    parser.add_argument('--resize-count', type=int, default=30,
+                        help='Number of resize events to simulate.')
+    parser.add_argument('--image-path', default=None,
+                        help='Use an existing image instead of a generated '
+                             'one.')
+    return parser.parse_args()
+
+
+def create_test_image(width: int, height: int, image_path: Path):
+    """Save a PNG with gradients, which does not compress too well."""
+    image = QImage(width, height, QImage.Format.Format_RGB32)
+    painter = QPainter(image)
+    for x in range(0, width, 16):
+        painter.fillRect(x, 0, 16, height,
+                         QColor.fromHsv(x * 359 // width, 200, 255))
+    for y in range(0, height, 32):
+        painter.fillRect(0, y, width, 4, QColor(y % 256, 0, 0))
+    painter.end()
+    image.save(str(image_path))
+
+
+def get_resize_sizes(resize_count: int) -> list[QSize]:
+    """Get the label sizes of a dock splitter being dragged back and forth."""
+    return [QSize(600 + (index % 10) * 40, 700) for index in range(resize_count)]
+
+
+def time_resizes(label, sizes: list[QSize], rescale) -> list[float]:
+    durations = []
+    for size in sizes:
+        label.resize(size)
+        start_time = perf_counter()
+        rescale()
+        durations.append(perf_counter() - start_time)
+    return durations
+
+
+def print_durations(name: str, durations: list[float]):
+    print(f'{name:<36} median {statistics.median(durations) * 1000:8.1f} ms, '
+          f'max {max(durations) * 1000:8.1f} ms, '
+          f'total {sum(durations):6.2f} s')
+
+
+def main():
+    arguments = parse_arguments()
+    app = QApplication([])
+    QImageReader.setAllocationLimit(0)
+    from widgets.image_viewer import ImageLabel
+
+    with tempfile.TemporaryDirectory() as directory_path:
+        if arguments.image_path:
+            image_path = Path(arguments.image_path)
+        else:
+            image_path = Path(directory_path) / 'benchmark.png'
+            create_test_image(arguments.width, arguments.height, image_path)
+        label = ImageLabel()
+        label.load_image(image_path)
+        image_size = label.image.size()
+        print(f'Image: {image_size.width()}x{image_size.height()}, '
+              f'{arguments.resize_count} resizes\n')
+        sizes = get_resize_sizes(arguments.resize_count)
+        # What every resize event did before the decoded image was kept.
+        print_durations('Decode and smooth scale', time_resizes(
+            label, sizes, lambda: label.load_image(image_path)))
+        print_durations('Smooth scale', time_resizes(
+            label, sizes, lambda: label.update_pixmap(
+                Qt.TransformationMode.SmoothTransformation)))
+        # The first fast rescale also creates the mipmap levels.
+        label.set_image(image_path, label.decoded_image)
+        print_durations('Fast scale of mipmap level', time_resizes(
+            label, sizes, lambda: label.update_pixmap(
+                Qt.TransformationMode.FastTransformation)))
+        # Done once after resizing stops.
+        print_durations('Final smooth scale', time_resizes(
+            label, sizes[-1:], label.update_pixmap))
+    del app
+    # Exit without destroying the Qt objects, which can crash when the
+    # application is destroyed before the widgets.
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark the time from launching the GUI to the first paint of the window
+and the import time of each module.
+
+Run from the `taggui` directory:
+    python -m benchmarks.startup_benchmark
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+CHILD_ARGUMENT = '--child'
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Number of times to launch the GUI.')
+    parser.add_argument('--module-count', type=int, default=20,
+                        help='Number of modules to show import times for.')
+    parser.add_argument('--depth', type=int, default=2,
+                        help='Only show modules imported at most this many '
+                             'levels below `run_gui`.')
+    parser.add_argument(CHILD_ARGUMENT, action='store_true',
+                        help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def run_child():
+    """Start the GUI and print the time at which the window is first painted."""
+    from PySide6.QtCore import QEvent, QObject, QTimer
+    from PySide6.QtGui import QImageReader
+    from PySide6.QtWidgets import QApplication
+
+    from run_gui import create_tag_sorter
+    from widgets.main_window import MainWindow
+
+    class FirstPaintFilter(QObject):
+        def __init__(self, app: QApplication):
+            super().__init__()
+            self.app = app
+            self.first_paint_time = None
+
+        def eventFilter(self, watched, event) -> bool:
+            if (self.first_paint_time is None
+                    and event.type() == QEvent.Type.Paint):
+                self.first_paint_time = time.time()
+                print(self.first_paint_time, flush=True)
+                # Let the deferred startup work run before quitting.
+                QTimer.singleShot(0, self.app.quit)
+            return False
+
+    app = QApplication([])
+    app.setStyle('Fusion')
+    QImageReader.setAllocationLimit(0)
+    first_paint_filter = FirstPaintFilter(app)
+    app.installEventFilter(first_paint_filter)
+    main_window = MainWindow(app, tag_sorter_factory=create_tag_sorter)
+    main_window.show()
+    app.exec()
+    app.removeEventFilter(first_paint_filter)
+    main_window.close()
+    # Exit without destroying the Qt objects, which can crash when the
+    # application is destroyed before the window.
+    os._exit(0)
+
+
+def measure_time_to_first_paint() -> float:
+    start_time = time.time()
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.startup_benchmark',
+         CHILD_ARGUMENT], capture_output=True, text=True, check=True).stdout
+    first_paint_time = float(output.strip().splitlines()[-1])
+    return first_paint_time - start_time
+
+
+def measure_import_times() -> list[tuple[int, float, float, str]]:
+    """
+    Get the depth, self time and cumulative time in seconds, and the name of
+    each module imported by `run_gui`.
+    """
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import run_gui'],
+        capture_output=True, text=True, check=True).stderr
+    import_times = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, cumulative_time, name = line.removeprefix(
+            'import time:').split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        import_times.append((depth, int(self_time) / 1e6,
+                             int(cumulative_time) / 1e6, name.strip()))
+    return import_times
+
+
+def main():
+    arguments = parse_arguments()
+    if arguments.child:
+        run_child()
+        return
+    durations = [measure_time_to_first_paint()
+                 for _ in range(arguments.runs)]
+    print(f'Time to first paint over {arguments.runs} runs: median '
+          f'{statistics.median(durations):.2f} s, min {min(durations):.2f} s, '
+          f'max {max(durations):.2f} s')
+
+    import_times = measure_import_times()
+    total_duration = sum(self_time for _, self_time, _, _ in import_times)
+    print(f'\nImporting run_gui: {total_duration:.2f} s in '
+          f'{len(import_times)} modules')
+    # `run_gui` itself has the smallest depth.
+    base_depth = min(depth for depth, _, _, _ in import_times)
+    shown_import_times = sorted(
+        (import_time for import_time in import_times
+         if import_time[0] - base_depth <= arguments.depth),
+        key=lambda import_time: import_time[2], reverse=True)
+    print(f'{"Cumulative":>10} {"Self":>8}  Module')
+    for depth, self_time, cumulative_time, name in shown_import_times[
+            :arguments.module_count]:
+        indentation = '  ' * (depth - base_depth)
+        print(f'{cumulative_time:>9.3f}s {self_time:>7.3f}s  '
+              f'{indentation}{name}')
+    heavy_modules = [module for module in ('torch', 'transformers',
+                                           'huggingface_hub')
+                     if any(name == module for _, _, _, name in import_times)]
+    if heavy_modules:
+        print(f'\nWarning: {", ".join(heavy_modules)} imported at startup.')
+
+
+if __name__ == '__main__':
+    main()
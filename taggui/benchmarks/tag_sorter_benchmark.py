@@ -0,0 +1,95 @@
+"""
+Benchmark per-tag, batched and scoring tag classification with `TagSorter`.
+
+Run from the `taggui` directory:
+    python -m benchmarks.tag_sorter_benchmark --model-path models/flan-t5-base
+"""
+import argparse
+import os
+from time import perf_counter
+
+TAGS = [
+    'woman', 'man', 'girl', 'old man', 'dog', 'cat', 'warrior', 'alien',
+    'robot', 'dragon', 'knight', 'child', 'forest', 'mountain', 'castle',
+    'beach', 'city street', 'kitchen', 'motorcycle', 'house', 'bridge',
+    'desert', 'river', 'spaceship', 'library', 'running', 'jumping',
+    'fighting', 'sitting', 'swimming', 'dancing', 'reading', 'eating',
+    'sleeping', 'climbing', 'explore', 'riding a horse', 'holding a sword',
+    'looking at viewer', 'smiling'
+]
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--model-path', default=None,
+                        help='Directory of a local model. Defaults to '
+                             'downloading the model.')
+    parser.add_argument('--tag-count', type=int, default=len(TAGS))
+    parser.add_argument('--max-batch-tokens', type=int, default=None)
+    parser.add_argument('--gpu', action='store_true',
+                        help='Use the GPU if one is available instead of the '
+                             'CPU.')
+    return parser.parse_args()
+
+
+def time_sort_tags(tag_sorter, tags: list[str], **kwargs) -> tuple[dict, float]:
+    start_time = perf_counter()
+    # Bypass the tag category cache so that every tag is classified.
+    result = tag_sorter.sort_tags(tags, use_cache=False, **kwargs)
+    return result, perf_counter() - start_time
+
+
+def print_mismatched_tags(name: str, per_tag_result: dict, result: dict):
+    mismatched_tags = [
+        tag for tags in per_tag_result.values() for tag in tags
+        if any((tag in per_tag_result[category]) != (tag in result[category])
+               for category in per_tag_result)
+    ]
+    if mismatched_tags:
+        print(f'{name} results differ from per-tag results for '
+              f'{len(set(mismatched_tags))} tags: '
+              f'{", ".join(sorted(set(mismatched_tags)))}')
+    else:
+        print(f'{name} results match per-tag results.')
+
+
+def main():
+    arguments = parse_arguments()
+    if not arguments.gpu:
+        # Hide the GPUs before PyTorch is imported.
+        os.environ['CUDA_VISIBLE_DEVICES'] = ''
+    from utils.enums import TagSortingMode
+    from utils.tag_sorter import DEFAULT_MAX_BATCH_TOKENS, TagSorter
+
+    tags = (TAGS * (arguments.tag_count // len(TAGS) + 1))[:arguments.tag_count]
+    tag_sorter = TagSorter(
+        local_model_path=arguments.model_path,
+        max_batch_tokens=(arguments.max_batch_tokens
+                          or DEFAULT_MAX_BATCH_TOKENS))
+    # Warm up so that one-time setup is not included in the timings.
+    tag_sorter.sort_tags(tags[:2], mode=TagSortingMode.GENERATION,
+                         use_cache=False)
+    tag_sorter.sort_tags(tags[:2], mode=TagSortingMode.SCORING,
+                         use_cache=False)
+
+    per_tag_result, per_tag_duration = time_sort_tags(
+        tag_sorter, tags, batched=False, mode=TagSortingMode.GENERATION)
+    batched_result, batched_duration = time_sort_tags(
+        tag_sorter, tags, mode=TagSortingMode.GENERATION)
+    scoring_result, scoring_duration = time_sort_tags(
+        tag_sorter, tags, mode=TagSortingMode.SCORING)
+    print(f'\n{len(tags)} tags on {tag_sorter.device}')
+    print(f'Per-tag: {per_tag_duration:.2f} s '
+          f'({len(tags) / per_tag_duration:.1f} tags/s)')
+    print(f'Batched: {batched_duration:.2f} s '
+          f'({len(tags) / batched_duration:.1f} tags/s, '
+          f'{per_tag_duration / batched_duration:.1f}x faster)')
+    print(f'Scoring: {scoring_duration:.2f} s '
+          f'({len(tags) / scoring_duration:.1f} tags/s, '
+          f'{per_tag_duration / scoring_duration:.1f}x faster)')
+    print_mismatched_tags('Batched', per_tag_result, batched_result)
+    print_mismatched_tags('Scoring', per_tag_result, scoring_result)
+
+
+if __name__ == '__main__':
+    main()
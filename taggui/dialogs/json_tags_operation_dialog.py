@@ -0,0 +1,104 @@
+from PySide6.QtCore import Qt, Slot
+from PySide6.QtWidgets import (QDialog, QGridLayout, QLabel, QPushButton,
+                               QVBoxLayout)
+
+from models.image_list_model import ImageListModel, Scope
+from utils.enums import JsonTagOperation
+from utils.json_tags import JSON_TAG_CATEGORIES
+from utils.settings_widgets import SettingsComboBox, SettingsLineEdit
+from utils.utils import pluralize
+
+
+class JsonTagsOperationDialog(QDialog):
+    def __init__(self, parent, image_list_model: ImageListModel):
+        super().__init__(parent)
+        self.image_list_model = image_list_model
+        self.setWindowTitle('Bulk Edit JSON Tags')
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(20, 20, 20, 20)
+        layout.setSpacing(20)
+        description_label = QLabel(
+            'Edit the JSON tags of many images at once. Separate multiple '
+            'tags with commas. Each edit can be undone in one step.')
+        description_label.setWordWrap(True)
+        layout.addWidget(description_label)
+        grid_layout = QGridLayout()
+        for row, label_text in enumerate(('Operation', 'Category', 'Tags',
+                                          'New tag', 'New category',
+                                          'Scope')):
+            grid_layout.addWidget(QLabel(label_text), row, 0,
+                                  Qt.AlignmentFlag.AlignRight)
+        self.operation_combo_box = SettingsComboBox(
+            key='json_tags_operation')
+        self.operation_combo_box.addItems(list(JsonTagOperation))
+        grid_layout.addWidget(self.operation_combo_box, 0, 1)
+        self.category_combo_box = SettingsComboBox(
+            key='json_tags_operation_category')
+        self.category_combo_box.addItems(list(JSON_TAG_CATEGORIES))
+        grid_layout.addWidget(self.category_combo_box, 1, 1)
+        self.tags_line_edit = SettingsLineEdit(key='json_tags_operation_tags')
+        self.tags_line_edit.setClearButtonEnabled(True)
+        grid_layout.addWidget(self.tags_line_edit, 2, 1)
+        self.new_tag_line_edit = SettingsLineEdit(
+            key='json_tags_operation_new_tag')
+        self.new_tag_line_edit.setClearButtonEnabled(True)
+        grid_layout.addWidget(self.new_tag_line_edit, 3, 1)
+        self.new_category_combo_box = SettingsComboBox(
+            key='json_tags_operation_new_category')
+        self.new_category_combo_box.addItems(list(JSON_TAG_CATEGORIES))
+        grid_layout.addWidget(self.new_category_combo_box, 4, 1)
+        self.scope_combo_box = SettingsComboBox(
+            key='json_tags_operation_scope')
+        self.scope_combo_box.addItems(list(Scope))
+        grid_layout.addWidget(self.scope_combo_box, 5, 1)
+        layout.addLayout(grid_layout)
+        self.apply_button = QPushButton('Apply')
+        self.apply_button.clicked.connect(self.apply)
+        layout.addWidget(self.apply_button)
+        self.result_label = QLabel()
+        layout.addWidget(self.result_label)
+
+        self.operation_combo_box.currentTextChanged.connect(
+            self.update_inputs)
+        self.tags_line_edit.textChanged.connect(self.update_inputs)
+        self.new_tag_line_edit.textChanged.connect(self.update_inputs)
+        self.update_inputs()
+
+    def get_tags(self) -> list[str]:
+        tags = [tag.strip() for tag in self.tags_line_edit.text().split(',')]
+        return list(dict.fromkeys(tag for tag in tags if tag))
+
+    @Slot()
+    def update_inputs(self):
+        operation = self.operation_combo_box.currentText()
+        self.new_tag_line_edit.setEnabled(
+            operation == JsonTagOperation.RENAME)
+        self.new_category_combo_box.setEnabled(
+            operation == JsonTagOperation.MOVE_CATEGORY)
+        is_valid = bool(self.get_tags())
+        if operation == JsonTagOperation.RENAME:
+            is_valid = is_valid and bool(self.new_tag_line_edit.text().strip())
+        self.apply_button.setEnabled(is_valid)
+
+    @Slot()
+    def apply(self):
+        operation = self.operation_combo_box.currentText()
+        category = self.category_combo_box.currentText()
+        tags = self.get_tags()
+        scope = self.scope_combo_box.currentText()
+        if operation == JsonTagOperation.ADD:
+            changed_image_count = self.image_list_model.add_json_tags(
+                {category: tags}, scope)
+        elif operation == JsonTagOperation.REMOVE:
+            changed_image_count = self.image_list_model.delete_json_tags(
+                category, tags, scope)
+        elif operation == JsonTagOperation.RENAME:
+            changed_image_count = self.image_list_model.rename_json_tags(
+                category, tags, self.new_tag_line_edit.text().strip(), scope)
+        else:
+            changed_image_count = self.image_list_model.move_json_tags(
+                category, tags, self.new_category_combo_box.currentText(),
+                scope)
+        self.result_label.setText(
+            f'Changed {changed_image_count} '
+            f'{pluralize("image", changed_image_count)}.')
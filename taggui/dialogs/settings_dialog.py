@@ -2,9 +2,10 @@ from PySide6.QtCore import Qt, Slot
 from PySide6.QtWidgets import (QDialog, QFileDialog, QGridLayout, QLabel,
                                QLineEdit, QPushButton, QVBoxLayout)
 
+from utils.enums import TagSortingMode
 from utils.settings import DEFAULT_SETTINGS, get_settings
-from utils.settings_widgets import (SettingsBigCheckBox, SettingsLineEdit,
-                                    SettingsSpinBox)
+from utils.settings_widgets import (SettingsBigCheckBox, SettingsComboBox,
+                                    SettingsLineEdit, SettingsSpinBox)
 
 
 class SettingsDialog(QDialog):
@@ -31,6 +32,13 @@ class SettingsDialog(QDialog):
                               5, 0, Qt.AlignmentFlag.AlignRight)
         grid_layout.addWidget(QLabel('Auto-captioning models directory'), 6, 0,
                               Qt.AlignmentFlag.AlignRight)
+        grid_layout.addWidget(
+            QLabel('Auto-captioning model memory budget (GB)'), 8, 0,
+            Qt.AlignmentFlag.AlignRight)
+        grid_layout.addWidget(QLabel('Tag sorting mode'), 9, 0,
+                              Qt.AlignmentFlag.AlignRight)
+        grid_layout.addWidget(QLabel('Image viewer cache size (MB)'), 10, 0,
+                              Qt.AlignmentFlag.AlignRight)
 
         font_size_spin_box = SettingsSpinBox(
             key='font_size', default=DEFAULT_SETTINGS['font_size'],
@@ -72,6 +80,36 @@ class SettingsDialog(QDialog):
         models_directory_button.setFixedWidth(
             int(models_directory_button.sizeHint().width() * 1.3))
         models_directory_button.clicked.connect(self.set_models_directory_path)
+        # The budget is read every time a model is loaded, so a restart is not
+        # needed.
+        captioning_model_memory_budget_spin_box = SettingsSpinBox(
+            key='captioning_model_memory_budget',
+            default=DEFAULT_SETTINGS['captioning_model_memory_budget'],
+            minimum=0, maximum=9999)
+        captioning_model_memory_budget_spin_box.setSpecialValueText(
+            '0 (one model)')
+        captioning_model_memory_budget_spin_box.setToolTip(
+            'The total memory that auto-captioning models can use while they '
+            'are kept loaded.\nThe least recently used models are unloaded '
+            'when the budget is exceeded.')
+        tag_sorting_mode_combo_box = SettingsComboBox(
+            key='tag_sorting_mode',
+            default=DEFAULT_SETTINGS['tag_sorting_mode'])
+        tag_sorting_mode_combo_box.addItems(list(TagSortingMode))
+        tag_sorting_mode_combo_box.setToolTip(
+            'Label scoring picks the most likely category for each tag.\n'
+            'Generation lets the model write the category name.')
+        # The cache size is read every time an image is cached, so a restart
+        # is not needed.
+        image_viewer_cache_size_spin_box = SettingsSpinBox(
+            key='image_viewer_cache_size',
+            default=DEFAULT_SETTINGS['image_viewer_cache_size'],
+            minimum=0, maximum=99999)
+        image_viewer_cache_size_spin_box.setSpecialValueText('0 (disabled)')
+        image_viewer_cache_size_spin_box.setToolTip(
+            'The memory used to decode the images around the selected image '
+            'in advance.\nA larger cache makes going back to recently viewed '
+            'images faster.')
         file_types_line_edit = SettingsLineEdit(
             key='image_list_file_formats',
             default=DEFAULT_SETTINGS['image_list_file_formats'])
@@ -94,6 +132,12 @@ class SettingsDialog(QDialog):
                               Qt.AlignmentFlag.AlignLeft)
         grid_layout.addWidget(models_directory_button, 7, 1,
                               Qt.AlignmentFlag.AlignLeft)
+        grid_layout.addWidget(captioning_model_memory_budget_spin_box, 8, 1,
+                              Qt.AlignmentFlag.AlignLeft)
+        grid_layout.addWidget(tag_sorting_mode_combo_box, 9, 1,
+                              Qt.AlignmentFlag.AlignLeft)
+        grid_layout.addWidget(image_viewer_cache_size_spin_box, 10, 1,
+                              Qt.AlignmentFlag.AlignLeft)
         layout.addLayout(grid_layout)
 
         # Prevent the grid layout from moving to the center when the warning
@@ -1,6 +1,7 @@
 import random
 import sys
-from collections import Counter, deque
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict, deque
 from dataclasses import dataclass
 from enum import Enum
 from pathlib import Path
@@ -14,10 +15,16 @@ from PySide6.QtWidgets import QMessageBox
 from exifread.heic import NoParser
 
 from utils.image import Image
+from utils.json_tags import (JsonTagsPersister, copy_json_tags,
+                             get_empty_json_tags, with_added_json_tags, with_moved_json_tags,
+                             with_removed_json_tags, with_renamed_json_tags)
+from utils.tag_storage import (ManifestTagStorage, TagStorage,
+                               convert_to_manifest, convert_to_sidecars,
+                               get_tag_storage)
 from utils.settings import DEFAULT_SETTINGS, get_settings
 from utils.utils import get_confirmation_dialog_reply, pluralize
 
-from typing import List, Union
+from typing import Callable, List, Union
 
 UNDO_STACK_SIZE = 32
 
@@ -39,8 +46,12 @@ def get_file_paths(directory_path: Path) -> set[Path]:
 @dataclass
 class HistoryItem:
     action_name: str
-    tags: list[list[str]]
+    # `None` for actions that only change JSON tags.
+    tags: list[list[str]] | None
     should_ask_for_confirmation: bool
+    # For actions that change JSON tags, the JSON tags of only the changed
+    # images, by row.
+    json_tags: dict[int, dict[str, list[str]]] | None = None
 
 
 class Scope(str, Enum):
@@ -51,6 +62,11 @@ class Scope(str, Enum):
 
 class ImageListModel(QAbstractListModel):
     update_undo_and_redo_actions_requested = Signal()
+    # The old and new JSON tags of the images whose JSON tags changed.
+    json_tags_changed = Signal(list, list)
+    # The old and new text tags of the images that were added or removed.
+    # Other changes to text tags emit `dataChanged`.
+    tags_changed = Signal(list, list)
 
     def __init__(self, image_list_image_width: int, tag_separator: str):
         super().__init__()
@@ -61,6 +77,9 @@ class ImageListModel(QAbstractListModel):
         self.redo_stack = []
         self.proxy_image_list_model = None
         self.image_list_selection_model = None
+        self.directory_path: Path | None = None
+        self.tag_storage: TagStorage | None = None
+        self.json_tags_persister = JsonTagsPersister()
 
     def rowCount(self, parent=None) -> int:
         return len(self.images)
@@ -73,14 +92,9 @@ class ImageListModel(QAbstractListModel):
         if role == Qt.ItemDataRole.DisplayRole:
             # Only show text tags in the image list view
             text = image.path.name
-            try:
-                txt_path = image.path.with_suffix('.txt')
-                if txt_path.exists():
-                    caption = txt_path.read_text(encoding='utf-8', errors='replace')
-                    if caption:
-                        text += f'\n{caption}'
-            except OSError:
-                pass
+            caption = self.tag_separator.join(image.tags)
+            if caption:
+                text += f'\n{caption}'
             return text
         if role == Qt.ItemDataRole.DecorationRole:
             # The thumbnail. If the image already has a thumbnail stored, use
@@ -168,6 +182,8 @@ class ImageListModel(QAbstractListModel):
     #     self.modelReset.emit()
     def load_directory(self, directory_path: Path):
         """Update to handle both .txt and .json files"""
+        # Write the pending JSON tags of the previous directory.
+        self.json_tags_persister.wait()
         self.images.clear()
         self.undo_stack.clear()
         self.redo_stack.clear()
@@ -188,10 +204,6 @@ class ImageListModel(QAbstractListModel):
 
         image_paths = [path for path in file_paths
                        if path.suffix.lower() in image_suffixes]
-        text_file_paths = [path for path in file_paths
-                           if path.suffix == '.txt']
-        json_file_paths = [path for path in file_paths
-                           if path.suffix == '.json']
 
         for image_path in image_paths:
             try:
@@ -202,26 +214,232 @@ class ImageListModel(QAbstractListModel):
                 print(f'Failed to get dimensions for {image_path}: '
                       f'{exception}', file=sys.stderr)
                 dimensions = None
-
-            tags = []
-            # Check for traditional .txt tags
-            text_file_path = image_path.with_suffix('.txt')
-            if text_file_path in text_file_paths:
-                caption = text_file_path.read_text(encoding='utf-8',
-                                                   errors='replace')
-                if caption:
-                    tags = caption.split(self.tag_separator)
-                    tags = [tag.strip() for tag in tags]
-                    tags = [tag for tag in tags if tag]
-
-            # We don't load JSON tags here as they're handled separately by JsonTagsEditor
-
-            image = Image(image_path, dimensions, tags)
+            image = Image(image_path, dimensions)
             self.images.append(image)
 
+        # Read the tags from the manifest if the directory has one, or from
+        # the `.txt` and `.json` sidecar files.
+        self.directory_path = directory_path
+        self.tag_storage = get_tag_storage(directory_path, self.tag_separator)
+        self.json_tags_persister.tag_storage = self.tag_storage
+        self.tag_storage.load_tags(self.images, file_paths)
+
         self.images.sort(key=lambda image_: image_.path)
         self.modelReset.emit()
 
+    def set_json_tags(self, image_index: QModelIndex,
+                      json_tags: dict[str, list[str]],
+                      action_name: str | None = None):
+        """
+        Set the JSON tags of an image and schedule writing them to disk. The
+        change can be undone if `action_name` is given.
+        """
+        image: Image = self.data(image_index, Qt.ItemDataRole.UserRole)
+        old_json_tags = image.json_tags
+        if json_tags == old_json_tags:
+            return
+        if action_name is not None:
+            self.add_json_tags_to_undo_stack(
+                action_name, should_ask_for_confirmation=False,
+                json_tags={image_index.row(): old_json_tags})
+        image.json_tags = copy_json_tags(json_tags)
+        self.json_tags_persister.schedule_write(image)
+        self.json_tags_changed.emit([old_json_tags], [image.json_tags])
+
+    def get_images_at_paths(self, paths: list[Path]) -> list[Image]:
+        paths = set(paths)
+        return [image for image in self.images if image.path in paths]
+
+    def overwrite_json_tags(self, paths: list[Path]):
+        """
+        Write the JSON tags of images to disk even if they were changed by
+        another program.
+        """
+        self.json_tags_persister.schedule_overwrite(
+            self.get_images_at_paths(paths))
+
+    def reload_json_tags(self, paths: list[Path]):
+        """Discard the JSON tags of images and read them from disk again."""
+        paths = set(paths)
+        changed_rows = [row for row, image in enumerate(self.images)
+                        if image.path in paths]
+        if not changed_rows:
+            return
+        images = [self.images[row] for row in changed_rows]
+        old_json_tags_list = [image.json_tags for image in images]
+        self.tag_storage.reload_json_tags(images)
+        self.json_tags_changed.emit(
+            old_json_tags_list, [image.json_tags for image in images])
+        self.dataChanged.emit(self.index(changed_rows[0]),
+                              self.index(changed_rows[-1]))
+
+    def add_images(self, images: list[Image]):
+        """
+        Insert new images, such as saved clips or copied images, at their
+        sorted rows without reloading the directory, and write their tags
+        together. Images at paths that are already in the list, such as
+        overwritten files, replace them. Images outside the loaded directory
+        are not listed, but their tags are still written.
+        """
+        outside_images = [
+            image for image in images if self.directory_path is None
+            or not image.path.is_relative_to(self.directory_path)]
+        self.write_tags_outside_directory(outside_images)
+        if self.directory_path is None:
+            return
+        paths = [image.path for image in self.images]
+        listed_paths = set(paths)
+        replaced_paths = [image.path for image in images
+                          if image.path in listed_paths]
+        if replaced_paths:
+            self.remove_images(replaced_paths)
+            paths = [image.path for image in self.images]
+        # The new images grouped by the row they are inserted before, in the
+        # rows from before the insertion.
+        blocks: list[tuple[int, list[Image]]] = []
+        for image in sorted(images, key=lambda image_: image_.path):
+            if not image.path.is_relative_to(self.directory_path):
+                continue
+            row = bisect_left(paths, image.path)
+            if row < len(paths) and paths[row] == image.path:
+                continue
+            if blocks and blocks[-1][0] == row:
+                blocks[-1][1].append(image)
+            else:
+                blocks.append((row, [image]))
+        if not blocks:
+            return
+        # The old row of each inserted image, to shift the rows in the
+        # history.
+        insertion_rows = [row for row, block_images in blocks
+                          for _ in block_images]
+        history_items = [*self.undo_stack, *self.redo_stack]
+        new_rows = []
+        inserted_count = 0
+        for row, block_images in blocks:
+            first_row = row + inserted_count
+            self.beginInsertRows(QModelIndex(), first_row,
+                                 first_row + len(block_images) - 1)
+            self.images[first_row:first_row] = block_images
+            self.endInsertRows()
+            for history_item in history_items:
+                if history_item.tags is not None:
+                    history_item.tags[first_row:first_row] = [
+                        image.tags.copy() for image in block_images]
+            new_rows.extend(range(first_row, first_row + len(block_images)))
+            inserted_count += len(block_images)
+        for history_item in history_items:
+            if history_item.json_tags is not None:
+                history_item.json_tags = {
+                    row + bisect_right(insertion_rows, row): json_tags
+                    for row, json_tags in history_item.json_tags.items()}
+        new_images = [self.images[row] for row in new_rows]
+        # Moved and copied images already have sidecar files with the same
+        # tags, which are not conflicts.
+        self.json_tags_persister.schedule_overwrite(new_images)
+        self.json_tags_persister.flush()
+        self.tags_changed.emit([[] for _ in new_images],
+                               [image.tags for image in new_images])
+        self.json_tags_changed.emit(
+            [get_empty_json_tags() for _ in new_images],
+            [image.json_tags for image in new_images])
+
+    def write_tags_outside_directory(self, images: list[Image]):
+        """
+        Write the tags of images outside the loaded directory with the tag
+        storage of their own directories.
+        """
+        images_by_directory = defaultdict(list)
+        for image in images:
+            images_by_directory[image.path.parent].append(image)
+        for directory_path, directory_images in images_by_directory.items():
+            tag_storage = get_tag_storage(directory_path, self.tag_separator)
+            try:
+                for image in directory_images:
+                    if image.tags:
+                        tag_storage.write_tags(image)
+                tag_storage.write_json_tags(
+                    directory_images,
+                    overwritten_paths={image.path
+                                       for image in directory_images})
+            except OSError:
+                error_message_box = QMessageBox()
+                error_message_box.setWindowTitle('Error')
+                error_message_box.setIcon(QMessageBox.Icon.Critical)
+                error_message_box.setText(f'Failed to save tags in '
+                                          f'{directory_path}.')
+                error_message_box.exec()
+
+    def remove_images(self, paths: list[Path]):
+        """
+        Remove the images at `paths`, such as deleted or moved images, without
+        reloading the directory.
+        """
+        paths = set(paths)
+        removed_rows = [row for row, image in enumerate(self.images)
+                        if image.path in paths]
+        if not removed_rows:
+            return
+        removed_images = [self.images[row] for row in removed_rows]
+        # Pending writes would create the sidecar files of the images again.
+        self.json_tags_persister.discard(paths)
+        try:
+            self.tag_storage.remove_tags(paths)
+        except OSError:
+            error_message_box = QMessageBox()
+            error_message_box.setWindowTitle('Error')
+            error_message_box.setIcon(QMessageBox.Icon.Critical)
+            error_message_box.setText(f'Failed to remove the tags of '
+                                      f'{len(paths)} '
+                                      f'{pluralize("image", len(paths))} '
+                                      f'from {self.tag_storage.name}.')
+            error_message_box.exec()
+        # Remove the rows in contiguous blocks, from the bottom up so that the
+        # rows of the remaining blocks stay valid.
+        blocks = []
+        for row in removed_rows:
+            if blocks and blocks[-1][1] == row - 1:
+                blocks[-1][1] = row
+            else:
+                blocks.append([row, row])
+        for first_row, last_row in reversed(blocks):
+            self.beginRemoveRows(QModelIndex(), first_row, last_row)
+            del self.images[first_row:last_row + 1]
+            self.endRemoveRows()
+        removed_row_set = set(removed_rows)
+        for history_item in (*self.undo_stack, *self.redo_stack):
+            if history_item.tags is not None:
+                history_item.tags = [
+                    tags for row, tags in enumerate(history_item.tags)
+                    if row not in removed_row_set]
+            if history_item.json_tags is not None:
+                history_item.json_tags = {
+                    row - bisect_left(removed_rows, row): json_tags
+                    for row, json_tags in history_item.json_tags.items()
+                    if row not in removed_row_set}
+        self.tags_changed.emit([image.tags for image in removed_images],
+                               [[] for _ in removed_images])
+        self.json_tags_changed.emit(
+            [image.json_tags for image in removed_images],
+            [get_empty_json_tags() for _ in removed_images])
+
+    def is_using_manifest(self) -> bool:
+        return isinstance(self.tag_storage, ManifestTagStorage)
+
+    def convert_tag_storage(self, to_manifest: bool):
+        """
+        Move the tags of all images from sidecar files to a manifest, or from
+        the manifest to sidecar files. Raise `OSError` on failure.
+        """
+        self.json_tags_persister.wait()
+        if to_manifest:
+            self.tag_storage = convert_to_manifest(
+                self.directory_path, self.images, self.tag_separator)
+        else:
+            self.tag_storage = convert_to_sidecars(
+                self.directory_path, self.images, self.tag_separator)
+        self.json_tags_persister.tag_storage = self.tag_storage
+
     def add_to_undo_stack(self, action_name: str,
                           should_ask_for_confirmation: bool):
         """Add the current state of the image tags to the undo stack."""
@@ -231,6 +449,19 @@ class ImageListModel(QAbstractListModel):
         self.redo_stack.clear()
         self.update_undo_and_redo_actions_requested.emit()
 
+    def add_json_tags_to_undo_stack(
+            self, action_name: str, should_ask_for_confirmation: bool,
+            json_tags: dict[int, dict[str, list[str]]]):
+        """
+        Add the JSON tags of the images changed by an action, from before the
+        action, to the undo stack.
+        """
+        self.undo_stack.append(HistoryItem(action_name, None,
+                                           should_ask_for_confirmation,
+                                           json_tags))
+        self.redo_stack.clear()
+        self.update_undo_and_redo_actions_requested.emit()
+
     # def write_image_tags_to_disk(self, image: Image):
     #     try:
     #         image.path.with_suffix('.txt').write_text(
@@ -243,19 +474,8 @@ class ImageListModel(QAbstractListModel):
     #         error_message_box.setText(f'Failed to save tags for {image.path}.')
     #         error_message_box.exec()
     def write_image_tags_to_disk(self, image: Image):
-        """Updated to handle potential file conflicts"""
         try:
-            # Write traditional .txt tags
-            txt_path = image.path.with_suffix('.txt')
-            txt_path.write_text(
-                self.tag_separator.join(image.tags),
-                encoding='utf-8',
-                errors='replace'
-            )
-
-            # Note: We don't delete any existing .json files here
-            # as they're managed separately by JsonTagsEditor
-
+            self.tag_storage.write_tags(image)
         except OSError:
             error_message_box = QMessageBox()
             error_message_box.setWindowTitle('Error')
@@ -283,6 +503,9 @@ class ImageListModel(QAbstractListModel):
             if reply != QMessageBox.StandardButton.Yes:
                 return
         source_stack.pop()
+        if history_item.json_tags is not None:
+            self.restore_history_json_tags(history_item, destination_stack)
+            return
         tags = [image.tags for image in self.images]
         destination_stack.append(HistoryItem(
             history_item.action_name, tags,
@@ -300,6 +523,123 @@ class ImageListModel(QAbstractListModel):
                                   self.index(changed_image_indices[-1]))
         self.update_undo_and_redo_actions_requested.emit()
 
+    def restore_history_json_tags(self, history_item: HistoryItem,
+                                  destination_stack: list):
+        # JSON tags are always replaced instead of modified in place, so they
+        # do not need to be copied.
+        destination_stack.append(HistoryItem(
+            history_item.action_name, None,
+            history_item.should_ask_for_confirmation,
+            {row: self.images[row].json_tags
+             for row in history_item.json_tags}))
+        changed_rows = []
+        old_json_tags_list = []
+        for row, history_image_json_tags in history_item.json_tags.items():
+            image = self.images[row]
+            changed_rows.append(row)
+            old_json_tags_list.append(image.json_tags)
+            image.json_tags = history_image_json_tags
+        self.write_json_tags_to_disk(changed_rows, old_json_tags_list)
+        self.update_undo_and_redo_actions_requested.emit()
+
+    def write_json_tags_to_disk(self, changed_rows: list[int],
+                                old_json_tags_list: list[dict[str, list[str]]]):
+        """
+        Write the JSON tags of images changed by a batch action together and
+        notify the views.
+        """
+        if not changed_rows:
+            return
+        changed_images = [self.images[row] for row in changed_rows]
+        for image in changed_images:
+            self.json_tags_persister.schedule_write(image)
+        self.json_tags_persister.flush()
+        self.json_tags_changed.emit(
+            old_json_tags_list, [image.json_tags for image in changed_images])
+        self.dataChanged.emit(self.index(min(changed_rows)),
+                              self.index(max(changed_rows)))
+
+    def edit_json_tags(
+            self, action_name: str,
+            edit_function: Callable[[dict[str, list[str]]],
+                                    dict[str, list[str]]],
+            scope: Union[Scope, str] = Scope.ALL_IMAGES,
+            image_indices: list[QModelIndex] | None = None,
+            should_ask_for_confirmation: bool = True) -> int:
+        """
+        Replace the JSON tags of the images in a scope, or of the images at
+        `image_indices` if given, with the result of `edit_function` as one
+        undoable action. Return the number of changed images.
+        """
+        if image_indices is not None:
+            rows = sorted({image_index.row() for image_index in image_indices})
+        else:
+            rows = [row for row, image in enumerate(self.images)
+                    if self.is_image_in_scope(scope, row, image)]
+        old_json_tags = {}
+        for row in rows:
+            image = self.images[row]
+            edited_json_tags = edit_function(image.json_tags)
+            if edited_json_tags == image.json_tags:
+                continue
+            old_json_tags[row] = image.json_tags
+            image.json_tags = edited_json_tags
+        if not old_json_tags:
+            return 0
+        self.add_json_tags_to_undo_stack(action_name,
+                                         should_ask_for_confirmation,
+                                         old_json_tags)
+        self.write_json_tags_to_disk(list(old_json_tags),
+                                     list(old_json_tags.values()))
+        return len(old_json_tags)
+
+    def rename_json_tags(self, category: str, old_tags: list[str],
+                         new_tag: str,
+                         scope: Union[Scope, str] = Scope.ALL_IMAGES) -> int:
+        """Rename JSON tags of a category in all images in a scope."""
+        return self.edit_json_tags(
+            f'Rename {category[:-1].capitalize()} '
+            f'{pluralize("Tag", len(old_tags))}',
+            lambda json_tags: with_renamed_json_tags(json_tags, category,
+                                                     old_tags, new_tag),
+            scope)
+
+    def delete_json_tags(self, category: str, tags: list[str],
+                         scope: Union[Scope, str] = Scope.ALL_IMAGES) -> int:
+        """Delete JSON tags of a category from all images in a scope."""
+        return self.edit_json_tags(
+            f'Delete {category[:-1].capitalize()} '
+            f'{pluralize("Tag", len(tags))}',
+            lambda json_tags: with_removed_json_tags(json_tags, category,
+                                                     tags),
+            scope)
+
+    def move_json_tags(self, category: str, tags: list[str],
+                       new_category: str,
+                       scope: Union[Scope, str] = Scope.ALL_IMAGES) -> int:
+        """Move JSON tags to another category in all images in a scope."""
+        return self.edit_json_tags(
+            f'Move {pluralize("Tag", len(tags))} to '
+            f'{new_category.capitalize()}',
+            lambda json_tags: with_moved_json_tags(json_tags, category, tags,
+                                                   new_category),
+            scope)
+
+    def add_json_tags(self, category_tags: dict[str, list[str]],
+                      scope: Union[Scope, str] = Scope.ALL_IMAGES,
+                      image_indices: list[QModelIndex] | None = None) -> int:
+        """
+        Add JSON tags to the images in a scope, or to the images at
+        `image_indices` if given.
+        """
+        tag_count = sum(len(tags) for tags in category_tags.values())
+        return self.edit_json_tags(
+            f'Add JSON {pluralize("Tag", tag_count)}',
+            lambda json_tags: with_added_json_tags(json_tags, category_tags),
+            scope, image_indices,
+            should_ask_for_confirmation=(image_indices is None
+                                         or len(image_indices) > 1))
+
     @Slot()
     def undo(self):
         """Undo the last action."""
@@ -527,18 +867,13 @@ class ImageListModel(QAbstractListModel):
         if image.tags == tags:
             return
 
-        # Only update .txt file tags
+        # Only update the text tags.
+        image.tags = tags
         try:
-            txt_path = image.path.with_suffix('.txt')
-            txt_path.write_text(
-                self.tag_separator.join(tags),
-                encoding='utf-8',
-                errors='replace'
-            )
-            image.tags = tags
-            self.dataChanged.emit(image_index, image_index)
+            self.tag_storage.write_tags(image)
         except OSError as e:
             print(f"Error saving text tags: {str(e)}")
+        self.dataChanged.emit(image_index, image_index)
 
     @Slot(list, list)
     def add_tags(self, tags: list[str], image_indices: list[QModelIndex]):
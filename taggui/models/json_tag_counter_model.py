@@ -0,0 +1,221 @@
+from collections import Counter
+
+from PySide6.QtCore import QAbstractItemModel, QModelIndex, Qt, Signal, Slot
+from PySide6.QtWidgets import QMessageBox
+
+from utils.image import Image
+from utils.json_tags import JSON_TAG_CATEGORIES
+from utils.utils import get_confirmation_dialog_reply, list_with_and, pluralize
+
+# The internal ID of category indices. Tag indices store the row of their
+# category plus one.
+CATEGORY_INTERNAL_ID = 0
+
+
+def get_json_tag_count_changes(
+        old_json_tags_list: list[dict[str, list[str]]],
+        new_json_tags_list: list[dict[str, list[str]]]
+) -> dict[str, Counter]:
+    """Get the change in the count of each JSON tag in each category."""
+    count_changes = {category: Counter() for category in JSON_TAG_CATEGORIES}
+    for old_json_tags, new_json_tags in zip(old_json_tags_list,
+                                            new_json_tags_list):
+        for category in JSON_TAG_CATEGORIES:
+            # `Counter.subtract()` keeps negative counts.
+            count_changes[category].update(new_json_tags.get(category, []))
+            count_changes[category].subtract(old_json_tags.get(category, []))
+    return count_changes
+
+
+class JsonTagCounterModel(QAbstractItemModel):
+    """
+    Tree model of the counts of the JSON tags of all images, grouped by
+    category. The counts are updated incrementally when JSON tags change.
+    """
+    # Category, old tags, new tag.
+    tags_renaming_requested = Signal(str, list, str)
+
+    def __init__(self):
+        super().__init__()
+        self.tag_counters = {category: Counter()
+                             for category in JSON_TAG_CATEGORIES}
+        # The tags of each category in row order.
+        self.category_tags: dict[str, list[str]] = {
+            category: [] for category in JSON_TAG_CATEGORIES}
+        self.all_json_tags_list = None
+
+    def get_category(self, index: QModelIndex) -> str:
+        """Get the category of a category index or a tag index."""
+        if index.internalId() == CATEGORY_INTERNAL_ID:
+            return JSON_TAG_CATEGORIES[index.row()]
+        return JSON_TAG_CATEGORIES[index.internalId() - 1]
+
+    def is_category_index(self, index: QModelIndex) -> bool:
+        return index.internalId() == CATEGORY_INTERNAL_ID
+
+    def get_category_index(self, category: str) -> QModelIndex:
+        return self.createIndex(JSON_TAG_CATEGORIES.index(category), 0,
+                                CATEGORY_INTERNAL_ID)
+
+    def index(self, row: int, column: int,
+              parent: QModelIndex = QModelIndex()) -> QModelIndex:
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(row, column, CATEGORY_INTERNAL_ID)
+        return self.createIndex(row, column, parent.row() + 1)
+
+    def parent(self, index: QModelIndex = QModelIndex()) -> QModelIndex:
+        if (not index.isValid()
+                or index.internalId() == CATEGORY_INTERNAL_ID):
+            return QModelIndex()
+        return self.createIndex(index.internalId() - 1, 0,
+                                CATEGORY_INTERNAL_ID)
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if not parent.isValid():
+            return len(JSON_TAG_CATEGORIES)
+        if self.is_category_index(parent):
+            return len(self.category_tags[self.get_category(parent)])
+        return 0
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 1
+
+    def data(self, index: QModelIndex,
+             role=None) -> tuple[str, str, int] | str | None:
+        category = self.get_category(index)
+        if self.is_category_index(index):
+            if role == Qt.ItemDataRole.DisplayRole:
+                return (f'{category.capitalize()} '
+                        f'({len(self.category_tags[category])})')
+            return None
+        tag = self.category_tags[category][index.row()]
+        count = self.tag_counters[category][tag]
+        if role == Qt.ItemDataRole.UserRole:
+            return category, tag, count
+        if role == Qt.ItemDataRole.DisplayRole:
+            return f'{tag} ({count})'
+        if role == Qt.ItemDataRole.EditRole:
+            return tag
+        return None
+
+    def flags(self, index: QModelIndex) -> Qt.ItemFlag:
+        """Make the tags editable."""
+        if self.is_category_index(index):
+            return Qt.ItemFlag.ItemIsEnabled
+        return (Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsEditable
+                | Qt.ItemFlag.ItemIsEnabled)
+
+    def setData(self, index: QModelIndex, value: str,
+                role=Qt.ItemDataRole.EditRole) -> bool:
+        new_tag = value.strip()
+        if not new_tag or role != Qt.ItemDataRole.EditRole:
+            return False
+        category, old_tag, _ = self.data(index, Qt.ItemDataRole.UserRole)
+        if new_tag == old_tag:
+            return False
+        # Rename all selected tags of the same category.
+        old_tags = []
+        old_tags_count = 0
+        for selected_index in self.all_json_tags_list.selectedIndexes():
+            selected_category, selected_tag, selected_tag_count = (
+                selected_index.data(Qt.ItemDataRole.UserRole))
+            if selected_category != category:
+                continue
+            old_tags.append(selected_tag)
+            old_tags_count += selected_tag_count
+        if old_tag not in old_tags:
+            old_tags = [old_tag]
+            old_tags_count = self.tag_counters[category][old_tag]
+        question = (f'Rename {old_tags_count} '
+                    f'{pluralize("instance", old_tags_count)} of ')
+        if len(old_tags) < 10:
+            quoted_tags = [f'"{tag}"' for tag in old_tags]
+            question += (f'{category[:-1]} {pluralize("tag", len(old_tags))} '
+                         f'{list_with_and(quoted_tags)} ')
+        else:
+            question += f'{len(old_tags)} {category[:-1]} tags '
+        question += f'to "{new_tag}"?'
+        reply = get_confirmation_dialog_reply(
+            title=f'Rename {pluralize("Tag", len(old_tags))}',
+            question=question)
+        if reply == QMessageBox.StandardButton.Yes:
+            self.tags_renaming_requested.emit(category, old_tags, new_tag)
+            return True
+        return False
+
+    @Slot()
+    def count_json_tags(self, images: list[Image]):
+        """Count the JSON tags of all images from scratch."""
+        self.beginResetModel()
+        for category in JSON_TAG_CATEGORIES:
+            tag_counter = Counter()
+            for image in images:
+                tag_counter.update(image.json_tags.get(category, []))
+            self.tag_counters[category] = tag_counter
+            self.category_tags[category] = [
+                tag for tag, _ in tag_counter.most_common()]
+        self.endResetModel()
+
+    @Slot(list, list)
+    def update_counts(self, old_json_tags_list: list[dict[str, list[str]]],
+                      new_json_tags_list: list[dict[str, list[str]]]):
+        """
+        Update the counts after the JSON tags of some images changed from
+        `old_json_tags_list` to `new_json_tags_list`.
+        """
+        count_changes = get_json_tag_count_changes(old_json_tags_list,
+                                                   new_json_tags_list)
+        for category, count_change in count_changes.items():
+            self.apply_count_change(category, count_change)
+
+    def apply_count_change(self, category: str, count_change: Counter):
+        tag_counter = self.tag_counters[category]
+        tags = self.category_tags[category]
+        category_index = self.get_category_index(category)
+        changed_rows = []
+        removed_tags = set()
+        new_tags = []
+        for tag, change in count_change.items():
+            if change == 0:
+                continue
+            was_counted = tag_counter[tag] > 0
+            tag_counter[tag] += change
+            if tag_counter[tag] <= 0:
+                del tag_counter[tag]
+                if was_counted:
+                    removed_tags.add(tag)
+            elif was_counted:
+                changed_rows.append(tag)
+            else:
+                new_tags.append(tag)
+        if removed_tags:
+            # Remove the rows of removed tags in contiguous blocks, from the
+            # bottom up so that the rows of the remaining blocks stay valid.
+            removed_rows = [row for row, tag in enumerate(tags)
+                            if tag in removed_tags]
+            blocks = []
+            for row in removed_rows:
+                if blocks and blocks[-1][1] == row - 1:
+                    blocks[-1][1] = row
+                else:
+                    blocks.append([row, row])
+            for first_row, last_row in reversed(blocks):
+                self.beginRemoveRows(category_index, first_row, last_row)
+                del tags[first_row:last_row + 1]
+                self.endRemoveRows()
+        if new_tags:
+            first_row = len(tags)
+            self.beginInsertRows(category_index, first_row,
+                                 first_row + len(new_tags) - 1)
+            tags.extend(new_tags)
+            self.endInsertRows()
+        if changed_rows:
+            rows = {tag: row for row, tag in enumerate(tags)}
+            for tag in changed_rows:
+                tag_index = self.index(rows[tag], 0, category_index)
+                self.dataChanged.emit(tag_index, tag_index)
+        if removed_tags or new_tags:
+            # Update the number of tags shown in the category row.
+            self.dataChanged.emit(category_index, category_index)
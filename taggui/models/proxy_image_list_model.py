@@ -2,20 +2,75 @@ import operator
 from fnmatch import fnmatchcase
 
 from PySide6.QtCore import QModelIndex, QSortFilterProxyModel, Qt
-from transformers import PreTrainedTokenizerBase
 
 from models.image_list_model import ImageListModel
+from utils.clip_tokenizer import count_clip_tokens, count_clip_tokens_batch
 from utils.image import Image
+from utils.json_tags import JSON_TAG_CATEGORIES
+
+COMPARISON_OPERATORS = {
+    '=': operator.eq,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge
+}
+# Maps the filter keys of JSON tags, such as `character`, to their categories.
+JSON_TAG_FILTER_KEYS = {category[:-1]: category
+                        for category in JSON_TAG_CATEGORIES}
+
+
+def does_filter_count_tokens(filter_: list | str) -> bool:
+    if isinstance(filter_, str):
+        return False
+    return any(
+        does_filter_count_tokens(part) if isinstance(part, list)
+        else (part == 'tokens' and index + 1 < len(filter_)
+              and filter_[index + 1] in COMPARISON_OPERATORS)
+        for index, part in enumerate(filter_))
 
 
 class ProxyImageListModel(QSortFilterProxyModel):
-    def __init__(self, image_list_model: ImageListModel,
-                 tokenizer: PreTrainedTokenizerBase, tag_separator: str):
+    def __init__(self, image_list_model: ImageListModel, tag_separator: str):
         super().__init__()
         self.setSourceModel(image_list_model)
-        self.tokenizer = tokenizer
         self.tag_separator = tag_separator
-        self.filter: list | None = None
+        self.filter: list | str | None = None
+        # Token counts of captions, computed in a batch when the filter is set.
+        self.caption_token_counts: dict[str, int] = {}
+        # Whether each JSON tag matches each JSON tag filter pattern, cached
+        # while the filter is set so that every distinct tag is only matched
+        # once.
+        self.json_tag_matches: dict[tuple[str, str], dict[str, bool]] = {}
+
+    def set_filter(self, filter_: list | str | None):
+        self.filter = filter_
+        self.caption_token_counts = {}
+        self.json_tag_matches = {}
+        if filter_ is not None and does_filter_count_tokens(filter_):
+            # Counting the tokens of all captions at once is much faster than
+            # counting them row by row while filtering.
+            captions = list({self.tag_separator.join(image.tags): None
+                             for image in self.sourceModel().images})
+            self.caption_token_counts = dict(
+                zip(captions, count_clip_tokens_batch(captions)))
+        # Apply the new filter.
+        self.invalidateFilter()
+
+    def does_json_tag_match_pattern(self, image: Image, category: str,
+                                    pattern: str) -> bool:
+        tag_matches = self.json_tag_matches.setdefault((category, pattern),
+                                                       {})
+        for tag in image.json_tags.get(category, []):
+            is_match = tag_matches.get(tag)
+            if is_match is None:
+                is_match = fnmatchcase(tag, pattern)
+                tag_matches[tag] = is_match
+            if is_match:
+                return True
+        return False
 
     def does_image_match_filter(self, image: Image,
                                 filter_: list | str) -> bool:
@@ -37,22 +92,16 @@ class ProxyImageListModel(QSortFilterProxyModel):
                 return fnmatchcase(image.path.name, f'*{filter_[1]}*')
             if filter_[0] == 'path':
                 return fnmatchcase(str(image.path), f'*{filter_[1]}*')
+            if filter_[0] in JSON_TAG_FILTER_KEYS:
+                return self.does_json_tag_match_pattern(
+                    image, JSON_TAG_FILTER_KEYS[filter_[0]], filter_[1])
         if filter_[1] == 'AND':
             return (self.does_image_match_filter(image, filter_[0])
                     and self.does_image_match_filter(image, filter_[2:]))
         if filter_[1] == 'OR':
             return (self.does_image_match_filter(image, filter_[0])
                     or self.does_image_match_filter(image, filter_[2:]))
-        comparison_operators = {
-            '=': operator.eq,
-            '==': operator.eq,
-            '!=': operator.ne,
-            '<': operator.lt,
-            '>': operator.gt,
-            '<=': operator.le,
-            '>=': operator.ge
-        }
-        comparison_operator = comparison_operators[filter_[1]]
+        comparison_operator = COMPARISON_OPERATORS[filter_[1]]
         number_to_compare = None
         if filter_[0] == 'tags':
             number_to_compare = len(image.tags)
@@ -61,8 +110,11 @@ class ProxyImageListModel(QSortFilterProxyModel):
             number_to_compare = len(caption)
         elif filter_[0] == 'tokens':
             caption = self.tag_separator.join(image.tags)
-            # Subtract 2 for the `<|startoftext|>` and `<|endoftext|>` tokens.
-            number_to_compare = len(self.tokenizer(caption).input_ids) - 2
+            number_to_compare = self.caption_token_counts.get(caption)
+            if number_to_compare is None:
+                number_to_compare = count_clip_tokens(caption)
+        elif filter_[0] in JSON_TAG_CATEGORIES:
+            number_to_compare = len(image.json_tags.get(filter_[0], []))
         return comparison_operator(number_to_compare, int(filter_[2]))
 
     def filterAcceptsRow(self, source_row: int,
@@ -73,3 +73,19 @@ class TagCounterModel(QAbstractListModel):
             self.tag_counter.update(image.tags)
         self.most_common_tags = self.tag_counter.most_common()
         self.modelReset.emit()
+
+    @Slot(list, list)
+    def update_counts(self, old_tags_list: list[list[str]],
+                      new_tags_list: list[list[str]]):
+        """
+        Update the counts after the tags of some images changed from
+        `old_tags_list` to `new_tags_list`, without counting the tags of all
+        images.
+        """
+        for old_tags, new_tags in zip(old_tags_list, new_tags_list):
+            self.tag_counter.subtract(old_tags)
+            self.tag_counter.update(new_tags)
+        # Remove the tags that are no longer used.
+        self.tag_counter = +self.tag_counter
+        self.most_common_tags = self.tag_counter.most_common()
+        self.modelReset.emit()
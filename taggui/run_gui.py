@@ -4,15 +4,12 @@ import sys
 import traceback
 import warnings
 
-import transformers
 from PySide6.QtGui import QImageReader
 from PySide6.QtWidgets import QApplication, QMessageBox
 
 from utils.settings import get_settings
 from widgets.main_window import MainWindow
 from dotenv import load_dotenv
-from setup_llm import setup_llm  # Add this import
-
 
 
 def suppress_warnings():
@@ -23,27 +20,22 @@ def suppress_warnings():
         return
     logging.basicConfig(level=logging.ERROR)
     warnings.simplefilter('ignore')
-    transformers.logging.set_verbosity_error()
-    try:
-        import auto_gptq
-        auto_gptq_logger = logging.getLogger(auto_gptq.modeling._base.__name__)
-        auto_gptq_logger.setLevel(logging.ERROR)
-    except ImportError:
-        pass
+    # Configure the libraries without importing them, because they are slow to
+    # import and are only imported when they are needed.
+    os.environ['TRANSFORMERS_VERBOSITY'] = 'error'
+    logging.getLogger('auto_gptq.modeling._base').setLevel(logging.ERROR)
+
+
+def create_tag_sorter():
+    # `setup_llm` imports `torch` and `transformers`, so it is only imported
+    # when tags are first sorted.
+    from setup_llm import setup_llm
+    return setup_llm()
 
 
 def run_gui():
     # Load environment variables
     load_dotenv()
-    # Initialize the LLM
-    tag_sorter = None  # Initialize as None in case setup fails
-    try:
-        tag_sorter = setup_llm()
-        print("LLM initialized successfully")
-    except Exception as e:
-        print(f"Failed to initialize LLM: {e}")
-        # Continue without LLM functionality
-
     app = QApplication([])
     # The application name is shown in the taskbar.
     app.setApplicationName('TagGUI')
@@ -52,7 +44,8 @@ def run_gui():
     app.setStyle('Fusion')
     # Disable the allocation limit to allow loading large images.
     QImageReader.setAllocationLimit(0)
-    main_window = MainWindow(app, tag_sorter=tag_sorter)
+    # The LLM is set up in the tag sorting thread when it is first needed.
+    main_window = MainWindow(app, tag_sorter_factory=create_tag_sorter)
     main_window.show()
     sys.exit(app.exec())
 
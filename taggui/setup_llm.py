@@ -23,42 +23,38 @@ def check_gpu_requirements():
     return False, "cpu"
 
 
+def get_model_path() -> Path:
+    """Get the directory of the local FLAN-T5-base model"""
+    root_dir = Path(__file__).parent.absolute()
+    return root_dir / "models" / "flan-t5-base"
+
+
 def setup_llm():
-    """Set up the LLM environment with FLAN-T5-base"""
+    """
+    Set up the LLM environment with FLAN-T5-base. This loads the model, so it
+    is called in the tag sorting thread the first time tags are sorted.
+    """
     load_dotenv()
 
     # Check GPU
-    has_gpu = check_gpu_requirements()
+    has_gpu, _ = check_gpu_requirements()
     if not has_gpu:
         print("\nWarning: No GPU found. Model will run on CPU which will be slower.")
-        user_input = input("Continue anyway? (y/n): ")
-        if user_input.lower() != 'y':
-            raise RuntimeError("Setup cancelled by user")
 
-    # Get token from environment
     hf_token = os.getenv('HUGGING_FACE_TOKEN')
-    if not hf_token:
-        raise ValueError(
-            "HuggingFace token not found in environment variables.\n"
-            "Please create a .env file with your HUGGING_FACE_TOKEN or set it manually.\n"
-            "Get your token from: https://huggingface.co/settings/tokens"
-        )
-
-    # Define model path for FLAN-T5-base
-    root_dir = Path(__file__).parent.absolute()
-    model_path = root_dir / "models" / "flan-t5-base"  # Updated path
+    model_path = get_model_path()
 
     try:
         print("\nVerifying model files...")
-        temp_sorter = TagSorter()
-
-        if model_path.exists():
-            verification_result = temp_sorter.verify_model_files(model_path)
-            if not all(verification_result.values()):
-                print("Model files incomplete. Starting download...")
-                if not TagSorter.download_model(str(model_path), hf_token):
-                    raise RuntimeError("Failed to download model files")
-        else:
+        if (not model_path.exists()
+                or not all(TagSorter.verify_model_files(model_path).values())):
+            # A token is only needed to download the model
+            if not hf_token:
+                raise ValueError(
+                    "HuggingFace token not found in environment variables.\n"
+                    "Please create a .env file with your HUGGING_FACE_TOKEN or set it manually.\n"
+                    "Get your token from: https://huggingface.co/settings/tokens"
+                )
             print(f"Downloading model to: {model_path}")
             if not TagSorter.download_model(str(model_path), hf_token):
                 raise RuntimeError("Failed to download model")
@@ -73,4 +69,4 @@ def setup_llm():
 
     except Exception as e:
         print(f"\nError during setup: {str(e)}")
-        raise RuntimeError(f"Failed to initialize TagSorter: {str(e)}")
\ No newline at end of file
+        raise RuntimeError(f"Failed to initialize TagSorter: {str(e)}")
@@ -0,0 +1,205 @@
+import os
+import re
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+
+from PySide6.QtCore import QObject, QPointF, QRect, QRectF, Signal
+from PySide6.QtGui import QImage, QImageIOHandler, QImageReader
+
+from utils.image import Image
+from utils.image_prefetcher import DecodedImage, get_orientation_transform
+
+MAX_ENCODING_WORKER_COUNT = 4
+
+
+def get_clip_path(image_path: Path, clip_number: int) -> Path:
+    return image_path.with_name(
+        f'{image_path.stem}_clip{clip_number}{image_path.suffix}')
+
+
+class ClipNameAllocator:
+    """
+    Allocate numbered file names for the clips of images, such as
+    `image_clip3.png`. Each directory is scanned once for existing clips, and
+    the names are then allocated from a counter for each image.
+    """
+
+    def __init__(self):
+        # The highest clip number of each image, by directory.
+        self.directory_clip_numbers: dict[Path, dict[str, int]] = {}
+
+    def get_clip_numbers(self, directory_path: Path) -> dict[str, int]:
+        clip_numbers = self.directory_clip_numbers.get(directory_path)
+        if clip_numbers is not None:
+            return clip_numbers
+        clip_numbers = {}
+        clip_name_pattern = re.compile(r'(.+)_clip(\d+)(\.[^.]*)?')
+        try:
+            file_names = [entry.name for entry in os.scandir(directory_path)]
+        except OSError:
+            file_names = []
+        for file_name in file_names:
+            match = clip_name_pattern.fullmatch(file_name)
+            if not match:
+                continue
+            image_name = f'{match[1]}{match[3] or ""}'
+            clip_numbers[image_name] = max(clip_numbers.get(image_name, 0),
+                                           int(match[2]))
+        self.directory_clip_numbers[directory_path] = clip_numbers
+        return clip_numbers
+
+    def allocate(self, image_path: Path) -> Path:
+        clip_numbers = self.get_clip_numbers(image_path.parent)
+        clip_number = clip_numbers.get(image_path.name, 0) + 1
+        clip_path = get_clip_path(image_path, clip_number)
+        # Files can be created by other programs after the directory was
+        # scanned.
+        if clip_path.exists():
+            del self.directory_clip_numbers[image_path.parent]
+            return self.allocate(image_path)
+        clip_numbers[image_path.name] = clip_number
+        return clip_path
+
+    def release(self, image_path: Path, clip_path: Path):
+        """Reuse the name of a clip that was not saved, if it is the latest."""
+        clip_numbers = self.get_clip_numbers(image_path.parent)
+        clip_number = clip_numbers.get(image_path.name, 0)
+        if get_clip_path(image_path, clip_number) == clip_path:
+            clip_numbers[image_path.name] = clip_number - 1
+
+
+@dataclass
+class QueuedClip:
+    image_path: Path
+    # The region in the pixel coordinates of the image as stored.
+    clip_rect: QRect
+    clip_path: Path
+    json_tags: dict[str, list[str]]
+    # The cropped image, if it was already cropped.
+    clip: QImage | None = None
+
+
+def crop_image(image_path: Path, clip_rect: QRect,
+               decoded_image: DecodedImage | None = None) -> QImage:
+    """
+    Crop a region of an image, given in the pixel coordinates of the image as
+    stored. The clip is rotated based on the orientation tag of the image.
+    The decoded image is used if it has the full resolution, and otherwise
+    only the region is read from the file.
+    """
+    if (decoded_image is not None and decoded_image.is_full_resolution()
+            and not decoded_image.transformation):
+        return decoded_image.image.copy(clip_rect)
+    image_reader = QImageReader(str(image_path))
+    image_reader.setAutoTransform(True)
+    # The clip rectangle is applied before the image is rotated.
+    image_reader.setClipRect(clip_rect)
+    return image_reader.read()
+
+
+def crop_preview(decoded_image: DecodedImage, clip_rect: QRect) -> QImage:
+    """
+    Crop a region from an image that was decoded at a lower resolution,
+    without reading the file.
+    """
+    original_size = decoded_image.original_size
+    orientation_transform = get_orientation_transform(
+        decoded_image.transformation, original_size.width(),
+        original_size.height())
+    rotated_rect = orientation_transform.mapRect(QRectF(clip_rect))
+    rotated_size = orientation_transform.mapRect(
+        QRectF(QPointF(0, 0), original_size.toSizeF())).size()
+    scale = decoded_image.image.width() / rotated_size.width()
+    return decoded_image.image.copy(QRectF(
+        rotated_rect.topLeft() * scale,
+        rotated_rect.size() * scale).toAlignedRect())
+
+
+def crop_images(image_path: Path, clip_rects: list[QRect]) -> list[QImage]:
+    """
+    Crop several regions of an image. Formats that cannot read a region of
+    an image are decoded only once.
+    """
+    image_reader = QImageReader(str(image_path))
+    if (len(clip_rects) == 1 or image_reader.supportsOption(
+            QImageIOHandler.ImageOption.ClipRect)):
+        return [crop_image(image_path, clip_rect) for clip_rect in clip_rects]
+    transformation = image_reader.transformation()
+    image_reader.setAutoTransform(False)
+    image = image_reader.read()
+    if image.isNull():
+        return [image] * len(clip_rects)
+    clips = []
+    for clip_rect in clip_rects:
+        clip = image.copy(clip_rect)
+        if transformation:
+            clip = clip.transformed(get_orientation_transform(
+                transformation, clip.width(), clip.height()))
+        clips.append(clip)
+    return clips
+
+
+class ClipExtractor(QObject):
+    """Crop and save clips in worker threads."""
+    # The images of the saved clips, with their JSON tags. Emitted from the
+    # worker thread.
+    clips_saved = Signal(list)
+    # The path of the clip and the error message.
+    clip_saving_failed = Signal(Path, str)
+
+    def __init__(self):
+        super().__init__()
+        self.clip_name_allocator = ClipNameAllocator()
+        # A single worker saves the batches in order, and the clips of each
+        # batch are encoded in parallel.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.encoding_executor = ThreadPoolExecutor(
+            max_workers=min(MAX_ENCODING_WORKER_COUNT, os.cpu_count() or 1))
+        self.save_futures: list[Future] = []
+
+    def save_clips(self, queued_clips: list[QueuedClip]):
+        self.save_futures = [future for future in self.save_futures
+                             if not future.done()]
+        self.save_futures.append(self.executor.submit(self.write_clips,
+                                                      queued_clips))
+
+    def write_clips(self, queued_clips: list[QueuedClip]):
+        clips_by_image = defaultdict(list)
+        for queued_clip in queued_clips:
+            clips_by_image[queued_clip.image_path].append(queued_clip)
+        futures = [
+            self.encoding_executor.submit(self.write_image_clips, image_path,
+                                          image_clips)
+            for image_path, image_clips in clips_by_image.items()]
+        images = [image for future in futures for image in future.result()]
+        if images:
+            self.clips_saved.emit(images)
+
+    def write_image_clips(self, image_path: Path,
+                          queued_clips: list[QueuedClip]) -> list[Image]:
+        """Crop and save the clips of one image."""
+        uncropped_clips = [queued_clip for queued_clip in queued_clips
+                           if queued_clip.clip is None]
+        crops = crop_images(image_path, [queued_clip.clip_rect
+                                         for queued_clip in uncropped_clips])
+        for queued_clip, clip in zip(uncropped_clips, crops):
+            queued_clip.clip = clip
+        images = []
+        for queued_clip in queued_clips:
+            clip = queued_clip.clip
+            if clip.isNull() or not clip.save(str(queued_clip.clip_path)):
+                self.clip_saving_failed.emit(
+                    queued_clip.clip_path, 'The image could not be written.')
+                continue
+            # The JSON tags are written with the tags of the other images.
+            images.append(Image(queued_clip.clip_path,
+                                (clip.width(), clip.height()),
+                                json_tags=queued_clip.json_tags))
+        return images
+
+    def wait(self):
+        """Wait until all clips are saved."""
+        wait(self.save_futures)
+        self.save_futures = []
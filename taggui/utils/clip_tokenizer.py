@@ -0,0 +1,73 @@
+from collections import OrderedDict
+from pathlib import Path
+
+from utils.utils import get_resource_path
+
+TOKENIZER_DIRECTORY_PATH = Path('clip-vit-base-patch32')
+TOKENIZER_FILE_NAME = 'tokenizer.json'
+# The `<|startoftext|>` and `<|endoftext|>` tokens added to every text.
+SPECIAL_TOKEN_COUNT = 2
+TOKEN_COUNT_CACHE_SIZE = 1024
+
+_clip_tokenizer = None
+# Maps texts to their token counts, in order of least recent use.
+_token_count_cache: OrderedDict[str, int] = OrderedDict()
+
+
+def get_clip_tokenizer():
+    """
+    Get the CLIP tokenizer, loading it the first time it is needed.
+
+    The tokenizer is loaded with the `tokenizers` library, which imports much
+    faster than `transformers`. `transformers` is only used if `tokenizers` is
+    not installed or the tokenizer file is missing.
+    """
+    global _clip_tokenizer
+    if _clip_tokenizer is None:
+        tokenizer_directory_path = get_resource_path(TOKENIZER_DIRECTORY_PATH)
+        tokenizer_file_path = tokenizer_directory_path / TOKENIZER_FILE_NAME
+        try:
+            from tokenizers import Tokenizer
+        except ImportError:
+            Tokenizer = None
+        if Tokenizer is not None and tokenizer_file_path.is_file():
+            _clip_tokenizer = Tokenizer.from_file(str(tokenizer_file_path))
+        else:
+            from transformers import AutoTokenizer
+            _clip_tokenizer = AutoTokenizer.from_pretrained(
+                tokenizer_directory_path)
+    return _clip_tokenizer
+
+
+def tokenize_texts(texts: list[str]) -> list[list[int]]:
+    """Get the token IDs of texts, including the special tokens."""
+    tokenizer = get_clip_tokenizer()
+    if hasattr(tokenizer, 'encode_batch'):
+        return [encoding.ids for encoding in tokenizer.encode_batch(texts)]
+    return tokenizer(texts).input_ids
+
+
+def count_clip_tokens_batch(texts: list[str]) -> list[int]:
+    """
+    Count the CLIP tokens in texts, not including the special tokens. Texts
+    that are not cached are tokenized together, in parallel.
+    """
+    token_counts = {text: _token_count_cache[text] for text in texts
+                    if text in _token_count_cache}
+    uncached_texts = list({text: None for text in texts
+                           if text not in token_counts})
+    if uncached_texts:
+        for text, token_ids in zip(uncached_texts,
+                                   tokenize_texts(uncached_texts)):
+            token_counts[text] = len(token_ids) - SPECIAL_TOKEN_COUNT
+    for text in token_counts:
+        _token_count_cache[text] = token_counts[text]
+        _token_count_cache.move_to_end(text)
+    while len(_token_count_cache) > TOKEN_COUNT_CACHE_SIZE:
+        _token_count_cache.popitem(last=False)
+    return [token_counts[text] for text in texts]
+
+
+def count_clip_tokens(text: str) -> int:
+    """Count the CLIP tokens in a text, not including the special tokens."""
+    return count_clip_tokens_batch([text])[0]
@@ -24,3 +24,15 @@ class CaptionPosition(str, Enum):
 class CaptionDevice(str, Enum):
     GPU = 'GPU if available'
     CPU = 'CPU'
+
+
+class TagSortingMode(str, Enum):
+    SCORING = 'Label scoring'
+    GENERATION = 'Generation'
+
+
+class JsonTagOperation(str, Enum):
+    ADD = 'Add tags'
+    REMOVE = 'Remove tags'
+    RENAME = 'Rename tags'
+    MOVE_CATEGORY = 'Move tags to category'
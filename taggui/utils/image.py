@@ -3,10 +3,15 @@ from pathlib import Path
 
 from PySide6.QtGui import QIcon
 
+from utils.json_tags import get_empty_json_tags
+
 
 @dataclass
 class Image:
     path: Path
     dimensions: tuple[int, int] | None
     tags: list[str] = field(default_factory=list)
+    # The categorized tags from the `.json` sidecar file.
+    json_tags: dict[str, list[str]] = field(
+        default_factory=get_empty_json_tags)
     thumbnail: QIcon | None = None
@@ -0,0 +1,248 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+from PySide6.QtCore import (QObject, QRunnable, QSize, QThreadPool, Qt,
+                            Signal, Slot)
+from PySide6.QtGui import QImage, QImageIOHandler, QImageReader, QTransform
+
+from utils.settings import DEFAULT_SETTINGS, get_settings
+
+BYTES_PER_MEGABYTE = 1024 ** 2
+# The number of images before and after the current image that are decoded
+# in advance.
+PREFETCH_IMAGE_COUNT = 3
+# Leave some cores free for the user interface and auto-captioning.
+MAX_DECODE_THREAD_COUNT = 2
+
+
+def get_modification_time(path: Path) -> int | None:
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_orientation_transform(
+        transformation: QImageIOHandler.Transformation, width: int,
+        height: int) -> QTransform:
+    """
+    Get the transform from the pixel coordinates of an image as stored to
+    its coordinates after it is rotated based on its orientation tag.
+    """
+    transform = QTransform()
+    # Qt mirrors and flips the image before rotating it.
+    if transformation & QImageIOHandler.Transformation.TransformationRotate90:
+        transform.translate(height, 0)
+        transform.rotate(90)
+    if transformation & QImageIOHandler.Transformation.TransformationFlip:
+        transform.translate(0, height)
+        transform.scale(1, -1)
+    if transformation & QImageIOHandler.Transformation.TransformationMirror:
+        transform.translate(width, 0)
+        transform.scale(-1, 1)
+    return transform
+
+
+@dataclass
+class DecodedImage:
+    image: QImage
+    # The size of the full image as stored, before it is rotated based on its
+    # orientation tag.
+    original_size: QSize
+    transformation: QImageIOHandler.Transformation
+
+    def is_full_resolution(self) -> bool:
+        # The image can be rotated, so compare the number of pixels.
+        return (self.image.width() * self.image.height()
+                == self.original_size.width() * self.original_size.height())
+
+
+def read_display_image(image_path: Path,
+                       max_size: QSize | None) -> DecodedImage:
+    """
+    Decode an image scaled down to fit in `max_size`, keeping its aspect
+    ratio, or at full resolution if `max_size` is `None`. The image is null
+    if it cannot be read.
+    """
+    image_reader = QImageReader(str(image_path))
+    image_reader.setAutoTransform(True)
+    image_size = image_reader.size()
+    transformation = image_reader.transformation()
+    if max_size is not None and image_size.isValid():
+        # The scaled size is applied before the image is rotated based on its
+        # orientation tag.
+        if (transformation
+                & QImageIOHandler.Transformation.TransformationRotate90):
+            max_size = max_size.transposed()
+        if (image_size.width() > max_size.width()
+                or image_size.height() > max_size.height()):
+            # Some formats, such as JPEG, can decode directly at a lower
+            # resolution, which is much faster than decoding the full image.
+            image_reader.setScaledSize(image_size.scaled(
+                max_size, Qt.AspectRatioMode.KeepAspectRatio))
+    image = image_reader.read()
+    if not image_size.isValid():
+        image_size = image.size()
+    return DecodedImage(image, image_size, transformation)
+
+
+@dataclass
+class CachedImage:
+    decoded_image: DecodedImage
+    # The modification time of the image file when it was decoded, used to
+    # detect files that were changed since.
+    modification_time: int | None
+    max_size: QSize
+
+
+class ImageCache:
+    """
+    Least recently used cache of decoded images, bounded by the total number
+    of bytes of the images. The size limit is set in the settings.
+    """
+
+    def __init__(self):
+        self.cached_images: OrderedDict[Path, CachedImage] = OrderedDict()
+        self.byte_count = 0
+        # The cache is filled from the decoding threads.
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_size_limit() -> int:
+        settings = get_settings()
+        cache_size_megabytes = settings.value(
+            'image_viewer_cache_size',
+            defaultValue=DEFAULT_SETTINGS['image_viewer_cache_size'],
+            type=int)
+        return cache_size_megabytes * BYTES_PER_MEGABYTE
+
+    def get(self, image_path: Path,
+            max_size: QSize) -> DecodedImage | None:
+        """
+        Get a cached image, or `None` if it is not cached, was decoded for a
+        different size, or was changed on disk since it was decoded.
+        """
+        with self.lock:
+            cached_image = self.cached_images.get(image_path)
+        if (cached_image is None or cached_image.max_size != max_size
+                or cached_image.modification_time
+                != get_modification_time(image_path)):
+            return None
+        with self.lock:
+            if image_path in self.cached_images:
+                self.cached_images.move_to_end(image_path)
+        return cached_image.decoded_image
+
+    def put(self, image_path: Path, cached_image: CachedImage):
+        size_limit = self.get_size_limit()
+        image_byte_count = cached_image.decoded_image.image.sizeInBytes()
+        with self.lock:
+            self.remove(image_path)
+            if image_byte_count > size_limit:
+                return
+            self.cached_images[image_path] = cached_image
+            self.byte_count += image_byte_count
+            # Evict the least recently used images.
+            while self.byte_count > size_limit:
+                self.remove(next(iter(self.cached_images)))
+
+    def remove(self, image_path: Path):
+        """Remove an image from the cache. The lock must be held."""
+        cached_image = self.cached_images.pop(image_path, None)
+        if cached_image is not None:
+            self.byte_count -= (
+                cached_image.decoded_image.image.sizeInBytes())
+
+    def clear(self):
+        with self.lock:
+            self.cached_images.clear()
+            self.byte_count = 0
+
+
+class DecodeImageRunnable(QRunnable):
+    def __init__(self, prefetcher: 'ImagePrefetcher', image_path: Path,
+                 max_size: QSize):
+        super().__init__()
+        self.prefetcher = prefetcher
+        self.image_path = image_path
+        self.max_size = max_size
+
+    def run(self):
+        # Skip images that are no longer near the current image, which happens
+        # when the user navigates quickly.
+        if self.prefetcher.is_wanted(self.image_path):
+            modification_time = get_modification_time(self.image_path)
+            decoded_image = read_display_image(self.image_path,
+                                               self.max_size)
+            if not decoded_image.image.isNull():
+                self.prefetcher.image_cache.put(
+                    self.image_path, CachedImage(
+                        decoded_image, modification_time, self.max_size))
+        self.prefetcher.image_decoded.emit(self.image_path)
+
+
+class ImagePrefetcher(QObject):
+    """
+    Decode the images around the current image in background threads, so
+    that they can be shown without waiting when navigating.
+    """
+    # Emitted from the decoding threads when an image was decoded or skipped.
+    image_decoded = Signal(Path)
+
+    def __init__(self):
+        super().__init__()
+        self.image_cache = ImageCache()
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(
+            min(MAX_DECODE_THREAD_COUNT, QThreadPool.globalInstance()
+                .maxThreadCount()))
+        # Images that are queued or being decoded, handled in the main thread.
+        self.decoding_paths: set[Path] = set()
+        # Images that should still be decoded, read from the decoding threads.
+        self.wanted_paths: set[Path] = set()
+        self.wanted_paths_lock = threading.Lock()
+        self.image_decoded.connect(self.handle_image_decoded)
+
+    @Slot(Path)
+    def handle_image_decoded(self, image_path: Path):
+        self.decoding_paths.discard(image_path)
+
+    def is_wanted(self, image_path: Path) -> bool:
+        with self.wanted_paths_lock:
+            return image_path in self.wanted_paths
+
+    def is_decoding(self, image_path: Path) -> bool:
+        return image_path in self.decoding_paths
+
+    def get_image(self, image_path: Path, max_size: QSize) -> DecodedImage:
+        """Get an image from the cache, decoding it if it is not cached."""
+        decoded_image = self.image_cache.get(image_path, max_size)
+        if decoded_image is not None:
+            return decoded_image
+        modification_time = get_modification_time(image_path)
+        decoded_image = read_display_image(image_path, max_size)
+        if not decoded_image.image.isNull():
+            self.image_cache.put(image_path, CachedImage(
+                decoded_image, modification_time, max_size))
+        return decoded_image
+
+    def prefetch(self, image_paths: list[Path], max_size: QSize):
+        """
+        Decode images in the background, in the order of `image_paths`. Any
+        images from previous calls that have not been decoded yet are
+        skipped.
+        """
+        with self.wanted_paths_lock:
+            self.wanted_paths = set(image_paths)
+        if self.image_cache.get_size_limit() == 0:
+            return
+        for priority, image_path in enumerate(reversed(image_paths)):
+            if (image_path in self.decoding_paths
+                    or self.image_cache.get(image_path, max_size)
+                    is not None):
+                continue
+            self.decoding_paths.add(image_path)
+            self.thread_pool.start(
+                DecodeImageRunnable(self, image_path, max_size), priority)
@@ -0,0 +1,237 @@
+import json
+import os
+import sys
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import replace
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from PySide6.QtCore import QObject, QTimer, Signal, Slot
+
+from utils.utils import write_file_atomically
+
+if TYPE_CHECKING:
+    from utils.image import Image
+
+# The categories of JSON tags, as stored in the `.json` sidecar files.
+JSON_TAG_CATEGORIES = ('characters', 'settings', 'actions')
+# Delay before pending JSON tags are written, so that consecutive edits are
+# written together.
+WRITE_DELAY_MS = 500
+MAX_READ_WORKER_COUNT = 16
+
+
+def get_empty_json_tags() -> dict[str, list[str]]:
+    return {category: [] for category in JSON_TAG_CATEGORIES}
+
+
+def copy_json_tags(json_tags: dict[str, list[str]]) -> dict[str, list[str]]:
+    return {category: list(json_tags.get(category, []))
+            for category in JSON_TAG_CATEGORIES}
+
+
+def get_json_path(image_path: Path) -> Path:
+    return image_path.with_suffix('.json')
+
+
+def get_modification_time(path: Path) -> int | None:
+    """Get the modification time of a file, or `None` if it does not exist."""
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def read_json_tags(
+        image_path: Path) -> tuple[dict[str, list[str]], int | None]:
+    """
+    Read the JSON tags of an image from its sidecar file, and the modification
+    time of the file. Return empty tags if the file does not exist or cannot
+    be read, and no modification time if it does not exist.
+    """
+    json_path = get_json_path(image_path)
+    try:
+        with json_path.open(encoding='utf-8') as json_file:
+            modification_time = os.fstat(json_file.fileno()).st_mtime_ns
+            data = json.loads(json_file.read())
+    except FileNotFoundError:
+        return get_empty_json_tags(), None
+    except (OSError, ValueError) as exception:
+        print(f'Error reading JSON tags from {json_path}: {exception}',
+              file=sys.stderr)
+        return get_empty_json_tags(), get_modification_time(json_path)
+    if not isinstance(data, dict):
+        return get_empty_json_tags(), modification_time
+    return ({category: [str(tag) for tag in data.get(category, [])]
+             for category in JSON_TAG_CATEGORIES}, modification_time)
+
+
+def read_json_tags_in_parallel(
+        image_paths: list[Path]
+) -> list[tuple[dict[str, list[str]], int | None]]:
+    """
+    Read the JSON tags of many images and the modification times of their
+    sidecar files using several threads.
+    """
+    if not image_paths:
+        return []
+    worker_count = min(MAX_READ_WORKER_COUNT, len(image_paths))
+    with ThreadPoolExecutor(max_workers=worker_count) as executor:
+        return list(executor.map(read_json_tags, image_paths))
+
+
+def write_json_tags(image_path: Path, json_tags: dict[str, list[str]]):
+    """Write the JSON tags of an image to its sidecar file atomically."""
+    # Tags are deduplicated and sorted in the file.
+    formatted_tags = {category: sorted(set(json_tags.get(category, [])))
+                      for category in JSON_TAG_CATEGORIES}
+    write_file_atomically(
+        get_json_path(image_path),
+        json.dumps(formatted_tags, indent=2, ensure_ascii=False))
+
+
+# The following functions return edited copies of JSON tags, leaving the
+# original JSON tags unchanged.
+def with_added_json_tags(
+        json_tags: dict[str, list[str]],
+        category_tags: dict[str, list[str]]) -> dict[str, list[str]]:
+    """Add tags to categories, skipping tags that are already present."""
+    edited_json_tags = copy_json_tags(json_tags)
+    for category, tags in category_tags.items():
+        for tag in tags:
+            if tag not in edited_json_tags[category]:
+                edited_json_tags[category].append(tag)
+    return edited_json_tags
+
+
+def with_removed_json_tags(json_tags: dict[str, list[str]], category: str,
+                           tags: list[str]) -> dict[str, list[str]]:
+    tags = set(tags)
+    return {**json_tags,
+            category: [tag for tag in json_tags.get(category, [])
+                       if tag not in tags]}
+
+
+def with_renamed_json_tags(json_tags: dict[str, list[str]], category: str,
+                           old_tags: list[str],
+                           new_tag: str) -> dict[str, list[str]]:
+    """Rename tags of a category, merging them if they become duplicates."""
+    old_tags = set(old_tags)
+    renamed_tags = [new_tag if tag in old_tags else tag
+                    for tag in json_tags.get(category, [])]
+    return {**json_tags, category: list(dict.fromkeys(renamed_tags))}
+
+
+def with_moved_json_tags(json_tags: dict[str, list[str]], category: str,
+                         tags: list[str],
+                         new_category: str) -> dict[str, list[str]]:
+    """Move tags from one category to another."""
+    moved_tags = [tag for tag in json_tags.get(category, []) if tag in tags]
+    if not moved_tags or new_category == category:
+        return json_tags
+    edited_json_tags = with_removed_json_tags(json_tags, category, moved_tags)
+    return with_added_json_tags(edited_json_tags, {new_category: moved_tags})
+
+
+def get_display_tags(json_tags: dict[str, list[str]]) -> list[str]:
+    """
+    Get the tags in the form shown in the JSON tags editor, such as
+    `character:woman`.
+    """
+    # The display prefixes are the singular forms of the categories.
+    return [f'{category[:-1]}:{tag}' for category in JSON_TAG_CATEGORIES
+            for tag in json_tags.get(category, [])]
+
+
+def parse_display_tag(display_tag: str) -> tuple[str, str] | None:
+    """
+    Get the category and the tag from a tag in the form shown in the JSON tags
+    editor. Return `None` if the tag does not have a valid category.
+    """
+    prefix, separator, tag = display_tag.partition(':')
+    category = f'{prefix.strip()}s'
+    if not separator or category not in JSON_TAG_CATEGORIES:
+        return None
+    return category, tag.strip()
+
+
+class JsonTagsPersister(QObject):
+    """
+    Write JSON tags to the tag storage in batches, in a worker thread. Changes
+    are written after a short delay, and only the latest tags of each image
+    are written.
+    """
+    # The paths of images whose JSON tags were not written because they were
+    # changed by another program. Emitted from the worker thread.
+    write_conflicted = Signal(list)
+
+    def __init__(self):
+        super().__init__()
+        # The `TagStorage` of the loaded directory.
+        self.tag_storage = None
+        # Maps image paths to the images whose JSON tags need to be written.
+        self.pending_images: dict[Path, 'Image'] = {}
+        self.write_timer = QTimer(self)
+        self.write_timer.setSingleShot(True)
+        self.write_timer.setInterval(WRITE_DELAY_MS)
+        self.write_timer.timeout.connect(self.flush)
+        # A single worker keeps the batches in order.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.write_futures: list[Future] = []
+        # Images whose JSON tags are written even if they were changed by
+        # another program.
+        self.overwritten_paths: set[Path] = set()
+
+    def schedule_write(self, image: 'Image'):
+        self.pending_images[image.path] = image
+        self.write_timer.start()
+
+    def schedule_overwrite(self, images: list['Image']):
+        """Write the JSON tags of images even if they have conflicts."""
+        for image in images:
+            self.overwritten_paths.add(image.path)
+            self.schedule_write(image)
+
+    def discard(self, paths: set[Path]):
+        """Do not write the pending JSON tags of images, such as deleted ones."""
+        for path in paths:
+            self.pending_images.pop(path, None)
+        self.overwritten_paths -= paths
+
+    @Slot()
+    def flush(self):
+        """Start writing all pending JSON tags in the worker thread."""
+        self.write_timer.stop()
+        # Copy the tags, which can be changed in the main thread while they
+        # are being written. JSON tags are always replaced instead of modified
+        # in place, so they do not need to be copied.
+        images = [replace(image, tags=image.tags.copy())
+                  for image in self.pending_images.values()]
+        overwritten_paths = self.overwritten_paths.intersection(
+            self.pending_images)
+        self.overwritten_paths -= overwritten_paths
+        self.pending_images = {}
+        if not images or self.tag_storage is None:
+            return
+        self.write_futures = [future for future in self.write_futures
+                              if not future.done()]
+        self.write_futures.append(self.executor.submit(
+            self.write_json_tags, self.tag_storage, images,
+            overwritten_paths))
+
+    def write_json_tags(self, tag_storage, images: list['Image'],
+                        overwritten_paths: set[Path]):
+        try:
+            conflicted_paths = tag_storage.write_json_tags(images,
+                                                           overwritten_paths)
+        except OSError as exception:
+            print(f'Error writing JSON tags: {exception}', file=sys.stderr)
+            return
+        if conflicted_paths:
+            self.write_conflicted.emit(conflicted_paths)
+
+    def wait(self):
+        """Write all pending JSON tags and wait until they are written."""
+        self.flush()
+        wait(self.write_futures)
+        self.write_futures = []
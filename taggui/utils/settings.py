@@ -9,7 +9,14 @@ DEFAULT_SETTINGS = {
     'tag_separator': ',',
     'insert_space_after_tag_separator': True,
     'autocomplete_tags': True,
-    'models_directory_path': ''
+    'models_directory_path': '',
+    # The memory budget in GB for keeping auto-captioning models loaded. 0
+    # keeps only the most recently used model loaded.
+    'captioning_model_memory_budget': 0,
+    'tag_sorting_mode': 'Label scoring',
+    # The memory limit in MB for decoded images in the image viewer. 0
+    # disables prefetching.
+    'image_viewer_cache_size': 512
 }
 
 
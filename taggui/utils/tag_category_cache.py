@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+from utils.utils import get_app_data_directory_path
+
+CACHE_FILE_NAME = 'tag_category_cache.json'
+CACHE_VERSION = 1
+CATEGORIES = ('characters', 'settings', 'actions')
+
+
+def normalize_tag(tag: str) -> str:
+    return ' '.join(tag.lower().split())
+
+
+class TagCategoryCache:
+    """
+    A persistent mapping from tags to the categories `characters`, `settings`
+    and `actions`.
+
+    Categories come from three sources, in order of precedence: corrections
+    made by the user, categories seeded from existing JSON tag files, and
+    categories predicted by a tag sorting model. Model predictions are stored
+    separately for each model and sorting mode, so that changing either does
+    not reuse stale predictions.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.corrections: dict[str, str] = {}
+        self.seeded_categories: dict[str, str] = {}
+        # Maps model keys to mappings from tags to categories.
+        self.model_categories: dict[str, dict[str, str]] = {}
+        self.read()
+
+    def read(self):
+        if not self.path.is_file():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, json.JSONDecodeError) as exception:
+            print(f'Error reading tag category cache: {exception}')
+            return
+        if data.get('version') != CACHE_VERSION:
+            return
+        self.corrections = data.get('corrections', {})
+        self.seeded_categories = data.get('seeded_categories', {})
+        self.model_categories = data.get('model_categories', {})
+
+    def write(self):
+        with self.lock:
+            data = {
+                'version': CACHE_VERSION,
+                'corrections': self.corrections,
+                'seeded_categories': self.seeded_categories,
+                'model_categories': self.model_categories
+            }
+            text = json.dumps(data, indent=2, ensure_ascii=False)
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file first so that a crash does not leave
+            # a truncated cache.
+            temporary_path = self.path.with_suffix('.tmp')
+            temporary_path.write_text(text, encoding='utf-8')
+            os.replace(temporary_path, self.path)
+        except OSError as exception:
+            print(f'Error writing tag category cache: {exception}')
+
+    def get_category(self, tag: str,
+                     model_key: str | None = None) -> str | None:
+        tag = normalize_tag(tag)
+        with self.lock:
+            category = (self.corrections.get(tag)
+                        or self.seeded_categories.get(tag))
+            if category is None and model_key is not None:
+                category = self.model_categories.get(model_key, {}).get(tag)
+        return category
+
+    def set_model_categories(self, model_key: str,
+                             categories: dict[str, str]):
+        """Store the categories predicted by a model for some tags."""
+        if not categories:
+            return
+        with self.lock:
+            model_categories = self.model_categories.setdefault(model_key, {})
+            for tag, category in categories.items():
+                model_categories[normalize_tag(tag)] = category
+        self.write()
+
+    def set_corrections(self, categories: dict[str, str]):
+        """
+        Store categories chosen by the user, which override the categories
+        from every other source.
+        """
+        changed = False
+        with self.lock:
+            for tag, category in categories.items():
+                if category not in CATEGORIES:
+                    continue
+                tag = normalize_tag(tag)
+                if tag and self.corrections.get(tag) != category:
+                    self.corrections[tag] = category
+                    changed = True
+        if changed:
+            self.write()
+
+    def seed(self, json_tags_list: list[dict[str, list[str]]]) -> int:
+        """
+        Seed the cache with the categories in JSON tags. Tags that appear in
+        more than one category get the category they appear in most often.
+        Return the number of seeded tags.
+        """
+        category_counts: dict[str, dict[str, int]] = {}
+        for json_tags in json_tags_list:
+            for category in CATEGORIES:
+                for tag in json_tags.get(category, []):
+                    tag = normalize_tag(tag)
+                    if not tag:
+                        continue
+                    counts = category_counts.setdefault(tag, {})
+                    counts[category] = counts.get(category, 0) + 1
+        with self.lock:
+            for tag, counts in category_counts.items():
+                self.seeded_categories[tag] = max(counts, key=counts.get)
+        self.write()
+        return len(category_counts)
+
+
+_tag_category_cache = None
+_tag_category_cache_lock = threading.Lock()
+
+
+def get_tag_category_cache() -> TagCategoryCache:
+    """Get the tag category cache that is shared by the whole application."""
+    global _tag_category_cache
+    with _tag_category_cache_lock:
+        if _tag_category_cache is None:
+            _tag_category_cache = TagCategoryCache(
+                get_app_data_directory_path() / CACHE_FILE_NAME)
+        return _tag_category_cache
@@ -11,17 +11,45 @@ from huggingface_hub.utils import LocalTokenNotFoundError
 from huggingface_hub import snapshot_download
 from transformers import AutoModelForSeq2SeqLM, AutoTokenizer  # Change from AutoModelForCausalLM
 
-
-
+from utils.enums import TagSortingMode
+from utils.settings import DEFAULT_SETTINGS, get_settings
+from utils.tag_category_cache import get_tag_category_cache
+
+# Generation arguments shared by the per-tag and batched classification paths
+GENERATION_ARGUMENTS = {
+    "max_new_tokens": 10,
+    "num_beams": 2,
+    "temperature": 0.3,
+    "do_sample": False,
+    "early_stopping": True
+}
+# Maximum number of prompt tokens (times the number of beams) in one batch
+DEFAULT_MAX_BATCH_TOKENS = 16384
+LIVING_THING_WORDS = ['man', 'woman', 'boy', 'girl', 'person', 'dog', 'cat']
+# Labels scored in scoring mode and the categories they map to
+CATEGORY_LABELS = {
+    "CHARACTER": "characters",
+    "SETTING": "settings",
+    "ACTION": "actions"
+}
 
 
 class TagSorter(QObject):
-    # Make it a QObject to use Qt signals
-    sorting_completed = Signal(dict)
-    sorting_failed = Signal(str)  # For error messages
-
-    def __init__(self, local_model_path: str = None, hf_token: str = None):
+    # Make it a QObject to use Qt signals. The signals are emitted by
+    # `TagSortingService` with the ID of the request.
+    sorting_completed = Signal(int, dict)
+    sorting_failed = Signal(int, str)  # For error messages
+
+    def __init__(self, local_model_path: str = None, hf_token: str = None,
+                 max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS,
+                 verbose: bool = False):
         super().__init__()
+        self.max_batch_tokens = max_batch_tokens
+        self.verbose = verbose
+        # The tags that could not be classified by the last `sort_tags()` call
+        self.failed_tags: List[str] = []
+        # Set from another thread to stop classifying before the next batch
+        self.is_canceled = False
 
         # Convert string path to Path object
         if local_model_path:
@@ -30,9 +58,6 @@ class TagSorter(QObject):
         self.device = self._setup_device()
         print(f"Using device: {self.device}")
 
-        # Try to authenticate with HuggingFace
-        self._authenticate(hf_token)
-
         # Use FLAN-T5-small instead
         self.model_id = "google/flan-t5-large"  # Much smaller and more focused model
 
@@ -46,6 +71,9 @@ class TagSorter(QObject):
                     missing = [f for f, exists in verification_result.items() if not exists]
                     print(f"Missing required files: {missing}")
                     print(f"Falling back to HuggingFace: {self.model_id}")
+            if self.model_id != str(local_model_path):
+                # A token is only needed to download the model
+                self._authenticate(hf_token)
 
             print(f"Loading model from: {self.model_id}")
 
@@ -79,8 +107,9 @@ class TagSorter(QObject):
             print(f"Error loading model: {e}")
             raise
 
-    def verify_model_files(self, model_path: Path) -> Dict[str, bool]:
-        """Verify all required model files exist"""
+    @staticmethod
+    def verify_model_files(model_path: Path) -> Dict[str, bool]:
+        """Verify all required model files exist without loading the model"""
         if not isinstance(model_path, Path):
             model_path = Path(model_path)
 
@@ -156,62 +185,235 @@ class TagSorter(QObject):
             traceback.print_exc()
             return False
 
-    def sort_tags(self, tags: List[str]) -> Dict[str, List[str]]:
+    def sort_tags(self, tags: List[str], batched: bool = True,
+                  mode: TagSortingMode | None = None,
+                  use_cache: bool = True) -> Dict[str, List[str]]:
+        """Classify tags into characters, settings and actions.
+
+        `mode` defaults to the tag sorting mode in the settings. In generation
+        mode, all tags are classified with batched generation calls unless
+        `batched` is False, in which case one call is run per tag.
+
+        With `use_cache`, tags found in the tag category cache are not
+        classified again, and new classifications are added to the cache.
+
+        Tags that could not be classified are left out of the result and
+        listed in `failed_tags`.
+        """
+        self.failed_tags = []
         result = {
             "characters": [],
             "settings": [],
             "actions": []
         }
+        if not tags:
+            return result
+
+        if mode is None:
+            mode = get_settings().value(
+                "tag_sorting_mode",
+                defaultValue=DEFAULT_SETTINGS["tag_sorting_mode"], type=str)
+        self._log("\nStarting tag classification:")
+        categories = {}
+        tags_to_classify = tags
+        if use_cache:
+            cache = get_tag_category_cache()
+            model_key = self.get_cache_model_key(mode)
+            for tag in tags:
+                category = cache.get_category(tag, model_key)
+                if category is not None:
+                    categories[tag] = category
+                    self._log(f"Cached as {category}: {tag}")
+            tags_to_classify = [tag for tag in tags if tag not in categories]
+
+        new_categories = self._classify(tags_to_classify, batched, mode)
+        self.failed_tags = [tag for tag in tags_to_classify
+                            if tag not in new_categories]
+        if use_cache:
+            cache.set_model_categories(model_key, new_categories)
+        categories.update(new_categories)
+        # Keep the tags in their original order
+        for tag in tags:
+            if tag in categories:
+                result[categories[tag]].append(tag)
+
+        return result
 
-        print("\nStarting tag classification:")
+    def get_cache_model_key(self, mode: TagSortingMode) -> str:
+        """Get the key that predictions of the model are cached under"""
+        return f"{Path(self.model_id).name}|{TagSortingMode(mode).name}"
+
+    def _classify(self, tags: List[str], batched: bool,
+                  mode: TagSortingMode) -> Dict[str, str]:
+        """Map each tag that could be classified to its category"""
+        if not tags:
+            return {}
+        if mode == TagSortingMode.SCORING:
+            categories = self._score_categories(tags)
+            for tag, category in zip(tags, categories):
+                if category is not None:
+                    self._log(f"Scored as {category}: {tag}")
+            return {tag: category for tag, category in zip(tags, categories)
+                    if category is not None}
+        if batched:
+            responses = self._generate_responses_batched(tags)
+        else:
+            responses = self._generate_responses_per_tag(tags)
+        # The response is None if the tag could not be classified
+        return {tag: self._categorize(tag, response)
+                for tag, response in zip(tags, responses)
+                if response is not None}
+
+    def _log(self, message: str):
+        if self.verbose:
+            print(message)
+
+    def _generate_responses_per_tag(self, tags: List[str]) -> List[str | None]:
+        """Run one generation call for each tag"""
+        responses = []
         for tag in tags:
+            if self.is_canceled:
+                responses.append(None)
+                continue
             try:
                 prompt = self._create_prompt(tag)
                 inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
-
-                outputs = self.model.generate(
-                    **inputs,
-                    max_new_tokens=10,
-                    num_beams=2,  # Increased for better results
-                    temperature=0.3,  # Slightly increased for more confident answers
-                    do_sample=False,
-                    early_stopping=True
-                )
-
-                response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-                print(f"\nClassifying tag: '{tag}'")
-                print(f"Model response: '{response}'")
-
-                # Clean and normalize response
-                response = response.upper().strip()
-
-                if "CHARACTER" in response:
-                    result["characters"].append(tag)
-                    print(f"Classified as CHARACTER: {tag}")
-                elif "SETTING" in response:
-                    result["settings"].append(tag)
-                    print(f"Classified as SETTING: {tag}")
-                elif "ACTION" in response:
-                    result["actions"].append(tag)
-                    print(f"Classified as ACTION: {tag}")
-                else:
-                    # Enhanced fallback logic
-                    if self._looks_like_verb(tag):
-                        result["actions"].append(tag)
-                        print(f"Fallback - verb pattern detected: {tag}")
-                    elif any(living_thing in tag.lower() for living_thing in
-                             ['man', 'woman', 'boy', 'girl', 'person', 'dog', 'cat']):
-                        result["characters"].append(tag)
-                        print(f"Fallback - living entity pattern detected: {tag}")
-                    else:
-                        result["settings"].append(tag)
-                        print(f"Fallback - defaulting to setting: {tag}")
-
+                outputs = self.model.generate(**inputs, **GENERATION_ARGUMENTS)
+                responses.append(self.tokenizer.decode(outputs[0], skip_special_tokens=True))
             except Exception as e:
                 print(f"Error processing tag '{tag}': {str(e)}")
+                responses.append(None)
+        return responses
+
+    def _get_batches(self, prompts: List[str], beam_count: int) -> List[List[int]]:
+        """Group prompt indices into batches that fit the token budget.
+
+        Prompts are sorted by length so that little padding is needed.
+        """
+        lengths = [len(input_ids) for input_ids in self.tokenizer(prompts).input_ids]
+        batches = []
+        batch = []
+        for index in sorted(range(len(prompts)), key=lambda i: lengths[i]):
+            # The prompts are sorted, so the current prompt is the longest
+            padded_token_count = (len(batch) + 1) * lengths[index] * beam_count
+            if batch and padded_token_count > self.max_batch_tokens:
+                batches.append(batch)
+                batch = []
+            batch.append(index)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _generate_responses_batched(self, tags: List[str]) -> List[str | None]:
+        """Run one padded generation call for each batch of tags"""
+        prompts = [self._create_prompt(tag) for tag in tags]
+        responses = [None] * len(tags)
+        for batch in self._get_batches(prompts, GENERATION_ARGUMENTS["num_beams"]):
+            if self.is_canceled:
+                break
+            try:
+                inputs = self.tokenizer([prompts[index] for index in batch],
+                                        padding=True, return_tensors="pt").to(self.device)
+                outputs = self.model.generate(**inputs, **GENERATION_ARGUMENTS)
+                batch_responses = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+            except Exception as e:
+                print(f"Error processing batch of {len(batch)} tags, "
+                      f"falling back to one tag at a time: {str(e)}")
+                batch_responses = self._generate_responses_per_tag(
+                    [tags[index] for index in batch])
+            for index, response in zip(batch, batch_responses):
+                responses[index] = response
+        return responses
+
+    def _score_categories(self, tags: List[str]) -> List[str | None]:
+        """Pick the category whose label is most likely given each prompt.
+
+        The encoder runs once per batch of prompts, and only the short label
+        continuations are scored by the decoder, so the output is always one
+        of the categories.
+        """
+        prompts = [self._create_prompt(tag) for tag in tags]
+        categories = [None] * len(tags)
+        # The labels include the end-of-sequence token so that a label is not
+        # scored as a prefix of a longer answer.
+        label_ids = [torch.tensor(input_ids) for input_ids
+                     in self.tokenizer(list(CATEGORY_LABELS)).input_ids]
+        # Every label is scored against each prompt in the batch.
+        for batch in self._get_batches(prompts, len(CATEGORY_LABELS)):
+            if self.is_canceled:
+                break
+            try:
+                batch_categories = self._score_batch(
+                    [prompts[index] for index in batch], label_ids)
+            except Exception as e:
+                print(f"Error scoring batch of {len(batch)} tags, "
+                      f"falling back to one tag at a time: {str(e)}")
+                batch_categories = self._score_categories_per_tag(
+                    [tags[index] for index in batch], label_ids)
+            for index, category in zip(batch, batch_categories):
+                categories[index] = category
+        return categories
+
+    def _score_categories_per_tag(self, tags: List[str],
+                                  label_ids: List[torch.Tensor]
+                                  ) -> List[str | None]:
+        """Score the labels for each tag separately"""
+        categories = []
+        for tag in tags:
+            if self.is_canceled:
+                categories.append(None)
                 continue
-
-        return result
+            try:
+                categories.extend(self._score_batch(
+                    [self._create_prompt(tag)], label_ids))
+            except Exception as e:
+                print(f"Error scoring tag '{tag}': {str(e)}")
+                categories.append(None)
+        return categories
+
+    def _score_batch(self, prompts: List[str],
+                     label_ids: List[torch.Tensor]) -> List[str]:
+        """Get the category with the most likely label for each prompt"""
+        inputs = self.tokenizer(prompts, padding=True,
+                                return_tensors="pt").to(self.device)
+        with torch.inference_mode():
+            encoder_outputs = self.model.get_encoder()(**inputs)
+            label_scores = []
+            for ids in label_ids:
+                labels = ids.to(self.model.device).repeat(len(prompts), 1)
+                logits = self.model(encoder_outputs=encoder_outputs,
+                                    attention_mask=inputs.attention_mask,
+                                    labels=labels).logits
+                log_probabilities = torch.log_softmax(logits.float(), dim=-1)
+                token_log_probabilities = log_probabilities.gather(
+                    -1, labels.unsqueeze(-1)).squeeze(-1)
+                label_scores.append(token_log_probabilities.sum(dim=-1))
+            best_label_indices = torch.stack(label_scores, dim=-1).argmax(dim=-1)
+        category_names = list(CATEGORY_LABELS.values())
+        return [category_names[label_index]
+                for label_index in best_label_indices.tolist()]
+
+    def _categorize(self, tag: str, response: str) -> str:
+        """Get the category named in the model response"""
+        self._log(f"\nClassifying tag: '{tag}'")
+        self._log(f"Model response: '{response}'")
+
+        # Clean and normalize response
+        response = response.upper().strip()
+
+        for label, category in CATEGORY_LABELS.items():
+            if label in response:
+                self._log(f"Classified as {label}: {tag}")
+                return category
+        # Enhanced fallback logic
+        if self._looks_like_verb(tag):
+            self._log(f"Fallback - verb pattern detected: {tag}")
+            return "actions"
+        if any(living_thing in tag.lower() for living_thing in LIVING_THING_WORDS):
+            self._log(f"Fallback - living entity pattern detected: {tag}")
+            return "characters"
+        self._log(f"Fallback - defaulting to setting: {tag}")
+        return "settings"
 
     def _create_prompt(self, tag: str) -> str:
             """Enhanced prompt for FLAN-T5-base"""
@@ -0,0 +1,179 @@
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from PySide6.QtCore import QObject, Signal, Slot
+
+from utils.utils import pluralize
+
+if TYPE_CHECKING:
+    from utils.tag_sorter import TagSorter
+
+# How long to wait for the running request when stopping the service.
+STOP_TIMEOUT_SECONDS = 2
+
+
+@dataclass
+class TagSortingRequest:
+    request_id: int
+    tags: list[str]
+    # The number of callers waiting for the result of the request.
+    subscriber_count: int = 1
+
+
+class TagSortingService(QObject):
+    """
+    Sort tags with a `TagSorter` in a worker thread, so that the GUI does not
+    freeze while the model is running.
+
+    Requests are handled in order. A request for the same tags as a request
+    that is still pending is merged into it, and both callers receive the
+    result under the same request ID. The service can be shared by several
+    dialogs, which only need to handle the request IDs that they received.
+
+    The tag sorter is created with `tag_sorter_factory` in the worker thread
+    when the first request is handled, so that loading the model does not
+    slow down startup.
+
+    The worker is a daemon thread, so a request that is still running when
+    the application exits does not keep it open. The service never writes
+    tags, so the request can be abandoned safely.
+    """
+    # The request ID and the sorted tags.
+    sorting_completed = Signal(int, dict)
+    # The request ID and the error message.
+    sorting_failed = Signal(int, str)
+
+    def __init__(self, tag_sorter_factory: Callable[[], 'TagSorter'],
+                 parent=None):
+        super().__init__(parent)
+        self.tag_sorter_factory = tag_sorter_factory
+        self.tag_sorter: 'TagSorter | None' = None
+        self.condition = threading.Condition()
+        self.pending_requests: OrderedDict[int, TagSortingRequest] = (
+            OrderedDict())
+        self.running_request: TagSortingRequest | None = None
+        self.canceled_request_ids: set[int] = set()
+        self.next_request_id = 0
+        self.is_stopping = False
+        self.thread = threading.Thread(target=self.run, name='TagSorting',
+                                       daemon=True)
+
+    @Slot(int, dict)
+    def relay_completion(self, request_id: int, result: dict):
+        # Results of requests canceled while they were running are dropped.
+        # The IDs are kept because a request can report both a result and
+        # the tags that failed.
+        with self.condition:
+            if request_id in self.canceled_request_ids:
+                return
+        self.sorting_completed.emit(request_id, result)
+
+    @Slot(int, str)
+    def relay_failure(self, request_id: int, error_message: str):
+        with self.condition:
+            if request_id in self.canceled_request_ids:
+                return
+        self.sorting_failed.emit(request_id, error_message)
+
+    def request_sort(self, tags: list[str]) -> int:
+        """Queue tags to be sorted and return the ID of the request."""
+        with self.condition:
+            for request in self.pending_requests.values():
+                if request.tags == tags:
+                    request.subscriber_count += 1
+                    return request.request_id
+            request_id = self.next_request_id
+            self.next_request_id += 1
+            self.pending_requests[request_id] = TagSortingRequest(request_id,
+                                                                  tags)
+            self.condition.notify()
+        return request_id
+
+    def cancel(self, request_id: int):
+        """
+        Cancel a request. A request that other callers are also waiting for
+        is only canceled once all of them cancel it.
+        """
+        with self.condition:
+            request = self.pending_requests.get(request_id)
+            if request is None:
+                request = self.running_request
+                if request is None or request.request_id != request_id:
+                    return
+            request.subscriber_count -= 1
+            if request.subscriber_count > 0:
+                return
+            if request_id in self.pending_requests:
+                del self.pending_requests[request_id]
+            else:
+                # The model cannot be interrupted, so drop the result instead.
+                self.canceled_request_ids.add(request_id)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the worker, waiting at most `STOP_TIMEOUT_SECONDS` for the
+        running request.
+        """
+        with self.condition:
+            self.is_stopping = True
+            self.pending_requests.clear()
+            if self.running_request is not None:
+                self.canceled_request_ids.add(
+                    self.running_request.request_id)
+                if self.tag_sorter is not None:
+                    self.tag_sorter.is_canceled = True
+            self.condition.notify()
+        self.thread.join(STOP_TIMEOUT_SECONDS)
+
+    def load_tag_sorter(self):
+        self.tag_sorter = self.tag_sorter_factory()
+        # The tag sorter lives in this thread, so its signals are queued to the
+        # relay slots, which run in the GUI thread.
+        self.tag_sorter.sorting_completed.connect(self.relay_completion)
+        self.tag_sorter.sorting_failed.connect(self.relay_failure)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending_requests and not self.is_stopping:
+                    self.condition.wait()
+                if self.is_stopping:
+                    return
+                _, request = self.pending_requests.popitem(last=False)
+                self.running_request = request
+            if self.tag_sorter is None:
+                try:
+                    self.load_tag_sorter()
+                except Exception as exception:
+                    # Try to load the tag sorter again on the next request.
+                    self.relay_failure(request.request_id,
+                                       f'Failed to load the tag sorting '
+                                       f'model: {exception}')
+                    with self.condition:
+                        self.running_request = None
+                    continue
+            try:
+                result = self.tag_sorter.sort_tags(request.tags)
+            except Exception as exception:
+                self.tag_sorter.sorting_failed.emit(request.request_id,
+                                                    str(exception))
+            else:
+                self.tag_sorter.sorting_completed.emit(request.request_id,
+                                                       result)
+                # The other tags are still sorted, so the failure is reported
+                # after the result.
+                failed_tags = self.tag_sorter.failed_tags
+                if failed_tags:
+                    self.tag_sorter.sorting_failed.emit(
+                        request.request_id,
+                        f'Failed to sort {len(failed_tags)} '
+                        f'{pluralize("tag", len(failed_tags))}: '
+                        f'{", ".join(failed_tags)}')
+            with self.condition:
+                self.running_request = None
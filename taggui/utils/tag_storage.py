@@ -0,0 +1,314 @@
+import json
+import os
+import sys
+from abc import ABC, abstractmethod
+from pathlib import Path
+from threading import Lock
+
+from utils.image import Image
+from utils.json_tags import (copy_json_tags, get_empty_json_tags,
+                             get_json_path, get_modification_time,
+                             read_json_tags_in_parallel, write_json_tags)
+from utils.utils import write_file_atomically
+
+MANIFEST_FILE_NAME = 'taggui_manifest.jsonl'
+# The manifest is rewritten without outdated records when it has this many
+# times more records than images.
+MANIFEST_COMPACTION_RATIO = 2
+MIN_RECORD_COUNT_FOR_COMPACTION = 1000
+
+
+def parse_caption(caption: str, tag_separator: str) -> list[str]:
+    tags = [tag.strip() for tag in caption.split(tag_separator)]
+    return [tag for tag in tags if tag]
+
+
+class TagStorage(ABC):
+    """Read and write the text and JSON tags of the images in a directory."""
+    name = ''
+
+    def __init__(self, directory_path: Path, tag_separator: str):
+        self.directory_path = directory_path
+        self.tag_separator = tag_separator
+
+    @abstractmethod
+    def load_tags(self, images: list[Image], file_paths: set[Path]):
+        """Set the tags of images. `file_paths` are all files in the directory."""
+
+    @abstractmethod
+    def write_tags(self, image: Image):
+        """Write the text tags of an image. Raise `OSError` on failure."""
+
+    @abstractmethod
+    def write_json_tags(self, images: list[Image],
+                        overwritten_paths: set[Path] = frozenset()
+                        ) -> list[Path]:
+        """
+        Write the JSON tags of images that changed since they were last read
+        or written. Images whose tags were changed by another program are not
+        written unless their paths are in `overwritten_paths`. Return the
+        paths of those images. Raise `OSError` on failure.
+        """
+
+    @abstractmethod
+    def reload_json_tags(self, images: list[Image]):
+        """Read the JSON tags of images again."""
+
+    @abstractmethod
+    def remove_tags(self, image_paths: set[Path]):
+        """
+        Forget the tags of images that were moved or deleted, so that they are
+        not loaded for new files at their paths. Raise `OSError` on failure.
+        """
+
+
+class SidecarTagStorage(TagStorage):
+    """
+    Store the tags of each image in a `.txt` file and the JSON tags in a
+    `.json` file next to it.
+    """
+    name = 'sidecar files'
+
+    def __init__(self, directory_path: Path, tag_separator: str):
+        super().__init__(directory_path, tag_separator)
+        # The JSON tags of each image as last read or written, to skip
+        # writing unchanged tags.
+        self.saved_json_tags: dict[Path, dict[str, list[str]]] = {}
+        # The modification times of the JSON files as last read or written,
+        # to detect changes by other programs.
+        self.json_modification_times: dict[Path, int | None] = {}
+        # JSON tags are written from a worker thread and read again from the
+        # main thread.
+        self.json_tags_lock = Lock()
+
+    def load_tags(self, images: list[Image], file_paths: set[Path]):
+        for image in images:
+            text_file_path = image.path.with_suffix('.txt')
+            if text_file_path in file_paths:
+                caption = text_file_path.read_text(encoding='utf-8',
+                                                   errors='replace')
+                image.tags = parse_caption(caption, self.tag_separator)
+        # Parse the JSON sidecar files in parallel.
+        json_images = [image for image in images
+                       if get_json_path(image.path) in file_paths]
+        self.read_json_tags(json_images)
+
+    def read_json_tags(self, images: list[Image]):
+        with self.json_tags_lock:
+            results = read_json_tags_in_parallel(
+                [image.path for image in images])
+            for image, (json_tags, modification_time) in zip(images, results):
+                image.json_tags = json_tags
+                self.saved_json_tags[image.path] = json_tags
+                self.json_modification_times[image.path] = modification_time
+
+    def write_tags(self, image: Image):
+        image.path.with_suffix('.txt').write_text(
+            self.tag_separator.join(image.tags), encoding='utf-8',
+            errors='replace')
+
+    def write_json_tags(self, images: list[Image],
+                        overwritten_paths: set[Path] = frozenset()
+                        ) -> list[Path]:
+        with self.json_tags_lock:
+            return self.write_json_tags_unlocked(images, overwritten_paths)
+
+    def write_json_tags_unlocked(self, images: list[Image],
+                                 overwritten_paths: set[Path]) -> list[Path]:
+        conflicted_paths = []
+        for image in images:
+            saved_json_tags = self.saved_json_tags.get(image.path,
+                                                       get_empty_json_tags())
+            if image.json_tags == saved_json_tags:
+                continue
+            json_path = get_json_path(image.path)
+            if (image.path not in overwritten_paths
+                    and get_modification_time(json_path)
+                    != self.json_modification_times.get(image.path)):
+                conflicted_paths.append(image.path)
+                continue
+            write_json_tags(image.path, image.json_tags)
+            self.saved_json_tags[image.path] = image.json_tags
+            self.json_modification_times[image.path] = (
+                get_modification_time(json_path))
+        return conflicted_paths
+
+    def reload_json_tags(self, images: list[Image]):
+        self.read_json_tags(images)
+
+    def remove_tags(self, image_paths: set[Path]):
+        # The sidecar files are moved or deleted with the images.
+        with self.json_tags_lock:
+            for image_path in image_paths:
+                self.saved_json_tags.pop(image_path, None)
+                self.json_modification_times.pop(image_path, None)
+
+
+class ManifestTagStorage(TagStorage):
+    """
+    Store the tags of all images in a directory in a single JSON Lines
+    manifest file.
+
+    Each line holds the text and JSON tags of one image. Changes are appended
+    as new lines, and the last line for an image takes precedence. The file is
+    compacted when it accumulates too many outdated lines.
+    """
+    name = 'a manifest file'
+
+    def __init__(self, directory_path: Path, tag_separator: str):
+        super().__init__(directory_path, tag_separator)
+        self.manifest_path = directory_path / MANIFEST_FILE_NAME
+        # Maps image paths relative to the directory to the latest records.
+        self.records: dict[str, dict] = {}
+        self.record_count = 0
+        # JSON tags are written from a worker thread and text tags from the
+        # main thread.
+        self.write_lock = Lock()
+        self.read_manifest()
+
+    def get_key(self, image_path: Path) -> str:
+        return image_path.relative_to(self.directory_path).as_posix()
+
+    def get_record(self, image: Image) -> dict:
+        return {'path': self.get_key(image.path), 'tags': image.tags,
+                'json_tags': image.json_tags}
+
+    def read_manifest(self):
+        if not self.manifest_path.is_file():
+            return
+        with self.manifest_path.open(encoding='utf-8',
+                                     errors='replace') as manifest_file:
+            for line_number, line in enumerate(manifest_file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    self.records[record['path']] = record
+                except (ValueError, KeyError, TypeError):
+                    # A line can be incomplete if writing it was interrupted.
+                    print(f'Skipping invalid line {line_number} in '
+                          f'{self.manifest_path}.', file=sys.stderr)
+                    continue
+                self.record_count += 1
+
+    def load_tags(self, images: list[Image], file_paths: set[Path]):
+        images_without_records = []
+        for image in images:
+            record = self.records.get(self.get_key(image.path))
+            if record is None:
+                images_without_records.append(image)
+                continue
+            image.tags = [str(tag) for tag in record.get('tags', [])]
+            image.json_tags = copy_json_tags(
+                record.get('json_tags') or get_empty_json_tags())
+        # Images added to the directory after the manifest was written, such
+        # as saved clips, can still have sidecar files.
+        SidecarTagStorage(self.directory_path, self.tag_separator).load_tags(
+            images_without_records, file_paths)
+
+    def append_records(self, images: list[Image]):
+        with self.write_lock:
+            self.append_records_unlocked(images)
+
+    def append_records_unlocked(self, images: list[Image]):
+        # Skip images whose tags did not change.
+        records = [record for record in map(self.get_record, images)
+                   if record != self.records.get(record['path'])]
+        if not records:
+            return
+        lines = ''.join(json.dumps(record, ensure_ascii=False) + '\n'
+                        for record in records)
+        with self.manifest_path.open('a+b') as manifest_file:
+            # Start on a new line if the last write was interrupted.
+            if manifest_file.tell() > 0:
+                manifest_file.seek(-1, os.SEEK_END)
+                if manifest_file.read(1) != b'\n':
+                    lines = '\n' + lines
+            manifest_file.write(lines.encode('utf-8'))
+            manifest_file.flush()
+            os.fsync(manifest_file.fileno())
+        for record in records:
+            self.records[record['path']] = record
+        self.record_count += len(records)
+        if (self.record_count >= MIN_RECORD_COUNT_FOR_COMPACTION
+                and self.record_count
+                > MANIFEST_COMPACTION_RATIO * len(self.records)):
+            self.compact()
+
+    def compact(self):
+        """Rewrite the manifest with only the latest record of each image."""
+        write_file_atomically(
+            self.manifest_path,
+            ''.join(json.dumps(record, ensure_ascii=False) + '\n'
+                    for record in self.records.values()))
+        self.record_count = len(self.records)
+
+    def write_tags(self, image: Image):
+        self.append_records([image])
+
+    def write_json_tags(self, images: list[Image],
+                        overwritten_paths: set[Path] = frozenset()
+                        ) -> list[Path]:
+        # Changes are appended, so changes by other programs are not lost.
+        self.append_records(images)
+        return []
+
+    def reload_json_tags(self, images: list[Image]):
+        with self.write_lock:
+            self.records = {}
+            self.record_count = 0
+            self.read_manifest()
+        self.load_tags(images, set())
+
+    def remove_tags(self, image_paths: set[Path]):
+        keys = {self.get_key(image_path) for image_path in image_paths}
+        with self.write_lock:
+            if keys.isdisjoint(self.records):
+                return
+            self.records = {key: record
+                            for key, record in self.records.items()
+                            if key not in keys}
+            self.compact()
+
+    def write_all(self, images: list[Image]):
+        """Write a new manifest with the tags of all images."""
+        with self.write_lock:
+            self.records = {self.get_key(image.path): self.get_record(image)
+                            for image in images}
+            self.compact()
+
+
+def get_tag_storage(directory_path: Path, tag_separator: str) -> TagStorage:
+    """Use the manifest of a directory if it has one, or sidecar files."""
+    if (directory_path / MANIFEST_FILE_NAME).is_file():
+        return ManifestTagStorage(directory_path, tag_separator)
+    return SidecarTagStorage(directory_path, tag_separator)
+
+
+def convert_to_manifest(directory_path: Path, images: list[Image],
+                        tag_separator: str) -> ManifestTagStorage:
+    """
+    Write the tags of all images to a manifest and delete their sidecar files.
+    """
+    storage = ManifestTagStorage(directory_path, tag_separator)
+    storage.write_all(images)
+    for image in images:
+        for sidecar_path in (image.path.with_suffix('.txt'),
+                             get_json_path(image.path)):
+            sidecar_path.unlink(missing_ok=True)
+    return storage
+
+
+def convert_to_sidecars(directory_path: Path, images: list[Image],
+                        tag_separator: str) -> SidecarTagStorage:
+    """Write the tags of all images to sidecar files and delete the manifest."""
+    storage = SidecarTagStorage(directory_path, tag_separator)
+    for image in images:
+        if image.tags:
+            storage.write_tags(image)
+    # Write the JSON tags through the storage so that their modification
+    # times are recorded and later writes are not seen as conflicts.
+    storage.write_json_tags(
+        images, overwritten_paths={image.path for image in images})
+    (directory_path / MANIFEST_FILE_NAME).unlink(missing_ok=True)
+    return storage
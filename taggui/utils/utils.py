@@ -1,6 +1,8 @@
+import os
 import sys
 from pathlib import Path
 
+from PySide6.QtCore import QStandardPaths
 from PySide6.QtWidgets import QMessageBox
 
 
@@ -15,6 +17,30 @@ def get_resource_path(unbundled_resource_path: Path) -> Path:
     return resource_path
 
 
+def get_app_data_directory_path() -> Path:
+    """
+    Get the directory for persistent application data, creating it if it does
+    not exist yet.
+    """
+    app_data_directory_path = Path(QStandardPaths.writableLocation(
+        QStandardPaths.StandardLocation.AppDataLocation))
+    app_data_directory_path.mkdir(parents=True, exist_ok=True)
+    return app_data_directory_path
+
+
+def write_file_atomically(path: Path, text: str):
+    """
+    Write a file by writing a temporary file and replacing the file with it,
+    so that the file is never left partially written.
+    """
+    temporary_path = path.with_name(f'{path.name}.tmp')
+    with temporary_path.open('w', encoding='utf-8') as file:
+        file.write(text)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, path)
+
+
 def pluralize(word: str, count: int) -> str:
     if count == 1:
         return word
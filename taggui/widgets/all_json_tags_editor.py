@@ -0,0 +1,190 @@
+from collections import defaultdict
+from fnmatch import fnmatchcase
+
+from PySide6.QtCore import (QItemSelection, QModelIndex, QSortFilterProxyModel,
+                            Qt, Signal, Slot)
+from PySide6.QtGui import QKeyEvent
+from PySide6.QtWidgets import (QAbstractItemView, QDockWidget, QLabel,
+                               QMessageBox, QTreeView, QVBoxLayout, QWidget)
+
+from models.json_tag_counter_model import JsonTagCounterModel
+from utils.big_widgets import TallPushButton
+from utils.text_edit_item_delegate import TextEditItemDelegate
+from utils.utils import get_confirmation_dialog_reply, list_with_and, pluralize
+from widgets.all_tags_editor import FilterLineEdit
+
+
+class ProxyJsonTagCounterModel(QSortFilterProxyModel):
+    """Sort the JSON tags of each category by frequency and filter them."""
+
+    def __init__(self, json_tag_counter_model: JsonTagCounterModel):
+        super().__init__()
+        self.setSourceModel(json_tag_counter_model)
+        self.json_tag_counter_model = json_tag_counter_model
+        # Show the categories that have matching tags.
+        self.setRecursiveFilteringEnabled(True)
+        self.filter = None
+
+    # Get the counts directly from the source model instead of setting a sort
+    # role, which is much slower.
+    def lessThan(self, left: QModelIndex, right: QModelIndex) -> bool:
+        if self.json_tag_counter_model.is_category_index(left):
+            # Keep the categories in their original order.
+            return left.row() > right.row()
+        category = self.json_tag_counter_model.get_category(left)
+        tags = self.json_tag_counter_model.category_tags[category]
+        tag_counter = self.json_tag_counter_model.tag_counters[category]
+        left_tag = tags[left.row()]
+        right_tag = tags[right.row()]
+        # Sort by frequency and then by name when sorted in descending order.
+        return ((tag_counter[left_tag], right_tag)
+                < (tag_counter[right_tag], left_tag))
+
+    def filterAcceptsRow(self, source_row: int,
+                         source_parent: QModelIndex) -> bool:
+        if not self.filter:
+            return True
+        if not source_parent.isValid():
+            # Categories are shown if any of their tags are accepted.
+            return False
+        category = self.json_tag_counter_model.get_category(source_parent)
+        tag = self.json_tag_counter_model.category_tags[category][source_row]
+        return fnmatchcase(tag, f'*{self.filter}*')
+
+
+class AllJsonTagsTree(QTreeView):
+    # Filter key, such as `character`, and tag.
+    image_list_filter_requested = Signal(str, str)
+    # Category and tags.
+    tags_deletion_requested = Signal(str, list)
+
+    def __init__(self, proxy_json_tag_counter_model: ProxyJsonTagCounterModel):
+        super().__init__()
+        self.setModel(proxy_json_tag_counter_model)
+        self.setHeaderHidden(True)
+        self.setItemDelegate(TextEditItemDelegate(self))
+        self.setWordWrap(True)
+        self.setSelectionMode(
+            QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.selectionModel().selectionChanged.connect(
+            self.handle_selection_change)
+
+    def get_selected_tags(self) -> dict[str, list[tuple[str, int]]]:
+        """Get the selected tags and their counts, grouped by category."""
+        selected_tags = defaultdict(list)
+        for selected_index in self.selectedIndexes():
+            tag_data = selected_index.data(Qt.ItemDataRole.UserRole)
+            if tag_data is None:
+                continue
+            category, tag, count = tag_data
+            selected_tags[category].append((tag, count))
+        return selected_tags
+
+    def keyPressEvent(self, event: QKeyEvent):
+        """
+        Delete all instances of the selected tags when the delete key or
+        backspace key is pressed.
+        """
+        if event.key() not in (Qt.Key.Key_Delete, Qt.Key.Key_Backspace):
+            super().keyPressEvent(event)
+            return
+        selected_tags = self.get_selected_tags()
+        if not selected_tags:
+            return
+        tags_count = sum(count for category_tags in selected_tags.values()
+                         for _, count in category_tags)
+        tag_count = sum(len(category_tags)
+                        for category_tags in selected_tags.values())
+        question = (f'Delete {tags_count} {pluralize("instance", tags_count)} '
+                    f'of ')
+        if tag_count < 10:
+            quoted_tags = [f'"{category[:-1]}:{tag}"'
+                           for category, category_tags in selected_tags.items()
+                           for tag, _ in category_tags]
+            question += (f'{pluralize("tag", tag_count)} '
+                         f'{list_with_and(quoted_tags)}?')
+        else:
+            question += f'{tag_count} tags?'
+        reply = get_confirmation_dialog_reply(
+            title=f'Delete {pluralize("Tag", tag_count)}', question=question)
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        for category, category_tags in selected_tags.items():
+            self.tags_deletion_requested.emit(
+                category, [tag for tag, _ in category_tags])
+
+    @Slot()
+    def handle_selection_change(self, selected: QItemSelection, _):
+        if not selected.indexes():
+            return
+        tag_data = selected.indexes()[0].data(Qt.ItemDataRole.UserRole)
+        if tag_data is None:
+            return
+        category, tag, _ = tag_data
+        self.image_list_filter_requested.emit(category[:-1], tag)
+
+
+class AllJsonTagsEditor(QDockWidget):
+    def __init__(self, json_tag_counter_model: JsonTagCounterModel):
+        super().__init__()
+        self.json_tag_counter_model = json_tag_counter_model
+
+        # Each `QDockWidget` needs a unique object name for saving its state.
+        self.setObjectName('all_json_tags_editor')
+        self.setWindowTitle('All JSON Tags')
+        self.setAllowedAreas(Qt.DockWidgetArea.LeftDockWidgetArea
+                             | Qt.DockWidgetArea.RightDockWidgetArea)
+        self.proxy_json_tag_counter_model = ProxyJsonTagCounterModel(
+            self.json_tag_counter_model)
+        self.filter_line_edit = FilterLineEdit()
+        self.clear_filter_button = TallPushButton('Clear Image List Filter')
+        self.clear_filter_button.setFixedHeight(
+            int(self.clear_filter_button.sizeHint().height() * 1.5))
+        self.all_json_tags_tree = AllJsonTagsTree(
+            self.proxy_json_tag_counter_model)
+        self.tag_count_label = QLabel()
+        # A container widget is required to use a layout with a `QDockWidget`.
+        container = QWidget()
+        layout = QVBoxLayout(container)
+        layout.addWidget(self.filter_line_edit)
+        layout.addWidget(self.clear_filter_button)
+        layout.addWidget(self.all_json_tags_tree)
+        layout.addWidget(self.tag_count_label)
+        self.setWidget(container)
+
+        self.proxy_json_tag_counter_model.modelReset.connect(
+            self.all_json_tags_tree.expandAll)
+        # The proxy model is connected to the source model first, so it is
+        # already updated when these signals are handled.
+        for signal in (self.json_tag_counter_model.modelReset,
+                       self.json_tag_counter_model.rowsInserted,
+                       self.json_tag_counter_model.rowsRemoved):
+            signal.connect(self.update_tag_count_label)
+        self.filter_line_edit.textChanged.connect(self.set_filter)
+        self.proxy_json_tag_counter_model.sort(0,
+                                               Qt.SortOrder.DescendingOrder)
+        self.all_json_tags_tree.expandAll()
+        self.update_tag_count_label()
+
+    @Slot(str)
+    def set_filter(self, filter_: str):
+        # Replace escaped wildcard characters to make them compatible with
+        # the `fnmatch` module.
+        filter_ = filter_.replace(r'\?', '[?]').replace(r'\*', '[*]')
+        self.proxy_json_tag_counter_model.filter = filter_
+        # `invalidate()` must be called to force the proxy model to re-filter.
+        self.proxy_json_tag_counter_model.invalidate()
+        self.all_json_tags_tree.expandAll()
+        self.update_tag_count_label()
+
+    @Slot()
+    def update_tag_count_label(self):
+        model = self.json_tag_counter_model
+        total_tag_count = sum(len(tags)
+                              for tags in model.category_tags.values())
+        proxy_model = self.proxy_json_tag_counter_model
+        filtered_tag_count = sum(
+            proxy_model.rowCount(proxy_model.index(row, 0))
+            for row in range(proxy_model.rowCount()))
+        self.tag_count_label.setText(f'{filtered_tag_count} / '
+                                     f'{total_tag_count} Tags')
@@ -1,16 +1,21 @@
 import sys
+from importlib.util import find_spec
 from pathlib import Path
 
-from PySide6.QtCore import QModelIndex, Qt, Signal, Slot
+from PySide6.QtCore import QModelIndex, Qt, QTimer, Signal, Slot
 from PySide6.QtGui import QFontMetrics, QTextCursor
-from PySide6.QtWidgets import (QAbstractScrollArea, QDockWidget, QFormLayout,
-                               QFrame, QHBoxLayout, QLabel, QMessageBox,
-                               QPlainTextEdit, QProgressBar, QScrollArea,
+from PySide6.QtWidgets import (QAbstractScrollArea, QDockWidget,
+                               QFileDialog, QFormLayout, QFrame, QHBoxLayout,
+                               QLabel, QMessageBox, QPlainTextEdit,
+                               QProgressBar, QPushButton, QScrollArea,
                                QVBoxLayout, QWidget)
 
+from auto_captioning.captioning_journal import CaptioningJournal
+from auto_captioning.captioning_profiler import CaptioningProfiler
 from auto_captioning.captioning_thread import CaptioningThread
-from auto_captioning.models.wd_tagger import WdTagger
-from auto_captioning.models_list import MODELS, get_model_class
+from auto_captioning.model_loading_thread import ModelLoadingThread
+from auto_captioning.model_registry import ModelRegistry
+from auto_captioning.models_list import MODELS, get_model_class_name
 from dialogs.caption_multiple_images_dialog import CaptionMultipleImagesDialog
 from models.image_list_model import ImageListModel
 from utils.big_widgets import TallPushButton
@@ -51,11 +56,9 @@ class CaptionSettingsForm(QVBoxLayout):
     def __init__(self):
         super().__init__()
         self.settings = get_settings()
-        try:
-            import bitsandbytes
-            self.is_bitsandbytes_available = True
-        except RuntimeError:
-            self.is_bitsandbytes_available = False
+        # Check for the package without importing it, because importing it
+        # also imports `torch`, which is slow.
+        self.is_bitsandbytes_available = find_spec('bitsandbytes') is not None
         basic_settings_form = QFormLayout()
         basic_settings_form.setRowWrapPolicy(
             QFormLayout.RowWrapPolicy.WrapAllRows)
@@ -190,6 +193,22 @@ class CaptionSettingsForm(QVBoxLayout):
             key='no_repeat_ngram_size', default=3, minimum=0, maximum=5)
         self.gpu_index_spin_box = FocusedScrollSettingsSpinBox(
             key='gpu_index', default=0, minimum=0, maximum=9)
+        self.use_caption_cache_check_box = SettingsBigCheckBox(
+            key='use_caption_cache', default=True)
+        self.use_caption_cache_check_box.setToolTip(
+            'Reuse captions that were previously generated for the same image '
+            'with the same model, prompt and settings.\nCaptions are not '
+            'cached when sampling is used.')
+        self.preload_model_check_box = SettingsBigCheckBox(
+            key='preload_model', default=False)
+        self.preload_model_check_box.setToolTip(
+            'Load the selected model in the background so that captioning '
+            'starts right away.')
+        self.warm_up_model_check_box = SettingsBigCheckBox(
+            key='warm_up_model', default=False)
+        self.warm_up_model_check_box.setToolTip(
+            'Generate a caption for a blank image after preloading the model '
+            'to finish any remaining setup.')
         advanced_settings_form.addRow(bad_forced_words_form)
         advanced_settings_form.addRow(HorizontalLine())
         advanced_settings_form.addRow('Minimum tokens',
@@ -212,6 +231,13 @@ class CaptionSettingsForm(QVBoxLayout):
                                       self.no_repeat_ngram_size_spin_box)
         advanced_settings_form.addRow(HorizontalLine())
         advanced_settings_form.addRow('GPU index', self.gpu_index_spin_box)
+        advanced_settings_form.addRow(HorizontalLine())
+        advanced_settings_form.addRow('Use caption cache',
+                                      self.use_caption_cache_check_box)
+        advanced_settings_form.addRow('Preload selected model',
+                                      self.preload_model_check_box)
+        advanced_settings_form.addRow('Warm up preloaded model',
+                                      self.warm_up_model_check_box)
         self.advanced_settings_form_container.hide()
 
         self.addLayout(basic_settings_form)
@@ -277,7 +303,7 @@ class CaptionSettingsForm(QVBoxLayout):
             self.toggle_advanced_settings_form_button,
             self.advanced_settings_form_container
         ]
-        is_wd_tagger_model = get_model_class(model_id) == WdTagger
+        is_wd_tagger_model = get_model_class_name(model_id) == 'WdTagger'
         for widget in wd_tagger_widgets:
             widget.setVisible(is_wd_tagger_model)
         for widget in non_wd_tagger_widgets:
@@ -287,7 +313,7 @@ class CaptionSettingsForm(QVBoxLayout):
     @Slot(str)
     def set_load_in_4_bit_visibility(self, device: str):
         model_id = self.model_combo_box.currentText()
-        is_wd_tagger_model = get_model_class(model_id) == WdTagger
+        is_wd_tagger_model = get_model_class_name(model_id) == 'WdTagger'
         if is_wd_tagger_model:
             self.load_in_4_bit_container.setVisible(False)
             return
@@ -319,6 +345,7 @@ class CaptionSettingsForm(QVBoxLayout):
                 self.remove_tag_separators_check_box.isChecked(),
             'bad_words': self.bad_words_line_edit.text(),
             'forced_words': self.forced_words_line_edit.text(),
+            'use_caption_cache': self.use_caption_cache_check_box.isChecked(),
             'generation_parameters': {
                 'min_new_tokens': self.min_new_token_count_spin_box.value(),
                 'max_new_tokens': self.max_new_token_count_spin_box.value(),
@@ -360,11 +387,15 @@ class AutoCaptioner(QDockWidget):
         self.settings = get_settings()
         self.is_captioning = False
         self.captioning_thread = None
-        self.processor = None
-        self.model = None
-        self.model_id: str | None = None
-        self.model_device_type: str | None = None
-        self.is_model_loaded_in_4_bit = None
+        self.model_registry = ModelRegistry()
+        self.model_loading_thread = None
+        # All running model loading threads, including canceled ones, which
+        # cannot be interrupted and must finish before the application exits.
+        self.model_loading_threads: list[ModelLoadingThread] = []
+        # Wait until the selection stops changing before preloading a model.
+        self.preload_model_timer = QTimer(self)
+        self.preload_model_timer.setSingleShot(True)
+        self.preload_model_timer.setInterval(1000)
         # Whether the last block of text in the console text edit should be
         # replaced with the next block of text that is outputted.
         self.replace_last_console_text_edit_block = False
@@ -376,6 +407,9 @@ class AutoCaptioner(QDockWidget):
                              | Qt.DockWidgetArea.RightDockWidgetArea)
 
         self.start_cancel_button = TallPushButton('Start Auto-Captioning')
+        self.model_status_label = QLabel()
+        self.model_status_label.setWordWrap(True)
+        self.model_status_label.hide()
         self.progress_bar = QProgressBar()
         self.progress_bar.setFormat('%v / %m images captioned (%p%)')
         self.progress_bar.hide()
@@ -383,11 +417,37 @@ class AutoCaptioner(QDockWidget):
         set_text_edit_height(self.console_text_edit, 4)
         self.console_text_edit.setReadOnly(True)
         self.console_text_edit.hide()
+        self.loaded_models_label = QLabel()
+        self.loaded_models_label.setWordWrap(True)
+        self.loaded_models_label.hide()
+        self.captioning_profiler: CaptioningProfiler | None = None
+        self.profile_container = QWidget()
+        profile_layout = QVBoxLayout(self.profile_container)
+        profile_layout.setContentsMargins(0, 0, 0, 0)
+        self.profile_label = QLabel()
+        self.profile_label.setWordWrap(True)
+        self.profile_label.setTextInteractionFlags(
+            Qt.TextInteractionFlag.TextSelectableByMouse)
+        export_profile_buttons_layout = QHBoxLayout()
+        export_profile_as_json_button = QPushButton('Export Profile as JSON...')
+        export_profile_as_json_button.clicked.connect(
+            lambda: self.export_captioning_profile('JSON'))
+        export_profile_as_csv_button = QPushButton('Export Profile as CSV...')
+        export_profile_as_csv_button.clicked.connect(
+            lambda: self.export_captioning_profile('CSV'))
+        export_profile_buttons_layout.addWidget(export_profile_as_json_button)
+        export_profile_buttons_layout.addWidget(export_profile_as_csv_button)
+        profile_layout.addWidget(self.profile_label)
+        profile_layout.addLayout(export_profile_buttons_layout)
+        self.profile_container.hide()
         container = QWidget()
         layout = QVBoxLayout(container)
         layout.addWidget(self.start_cancel_button)
+        layout.addWidget(self.model_status_label)
         layout.addWidget(self.progress_bar)
         layout.addWidget(self.console_text_edit)
+        layout.addWidget(self.loaded_models_label)
+        layout.addWidget(self.profile_container)
         self.caption_settings_form = CaptionSettingsForm()
         layout.addLayout(self.caption_settings_form)
         scroll_area = QScrollArea()
@@ -400,6 +460,15 @@ class AutoCaptioner(QDockWidget):
 
         self.start_cancel_button.clicked.connect(
             self.start_or_cancel_captioning)
+        self.preload_model_timer.timeout.connect(self.preload_model)
+        form = self.caption_settings_form
+        for signal in (form.model_combo_box.currentTextChanged,
+                       form.device_combo_box.currentTextChanged,
+                       form.load_in_4_bit_check_box.stateChanged,
+                       form.gpu_index_spin_box.valueChanged,
+                       form.preload_model_check_box.stateChanged):
+            signal.connect(self.schedule_model_preload)
+        self.schedule_model_preload()
 
     @Slot()
     def start_or_cancel_captioning(self):
@@ -417,6 +486,84 @@ class AutoCaptioner(QDockWidget):
         button_text = ('Cancel Auto-Captioning' if is_captioning
                        else 'Start Auto-Captioning')
         self.start_cancel_button.setText(button_text)
+        if is_captioning:
+            self.cancel_model_preload()
+            self.model_status_label.hide()
+        else:
+            # The selected model may have changed while captioning.
+            self.schedule_model_preload()
+
+    def get_models_directory_path(self) -> Path | None:
+        models_directory_path = self.settings.value(
+            'models_directory_path',
+            defaultValue=DEFAULT_SETTINGS['models_directory_path'], type=str)
+        return Path(models_directory_path) if models_directory_path else None
+
+    def cancel_model_preload(self):
+        self.preload_model_timer.stop()
+        if self.model_loading_thread is not None:
+            # A model that is already being loaded cannot be interrupted, but
+            # its result is ignored.
+            self.model_loading_thread.is_canceled = True
+            self.model_loading_thread = None
+
+    def wait_for_model_preloads(self):
+        """Cancel the model preload and wait for all loading threads."""
+        self.cancel_model_preload()
+        for model_loading_thread in self.model_loading_threads.copy():
+            model_loading_thread.wait()
+        self.model_loading_threads.clear()
+
+    @Slot()
+    def schedule_model_preload(self):
+        self.cancel_model_preload()
+        if (self.is_captioning or not self.caption_settings_form
+                .preload_model_check_box.isChecked()):
+            self.model_status_label.hide()
+            return
+        self.preload_model_timer.start()
+
+    @Slot()
+    def preload_model(self):
+        # Preloading while captioning could unload the model being used.
+        if self.is_captioning:
+            return
+        caption_settings = self.caption_settings_form.get_caption_settings()
+        should_warm_up = (self.caption_settings_form.warm_up_model_check_box
+                          .isChecked())
+        model_loading_thread = ModelLoadingThread(
+            self, caption_settings, get_tag_separator(),
+            self.get_models_directory_path(), should_warm_up)
+        model_id = caption_settings['model_id']
+        model_loading_thread.model_loaded.connect(
+            lambda: self.set_model_status(model_loading_thread,
+                                          f'{model_id} is ready.'))
+        model_loading_thread.model_loading_failed.connect(
+            lambda error_message: self.set_model_status(
+                model_loading_thread,
+                f'Failed to preload {model_id}: {error_message}'))
+        model_loading_thread.finished.connect(
+            lambda: self.remove_model_loading_thread(model_loading_thread))
+        model_loading_thread.finished.connect(
+            model_loading_thread.deleteLater)
+        self.model_loading_thread = model_loading_thread
+        self.model_loading_threads.append(model_loading_thread)
+        self.set_model_status(model_loading_thread,
+                              f'Preloading {model_id}...')
+        model_loading_thread.start()
+
+    def remove_model_loading_thread(
+            self, model_loading_thread: ModelLoadingThread):
+        if model_loading_thread in self.model_loading_threads:
+            self.model_loading_threads.remove(model_loading_thread)
+
+    def set_model_status(self, model_loading_thread: ModelLoadingThread,
+                         status: str):
+        # Ignore the results of canceled preloads.
+        if model_loading_thread is not self.model_loading_thread:
+            return
+        self.model_status_label.setText(status)
+        self.model_status_label.show()
 
     @Slot(str)
     def update_console_text_edit(self, text: str):
@@ -441,6 +588,42 @@ class AutoCaptioner(QDockWidget):
             self.console_text_edit.textCursor().deletePreviousChar()
         self.console_text_edit.appendPlainText(text)
 
+    @Slot()
+    def update_loaded_models_label(self):
+        loaded_models_summary = self.model_registry.get_loaded_models_summary()
+        if not loaded_models_summary:
+            self.loaded_models_label.hide()
+            return
+        self.loaded_models_label.setText(
+            'Loaded models:\n' + '\n'.join(loaded_models_summary))
+        self.loaded_models_label.show()
+
+    @Slot()
+    def show_captioning_profile(self):
+        self.captioning_profiler = self.captioning_thread.profiler
+        if not self.captioning_profiler.image_records:
+            self.profile_container.hide()
+            return
+        self.profile_label.setText(self.captioning_profiler.format_summary())
+        self.profile_container.show()
+
+    def export_captioning_profile(self, file_format: str):
+        if self.captioning_profiler is None:
+            return
+        extension = file_format.lower()
+        initial_path = (Path(self.settings.value('directory_path', type=str))
+                        / f'captioning_profile.{extension}')
+        path, _ = QFileDialog.getSaveFileName(
+            parent=self, caption='Export captioning profile',
+            dir=str(initial_path),
+            filter=f'{file_format} files (*.{extension})')
+        if not path:
+            return
+        if file_format == 'JSON':
+            self.captioning_profiler.export_json(Path(path))
+        else:
+            self.captioning_profiler.export_csv(Path(path))
+
     @Slot()
     def show_alert(self):
         if self.captioning_thread.is_canceled:
@@ -457,6 +640,54 @@ class AutoCaptioner(QDockWidget):
         alert.setText(text)
         alert.exec()
 
+    def get_captioning_journal(
+            self, caption_settings: dict,
+            selected_image_indices: list[QModelIndex]
+    ) -> CaptioningJournal | None:
+        """
+        Get the journal for the captioning job, asking whether to resume the
+        job if it was previously interrupted. Return `None` if captioning
+        should not be started.
+        """
+        image_paths = [
+            self.image_list_model.data(image_index,
+                                       Qt.ItemDataRole.UserRole).path
+            for image_index in selected_image_indices
+        ]
+        journal = CaptioningJournal(caption_settings, image_paths)
+        if not journal.has_progress:
+            return journal
+        completed_image_count = (len(journal.written_captions)
+                                 + len(journal.pending_captions))
+        reply = QMessageBox.question(
+            self, 'Resume Auto-Captioning',
+            f'A previous captioning job with the same images and settings was '
+            f'interrupted after captioning {completed_image_count} / '
+            f'{journal.image_count} '
+            f'{pluralize("image", journal.image_count)}. Resume the job?\n\n'
+            f'Select "No" to caption all of the images again.',
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+            | QMessageBox.StandardButton.Cancel,
+            QMessageBox.StandardButton.Yes)
+        if reply == QMessageBox.StandardButton.Cancel:
+            return None
+        if reply == QMessageBox.StandardButton.No:
+            journal.discard()
+        return journal
+
+    @Slot(QModelIndex, str, list)
+    def record_caption_written(self, image_index: QModelIndex, _caption: str,
+                               _tags: list[str]):
+        image = self.image_list_model.data(image_index,
+                                           Qt.ItemDataRole.UserRole)
+        self.captioning_thread.journal.record_written_caption(image.path)
+
+    @Slot()
+    def close_captioning_journal(self):
+        is_job_finished = not (self.captioning_thread.is_canceled
+                               or self.captioning_thread.is_error)
+        self.captioning_thread.journal.close(is_job_finished)
+
     @Slot()
     def generate_captions(self):
         selected_image_indices = self.image_list.get_selected_image_indices()
@@ -470,8 +701,13 @@ class AutoCaptioner(QDockWidget):
                 return
             show_alert_when_finished = (confirmation_dialog
                                         .show_alert_check_box.isChecked())
-        self.set_is_captioning(True)
         caption_settings = self.caption_settings_form.get_caption_settings()
+        journal = self.get_captioning_journal(caption_settings,
+                                              selected_image_indices)
+        if journal is None:
+            return
+        journal.open()
+        self.set_is_captioning(True)
         if caption_settings['caption_position'] != CaptionPosition.DO_NOT_ADD:
             self.image_list_model.add_to_undo_stack(
                 action_name=f'Generate '
@@ -482,25 +718,30 @@ class AutoCaptioner(QDockWidget):
             self.progress_bar.setValue(0)
             self.progress_bar.show()
         tag_separator = get_tag_separator()
-        models_directory_path = self.settings.value(
-            'models_directory_path',
-            defaultValue=DEFAULT_SETTINGS['models_directory_path'], type=str)
-        models_directory_path = (Path(models_directory_path)
-                                 if models_directory_path else None)
         self.captioning_thread = CaptioningThread(
             self, self.image_list_model, selected_image_indices,
-            caption_settings, tag_separator, models_directory_path)
+            caption_settings, tag_separator, self.get_models_directory_path(),
+            journal)
         self.captioning_thread.text_outputted.connect(
             self.update_console_text_edit)
         self.captioning_thread.clear_console_text_edit_requested.connect(
             self.console_text_edit.clear)
         self.captioning_thread.caption_generated.connect(
             self.caption_generated)
+        # This must be connected after `caption_generated` so that the caption
+        # is only recorded as written after it is added to the tags.
+        self.captioning_thread.caption_generated.connect(
+            self.record_caption_written)
         self.captioning_thread.progress_bar_update_requested.connect(
             self.progress_bar.setValue)
+        self.captioning_thread.finished.connect(
+            self.close_captioning_journal)
         self.captioning_thread.finished.connect(
             lambda: self.set_is_captioning(False))
         self.captioning_thread.finished.connect(restore_stdout_and_stderr)
+        self.captioning_thread.finished.connect(
+            self.update_loaded_models_label)
+        self.captioning_thread.finished.connect(self.show_captioning_profile)
         self.captioning_thread.finished.connect(self.progress_bar.hide)
         self.captioning_thread.finished.connect(
             lambda: self.start_cancel_button.setEnabled(True))
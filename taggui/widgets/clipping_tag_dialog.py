@@ -1,4 +1,4 @@
-from PySide6.QtCore import Qt, Signal
+from PySide6.QtCore import Qt, Signal, Slot
 from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel,
                                QMessageBox, QLineEdit, QPushButton, QWidget)
 from PySide6.QtGui import QPixmap, QImage
@@ -6,14 +6,25 @@ from pathlib import Path
 
 import json
 
+from utils.tag_category_cache import get_tag_category_cache
+
 
 class ClippingTagDialog(QDialog):
     tags_confirmed = Signal(dict, Path)  # Signal emitted when tags are confirmed
 
-    def __init__(self, clipping_path: Path, parent=None, tag_sorter=None):
+    def __init__(self, clipping_path: Path, parent=None, tag_sorting_service=None,
+                 preview: QImage | None = None):
         super().__init__(parent)
         self.clipping_path = clipping_path
-        self.tag_sorter = tag_sorter  # Store tag sorter
+        # The cropped image, shown before it is saved to the clipping path
+        self.preview = preview
+        # Sorts tags in a worker thread shared by all dialogs
+        self.tag_sorting_service = tag_sorting_service
+        # IDs of the sorting requests made by this dialog that are pending
+        self.pending_request_ids = set()
+        # IDs of all sorting requests made by this dialog, which can report
+        # failed tags after their result
+        self.request_ids = set()
         self.setWindowTitle("Tag Clipping")
         self.setModal(True)
 
@@ -32,14 +43,17 @@ class ClippingTagDialog(QDialog):
 
         # Image preview
         self.preview_label = QLabel()
-        pixmap = QPixmap(str(self.clipping_path))
+        if self.preview is not None:
+            pixmap = QPixmap.fromImage(self.preview)
+        else:
+            pixmap = QPixmap(str(self.clipping_path))
         scaled_pixmap = pixmap.scaled(400, 300, Qt.AspectRatioMode.KeepAspectRatio,
                                       Qt.TransformationMode.SmoothTransformation)
         self.preview_label.setPixmap(scaled_pixmap)
         layout.addWidget(self.preview_label)
 
         # Bulk input section with auto-sort
-        if self.tag_sorter:
+        if self.tag_sorting_service:
             bulk_layout = QHBoxLayout()
             self.bulk_input = QLineEdit()
             self.bulk_input.setPlaceholderText("Enter multiple tags separated by commas")
@@ -112,9 +126,11 @@ class ClippingTagDialog(QDialog):
         self.setting_input.returnPressed.connect(lambda: self.add_tag("settings"))
         self.action_input.returnPressed.connect(lambda: self.add_tag("actions"))
 
-        if hasattr(self, 'sort_button'):
+        if self.tag_sorting_service:
             self.sort_button.clicked.connect(self.auto_sort_tags)
             self.bulk_input.returnPressed.connect(self.auto_sort_tags)
+            self.tag_sorting_service.sorting_completed.connect(self.handle_sorted_tags)
+            self.tag_sorting_service.sorting_failed.connect(self.handle_sorting_error)
 
         self.save_button.clicked.connect(self.handle_save)
         self.cancel_button.clicked.connect(self.reject)
@@ -133,6 +149,8 @@ class ClippingTagDialog(QDialog):
         tag = input_field.text().strip()
 
         if tag:
+            # A manually categorized tag overrides the tag sorter
+            get_tag_category_cache().set_corrections({tag: category})
             if tag not in self.current_tags[category]:
                 self.current_tags[category].append(tag)
                 input_field.clear()
@@ -141,46 +159,29 @@ class ClippingTagDialog(QDialog):
                 input_field.clear()
 
     def auto_sort_tags(self):
-        """Use the LLM to automatically sort tags"""
-        if not self.tag_sorter:
+        """Request the tags in the bulk input to be sorted in the background"""
+        if not self.tag_sorting_service:
             return
 
         text = self.bulk_input.text().strip()
         if not text:
             return
 
-        # Show loading state
-        self.loading_label.show()
-        self.sort_button.setEnabled(False)
-        self.bulk_input.setEnabled(False)
-
-        try:
-            # Split the input into individual tags
-            tags = [tag.strip() for tag in text.split(',') if tag.strip()]
-
-            # Use the tag sorter to categorize the tags
-            categorized_tags = self.tag_sorter.sort_tags(tags)
-
-            # Update the current tags
-            for category, new_tags in categorized_tags.items():
-                # Add new tags while avoiding duplicates
-                self.current_tags[category].extend(
-                    tag for tag in new_tags
-                    if tag not in self.current_tags[category]
-                )
-
-            # Clear the input and update display
-            self.bulk_input.clear()
-            self.update_tag_display()
+        # Split the input into individual tags
+        tags = [tag.strip() for tag in text.split(',') if tag.strip()]
+        if not tags:
+            return
 
-        except Exception as e:
-            QMessageBox.warning(self, "Sorting Error", f"Failed to sort tags: {str(e)}")
+        # Show loading state until the result arrives
+        self.set_is_sorting(True)
+        request_id = self.tag_sorting_service.request_sort(tags)
+        self.pending_request_ids.add(request_id)
+        self.request_ids.add(request_id)
 
-        finally:
-            # Reset UI state
-            self.loading_label.hide()
-            self.sort_button.setEnabled(True)
-            self.bulk_input.setEnabled(True)
+    def set_is_sorting(self, is_sorting: bool):
+        self.loading_label.setVisible(is_sorting)
+        self.sort_button.setEnabled(not is_sorting)
+        self.bulk_input.setEnabled(not is_sorting)
 
     def update_tag_display(self):
         """Update the tag display with clear category separation"""
@@ -234,63 +235,18 @@ class ClippingTagDialog(QDialog):
             return
         super().keyPressEvent(event)
 
-    def sort_bulk_tags(self):
-        """Handle sorting of bulk tags with improved debugging"""
-        if not self.tag_sorter:
-            return
-
-        text = self.bulk_input.text().strip()
-        if not text:
-            return
-
-        # Process the tags
-        tags = [t.strip() for t in text.split(',') if t.strip()]
-        if not tags:
-            return
-
-        print(f"\nProcessing input tags: {tags}")
-        self.sort_button.setEnabled(False)
-        QApplication.processEvents()
-
-        try:
-            # Sort tags
-            result = self.tag_sorter.sort_tags(tags)
-
-            # Show what we got back
-            print("\nReceived classifications:")
-            for category, category_tags in result.items():
-                print(f"{category}: {category_tags}")
-
-            # Update tags
-            modified = False
-            for category, new_tags in result.items():
-                if new_tags:
-                    print(f"\nAdding to {category}: {new_tags}")
-                    self.current_tags[category].extend(new_tags)
-                    self.current_tags[category] = list(dict.fromkeys(self.current_tags[category]))
-                    modified = True
-
-            if modified:
-                self.update_tag_display()
-                print("\nFinal tag state:")
-                for category, tags in self.current_tags.items():
-                    print(f"{category}: {tags}")
-
-        except Exception as e:
-            print(f"Error in sort_bulk_tags: {str(e)}")
-            import traceback
-            traceback.print_exc()
-        finally:
-            self.sort_button.setEnabled(True)
-
-    def handle_sorted_tags(self, result: dict):
+    @Slot(int, dict)
+    def handle_sorted_tags(self, request_id: int, result: dict):
         """Handle the sorted tags result with better debugging"""
+        # Ignore requests made by other dialogs
+        if request_id not in self.pending_request_ids:
+            return
+        self.pending_request_ids.discard(request_id)
+        self.set_is_sorting(False)
         try:
             print("\nReceived sorted tags:")
             print(json.dumps(result, indent=2))
 
-            self.sort_button.setEnabled(True)
-
             # Validate the result structure
             if not isinstance(result, dict):
                 print(f"Error: Expected dict, got {type(result)}")
@@ -320,7 +276,21 @@ class ClippingTagDialog(QDialog):
             import traceback
             traceback.print_exc()
 
-    def handle_sorting_error(self, error_msg: str):
+    @Slot(int, str)
+    def handle_sorting_error(self, request_id: int, error_msg: str):
         """Handle sorting errors"""
-        self.sort_button.setEnabled(True)
-        QMessageBox.warning(self, "Sorting Error", error_msg)
\ No newline at end of file
+        if request_id not in self.request_ids:
+            return
+        self.pending_request_ids.discard(request_id)
+        self.set_is_sorting(bool(self.pending_request_ids))
+        QMessageBox.warning(self, "Sorting Error", f"Failed to sort tags: {error_msg}")
+
+    def done(self, result: int):
+        """Cancel pending sorting requests when the dialog is closed"""
+        if self.tag_sorting_service:
+            for request_id in self.pending_request_ids:
+                self.tag_sorting_service.cancel(request_id)
+            self.pending_request_ids.clear()
+            self.tag_sorting_service.sorting_completed.disconnect(self.handle_sorted_tags)
+            self.tag_sorting_service.sorting_failed.disconnect(self.handle_sorting_error)
+        super().done(result)
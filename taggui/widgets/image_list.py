@@ -1,4 +1,5 @@
 import shutil
+from dataclasses import replace
 from enum import Enum
 from functools import reduce
 from operator import or_
@@ -18,6 +19,7 @@ from pyparsing import (CaselessKeyword, CaselessLiteral, Group, OpAssoc,
 
 from models.proxy_image_list_model import ProxyImageListModel
 from utils.image import Image
+from utils.json_tags import JSON_TAG_CATEGORIES, get_json_path
 from utils.settings import get_settings
 from utils.settings_widgets import SettingsComboBox
 from utils.utils import get_confirmation_dialog_reply, pluralize
@@ -48,12 +50,16 @@ class FilterLineEdit(QLineEdit):
                                     | QuotedString(quote_char="'",
                                                    esc_char='\\')
                                     | Word(printables, exclude_chars='()'))
-        string_filter_keys = ['tag', 'caption', 'name', 'path']
+        # The JSON tag keys are the singular forms of the categories.
+        string_filter_keys = ['tag', 'caption', 'name', 'path',
+                              *(category[:-1]
+                                for category in JSON_TAG_CATEGORIES)]
         string_filter_expressions = [Group(CaselessLiteral(key) + Suppress(':')
                                            + optionally_quoted_string)
                                      for key in string_filter_keys]
         comparison_operator = one_of('= == != < > <= >=')
-        number_filter_keys = ['tags', 'chars', 'tokens']
+        number_filter_keys = ['tags', 'chars', 'tokens',
+                              *JSON_TAG_CATEGORIES]
         number_filter_expressions = [Group(CaselessLiteral(key) + Suppress(':')
                                            + comparison_operator + Word(nums))
                                      for key in number_filter_keys]
@@ -98,7 +104,6 @@ class SelectionMode(str, Enum):
 
 class ImageListView(QListView):
     tags_paste_requested = Signal(list, list)
-    directory_reload_requested = Signal()
 
     def __init__(self, parent, proxy_image_list_model: ProxyImageListModel,
                  tag_separator: str, image_width: int):
@@ -228,6 +233,29 @@ class ImageListView(QListView):
         selected_image_paths = [str(image.path) for image in selected_images]
         QApplication.clipboard().setText('\n'.join(selected_image_paths))
 
+    @staticmethod
+    def get_sidecar_paths(image_path: Path) -> list[Path]:
+        """Get the paths of the caption and JSON tags files of an image."""
+        return [path for path in (image_path.with_suffix('.txt'),
+                                  get_json_path(image_path))
+                if path.exists()]
+
+    def delete_replaced_sidecar_files(self, sidecar_paths: list[Path],
+                                      destination_path: Path):
+        """
+        Delete the sidecar files of a file that was replaced by an image
+        without them, so that the old tags are not loaded for the image.
+        """
+        sidecar_names = {path.name for path in sidecar_paths}
+        for path in self.get_sidecar_paths(destination_path):
+            if path.name in sidecar_names:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                QMessageBox.critical(self, 'Error',
+                                     f'Failed to delete {path}.')
+
     @Slot()
     def move_selected_images(self):
         selected_images = self.get_selected_images()
@@ -242,18 +270,44 @@ class ImageListView(QListView):
         if not move_directory_path:
             return
         move_directory_path = Path(move_directory_path)
+        image_list_model = self.proxy_image_list_model.sourceModel()
+        # Write the pending JSON tags before their files are moved.
+        image_list_model.json_tags_persister.wait()
+        moved_images = []
         for image in selected_images:
+            sidecar_paths = self.get_sidecar_paths(image.path)
+            destination_path = move_directory_path / image.path.name
+            if destination_path == image.path:
+                continue
+            is_replacing = destination_path.exists()
             try:
-                image.path.replace(move_directory_path / image.path.name)
-                caption_file_path = image.path.with_suffix('.txt')
-                if caption_file_path.exists():
-                    caption_file_path.replace(
-                        move_directory_path / caption_file_path.name)
+                image.path.replace(destination_path)
             except OSError:
                 QMessageBox.critical(self, 'Error',
                                      f'Failed to move {image.path} to '
                                      f'{move_directory_path}.')
-        self.directory_reload_requested.emit()
+                continue
+            moved_images.append(image)
+            if is_replacing:
+                self.delete_replaced_sidecar_files(sidecar_paths,
+                                                   destination_path)
+            for sidecar_path in sidecar_paths:
+                try:
+                    sidecar_path.replace(
+                        move_directory_path / sidecar_path.name)
+                except OSError:
+                    QMessageBox.critical(self, 'Error',
+                                         f'Failed to move {sidecar_path} to '
+                                         f'{move_directory_path}.')
+        # Images moved to another directory in the loaded directory stay in
+        # the image list, with their tags and thumbnails. The tags of images
+        # moved out of it are written in their new directory, which is needed
+        # when the tags are stored in a manifest.
+        image_list_model.remove_images(
+            [image.path for image in moved_images])
+        image_list_model.add_images(
+            [replace(image, path=move_directory_path / image.path.name)
+             for image in moved_images])
 
     @Slot()
     def copy_selected_images(self):
@@ -269,16 +323,36 @@ class ImageListView(QListView):
         if not copy_directory_path:
             return
         copy_directory_path = Path(copy_directory_path)
+        image_list_model = self.proxy_image_list_model.sourceModel()
+        # Write the pending JSON tags before their files are copied.
+        image_list_model.json_tags_persister.wait()
+        copied_images = []
         for image in selected_images:
+            sidecar_paths = self.get_sidecar_paths(image.path)
+            destination_path = copy_directory_path / image.path.name
+            is_replacing = destination_path.exists()
             try:
                 shutil.copy(image.path, copy_directory_path)
-                caption_file_path = image.path.with_suffix('.txt')
-                if caption_file_path.exists():
-                    shutil.copy(caption_file_path, copy_directory_path)
             except OSError:
                 QMessageBox.critical(self, 'Error',
                                      f'Failed to copy {image.path} to '
                                      f'{copy_directory_path}.')
+                continue
+            if is_replacing:
+                self.delete_replaced_sidecar_files(sidecar_paths,
+                                                   destination_path)
+            for sidecar_path in sidecar_paths:
+                try:
+                    shutil.copy(sidecar_path, copy_directory_path)
+                except OSError:
+                    QMessageBox.critical(self, 'Error',
+                                         f'Failed to copy {sidecar_path} to '
+                                         f'{copy_directory_path}.')
+            copied_images.append(
+                replace(image, path=destination_path, tags=image.tags.copy()))
+        # Copies in the loaded directory are added to the image list, and
+        # replace the images that they overwrote.
+        image_list_model.add_images(copied_images)
 
     @Slot()
     def delete_selected_images(self):
@@ -292,19 +366,23 @@ class ImageListView(QListView):
         reply = get_confirmation_dialog_reply(title, question)
         if reply != QMessageBox.StandardButton.Yes:
             return
+        image_list_model = self.proxy_image_list_model.sourceModel()
+        # Pending JSON tags would be written after their files are deleted.
+        image_list_model.json_tags_persister.wait()
+        deleted_image_paths = []
         for image in selected_images:
             image_file = QFile(image.path)
             if not image_file.moveToTrash():
                 QMessageBox.critical(self, 'Error',
                                      f'Failed to delete {image.path}.')
-            caption_file_path = image.path.with_suffix('.txt')
-            caption_file = QFile(caption_file_path)
-            if caption_file.exists():
-                if not caption_file.moveToTrash():
+                continue
+            deleted_image_paths.append(image.path)
+            for sidecar_path in self.get_sidecar_paths(image.path):
+                if not QFile(sidecar_path).moveToTrash():
                     QMessageBox.critical(self, 'Error',
                                          f'Failed to delete '
-                                         f'{caption_file_path}.')
-        self.directory_reload_requested.emit()
+                                         f'{sidecar_path}.')
+        image_list_model.remove_images(deleted_image_paths)
 
     @Slot()
     def open_image(self):
@@ -1,13 +1,14 @@
-from PySide6.QtCore import (QItemSelectionModel, QModelIndex, QStringListModel,
-                            QTimer, Qt, Signal, Slot)
+from PySide6.QtCore import (QItemSelectionModel, QModelIndex,
+                            QPersistentModelIndex, QStringListModel, QTimer,
+                            Qt, Signal, Slot)
 from PySide6.QtGui import QKeyEvent
 from PySide6.QtWidgets import (QAbstractItemView, QCompleter, QDockWidget,
                                QLabel, QLineEdit, QListView, QMessageBox,
                                QVBoxLayout, QWidget)
-from transformers import PreTrainedTokenizerBase
 
 from models.proxy_image_list_model import ProxyImageListModel
 from models.tag_counter_model import TagCounterModel
+from utils.clip_tokenizer import count_clip_tokens
 from utils.image import Image
 from utils.text_edit_item_delegate import TextEditItemDelegate
 from utils.utils import get_confirmation_dialog_reply
@@ -192,13 +193,12 @@ class ImageTagsEditor(QDockWidget):
     def __init__(self, proxy_image_list_model: ProxyImageListModel,
                  tag_counter_model: TagCounterModel,
                  image_tag_list_model: QStringListModel, image_list: ImageList,
-                 tokenizer: PreTrainedTokenizerBase, tag_separator: str):
+                 tag_separator: str):
         super().__init__()
         self.proxy_image_list_model = proxy_image_list_model
         self.image_tag_list_model = image_tag_list_model
-        self.tokenizer = tokenizer
         self.tag_separator = tag_separator
-        self.image_index = None
+        self.image_index: QPersistentModelIndex | None = None
 
         # Each `QDockWidget` needs a unique object name for saving its state.
         self.setObjectName('image_tags_editor')
@@ -235,8 +235,7 @@ class ImageTagsEditor(QDockWidget):
     def count_tokens(self):
         caption = self.tag_separator.join(
             self.image_tag_list_model.stringList())
-        # Subtract 2 for the `<|startoftext|>` and `<|endoftext|>` tokens.
-        caption_token_count = len(self.tokenizer(caption).input_ids) - 2
+        caption_token_count = count_clip_tokens(caption)
         if caption_token_count > MAX_TOKEN_COUNT:
             self.token_count_label.setStyleSheet('color: red;')
         else:
@@ -258,8 +257,10 @@ class ImageTagsEditor(QDockWidget):
 
     @Slot()
     def load_image_tags(self, proxy_image_index: QModelIndex):
-        """Load only text tags from .txt files"""
-        self.image_index = self.proxy_image_list_model.mapToSource(proxy_image_index)
+        """Load only the text tags of an image."""
+        # The row of the image changes when images are added or removed.
+        self.image_index = QPersistentModelIndex(
+            self.proxy_image_list_model.mapToSource(proxy_image_index))
 
         # Get image from source model
         source_model = self.proxy_image_list_model.sourceModel()
@@ -268,22 +269,7 @@ class ImageTagsEditor(QDockWidget):
         if image is None:
             return
 
-        # Only load tags from .txt file
-        try:
-            txt_path = image.path.with_suffix('.txt')
-            if txt_path.exists():
-                text = txt_path.read_text(encoding='utf-8', errors='replace')
-                if text:
-                    tags = [tag.strip() for tag in text.split(self.tag_separator) if tag.strip()]
-                    self.image_tag_list_model.setStringList(tags)
-                else:
-                    self.image_tag_list_model.setStringList([])
-            else:
-                self.image_tag_list_model.setStringList([])
-        except OSError as e:
-            print(f"Error reading text tags: {str(e)}")
-            self.image_tag_list_model.setStringList([])
-
+        self.image_tag_list_model.setStringList(image.tags)
         self.count_tokens()
 
         if self.image_tags_list.hasFocus():
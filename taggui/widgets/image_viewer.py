@@ -1,19 +1,29 @@
 from pathlib import Path
 
-from PySide6.QtCore import QModelIndex, QSize, Qt, Slot
-from PySide6.QtGui import QImageReader, QPixmap, QResizeEvent
+from PySide6.QtCore import QModelIndex, QSize, Qt, QTimer, Slot
+from PySide6.QtGui import (QImage, QPaintEvent, QPixmap, QResizeEvent,
+                           QTransform)
 from PySide6.QtWidgets import (QLabel, QSizePolicy, QVBoxLayout, QWidget,
                               QRubberBand, QMessageBox, QDialog)
 from models.proxy_image_list_model import ProxyImageListModel
+from utils.clip_extractor import (ClipExtractor, QueuedClip, crop_image,
+                                  crop_preview)
 from utils.image import Image
+from utils.image_prefetcher import (PREFETCH_IMAGE_COUNT, DecodedImage,
+                                    ImagePrefetcher, get_orientation_transform,
+                                    read_display_image)
 
-from PySide6.QtCore import Qt, QRect, QPoint, Signal, Slot
+from PySide6.QtCore import Qt, QRect, QRectF, QPoint, QPointF, Signal, Slot
 from PySide6.QtGui import QPainter, QPen, QColor
 from PySide6.QtWidgets import QRubberBand, QMessageBox
-from PIL import Image as PILImage
 import os
 from .clipping_tag_dialog import ClippingTagDialog  # Add this import
-import json
+from .zoomable_image_view import ZoomableImageView
+
+# Delay after the last resize before the image is scaled smoothly.
+SMOOTH_SCALING_DELAY_MS = 150
+# Mipmap levels are created until the image is smaller than this size.
+MIN_MIPMAP_LEVEL_SIZE = 512
 
 
 class ImageLabel(QLabel):
@@ -25,29 +35,83 @@ class ImageLabel(QLabel):
         self.origin = QPoint()
         self.is_clipping_mode = False
         self.current_image_rect = None
+        # The regions queued to be clipped, in the pixel coordinates of the
+        # image as stored.
+        self.clip_rects: list[QRect] = []
         # Keep existing ImageLabel functionality
         self.image_path = None
+        self.decoded_image: DecodedImage | None = None
+        # The decoded image, which can be smaller than the original image.
+        self.image: QImage | None = None
+        # Images of half the size of the previous level, used to scale the
+        # image quickly while the label is being resized.
+        self.mipmap_levels: list[QImage] = []
+        self.smooth_scaling_timer = QTimer(self)
+        self.smooth_scaling_timer.setSingleShot(True)
+        self.smooth_scaling_timer.setInterval(SMOOTH_SCALING_DELAY_MS)
+        self.smooth_scaling_timer.timeout.connect(self.update_pixmap)
         self.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.setSizePolicy(QSizePolicy.Policy.Expanding,
                            QSizePolicy.Policy.Expanding)
         self.setMinimumSize(QSize(1, 1))
 
     def resizeEvent(self, event: QResizeEvent):
-        """Reload the image whenever the label is resized."""
-        if self.image_path:
-            self.load_image(self.image_path)
+        """
+        Rescale the image quickly whenever the label is resized, and smoothly
+        once resizing stops.
+        """
+        if self.image is None:
+            return
+        self.update_pixmap(Qt.TransformationMode.FastTransformation)
+        self.smooth_scaling_timer.start()
 
     def load_image(self, image_path: Path):
-        """Keep existing load_image functionality"""
+        """Decode an image and show it."""
+        self.set_image(image_path, read_display_image(image_path, None))
+
+    def set_image(self, image_path: Path, decoded_image: DecodedImage):
+        """Show an image that was already decoded."""
         self.image_path = image_path
-        image_reader = QImageReader(str(image_path))
-        image_reader.setAutoTransform(True)
-        pixmap = QPixmap.fromImageReader(image_reader)
+        self.decoded_image = decoded_image
+        self.image = decoded_image.image
+        # The mipmap levels are only created when the label is resized.
+        self.mipmap_levels = []
+        self.smooth_scaling_timer.stop()
+        self.update_pixmap()
+
+    def get_mipmap_level(self, size: QSize) -> QImage:
+        """
+        Get the smallest mipmap level of the image that is at least as large
+        as `size` in one dimension, so that it is not scaled up.
+        """
+        if not self.mipmap_levels:
+            self.mipmap_levels = [self.image]
+            level = self.image
+            while min(level.width(), level.height()) >= MIN_MIPMAP_LEVEL_SIZE:
+                level = level.scaled(
+                    level.width() // 2, level.height() // 2,
+                    Qt.AspectRatioMode.IgnoreAspectRatio,
+                    Qt.TransformationMode.SmoothTransformation)
+                self.mipmap_levels.append(level)
+        for level in reversed(self.mipmap_levels):
+            if (level.width() >= size.width()
+                    or level.height() >= size.height()):
+                return level
+        return self.image
+
+    @Slot()
+    def update_pixmap(self, transformation_mode: Qt.TransformationMode
+                      = Qt.TransformationMode.SmoothTransformation):
+        if self.image is None:
+            return
+        size = self.size() * self.devicePixelRatio()
+        if transformation_mode == Qt.TransformationMode.FastTransformation:
+            source_image = self.get_mipmap_level(size)
+        else:
+            source_image = self.image
+        pixmap = QPixmap.fromImage(source_image.scaled(
+            size, Qt.AspectRatioMode.KeepAspectRatio, transformation_mode))
         pixmap.setDevicePixelRatio(self.devicePixelRatio())
-        pixmap = pixmap.scaled(
-            self.size() * pixmap.devicePixelRatio(),
-            Qt.AspectRatioMode.KeepAspectRatio,
-            Qt.TransformationMode.SmoothTransformation)
         self.setPixmap(pixmap)
 
         # Store the actual image rect for proper coordinate transformation
@@ -74,6 +138,38 @@ class ImageLabel(QLabel):
             scaled_w = int(pw * h / ph)
             return QRect((w - scaled_w) // 2, 0, scaled_w, h)
 
+    def get_image_transform(self) -> QTransform:
+        """
+        Get the transform from the pixel coordinates of the image as stored to
+        the coordinates of the label.
+        """
+        original_size = self.decoded_image.original_size
+        orientation_transform = get_orientation_transform(
+            self.decoded_image.transformation, original_size.width(),
+            original_size.height())
+        rotated_size = orientation_transform.mapRect(
+            QRectF(QPointF(0, 0), original_size.toSizeF())).size()
+        display_rect = self.current_image_rect
+        return orientation_transform * QTransform(
+            display_rect.width() / rotated_size.width(), 0, 0,
+            display_rect.height() / rotated_size.height(),
+            display_rect.x(), display_rect.y())
+
+    def set_clip_rects(self, clip_rects: list[QRect]):
+        """Outline the regions of the image that are queued to be clipped."""
+        self.clip_rects = clip_rects
+        self.update()
+
+    def paintEvent(self, event: QPaintEvent):
+        super().paintEvent(event)
+        if not self.clip_rects or not self.current_image_rect:
+            return
+        painter = QPainter(self)
+        painter.setPen(QPen(QColor(255, 0, 0), 2))
+        image_transform = self.get_image_transform()
+        for clip_rect in self.clip_rects:
+            painter.drawRect(image_transform.mapRect(QRectF(clip_rect)))
+
     # Add new clipping-related methods
     def enterClippingMode(self):
         """Enable clipping mode"""
@@ -115,43 +211,77 @@ class ImageLabel(QLabel):
             self.rubberBand.hide()
             return
 
-        # Convert the selection rectangle to image coordinates
+        # Convert the selection rectangle to the pixel coordinates of the
+        # image as stored, which are used to crop it.
         if self.current_image_rect:
-            # Get original image dimensions
-            image_reader = QImageReader(str(self.image_path))
-            original_width = image_reader.size().width()
-            original_height = image_reader.size().height()
-
-            # Calculate scaling factors
-            display_rect = self.current_image_rect
-            scale_x = original_width / display_rect.width()
-            scale_y = original_height / display_rect.height()
-
-            # Transform coordinates to image space
-            image_x = int((clip_rect.x() - display_rect.x()) * scale_x)
-            image_y = int((clip_rect.y() - display_rect.y()) * scale_y)
-            image_width = int(clip_rect.width() * scale_x)
-            image_height = int(clip_rect.height() * scale_y)
-
-            # Create the final rectangle in image coordinates
-            image_clip_rect = QRect(image_x, image_y, image_width, image_height)
-
-            self.clip_created.emit(image_clip_rect)
+            original_rect = QRectF(
+                QPointF(0, 0), self.decoded_image.original_size.toSizeF())
+            image_clip_rect = self.get_image_transform().inverted()[0].mapRect(
+                QRectF(clip_rect)).intersected(original_rect).toRect()
+            if not image_clip_rect.isEmpty():
+                self.clip_created.emit(image_clip_rect)
 
         self.rubberBand.hide()
 
 
 class ImageViewer(QWidget):
-    def __init__(self, proxy_image_list_model, tag_sorter=None):
+    queued_clips_changed = Signal()
+
+    def __init__(self, proxy_image_list_model, tag_sorting_service=None):
         super().__init__()
         self.proxy_image_list_model = proxy_image_list_model
-        self.tag_sorter = tag_sorter
+        self.tag_sorting_service = tag_sorting_service
         self.image_label = ImageLabel()
-        QVBoxLayout(self).addWidget(self.image_label)
+        self.zoomable_image_view = ZoomableImageView()
+        self.zoomable_image_view.hide()
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.image_label)
+        layout.addWidget(self.zoomable_image_view)
+        self.image_prefetcher = ImagePrefetcher()
+        self.clip_extractor = ClipExtractor()
 
         # Connect the clip_created signal
         self.image_label.clip_created.connect(self.handle_clip_created)
+        self.zoomable_image_view.clip_created.connect(self.handle_clip_created)
+        self.image_prefetcher.image_decoded.connect(self.handle_image_decoded)
+        self.clip_extractor.clip_saving_failed.connect(
+            self.show_clip_saving_error)
         self.current_image_path = None
+        # The image that is shown and its decoded image.
+        self.shown_image_path = None
+        self.shown_decoded_image: DecodedImage | None = None
+        # Whether clips are queued and saved together instead of being saved
+        # when they are created.
+        self.is_queueing_clips = False
+        self.queued_clips: list[QueuedClip] = []
+
+    def is_zoom_enabled(self) -> bool:
+        return not self.zoomable_image_view.isHidden()
+
+    @Slot(bool)
+    def set_zoom_enabled(self, is_zoom_enabled: bool):
+        """Switch between the fitted image and the zoomable image."""
+        self.image_label.setHidden(is_zoom_enabled)
+        self.zoomable_image_view.setHidden(not is_zoom_enabled)
+        if self.shown_image_path:
+            self.show_image(self.shown_image_path, self.shown_decoded_image)
+
+    def show_image(self, image_path: Path, decoded_image: DecodedImage):
+        self.shown_image_path = image_path
+        self.shown_decoded_image = decoded_image
+        if self.is_zoom_enabled():
+            self.zoomable_image_view.set_image(image_path, decoded_image)
+        else:
+            self.image_label.set_image(image_path, decoded_image)
+        self.update_clip_rects()
+
+    def get_decoding_size(self) -> QSize:
+        """
+        Get the size that images are decoded at, which is the size of the
+        screen in device pixels, so that the image fits at any label size.
+        """
+        screen = self.screen()
+        return screen.size() * screen.devicePixelRatio()
 
     @Slot()
     def load_image(self, proxy_image_index):
@@ -159,83 +289,142 @@ class ImageViewer(QWidget):
         image = self.proxy_image_list_model.data(
             proxy_image_index, Qt.ItemDataRole.UserRole)
         self.current_image_path = image.path
-        self.image_label.load_image(image.path)
+        decoding_size = self.get_decoding_size()
+        # If the image is already being decoded in the background, it is shown
+        # when it is decoded instead of decoding it twice.
+        if not self.image_prefetcher.is_decoding(image.path):
+            self.show_image(
+                image.path,
+                self.image_prefetcher.get_image(image.path, decoding_size))
+        self.prefetch_images(proxy_image_index.row(), decoding_size)
+
+    def prefetch_images(self, row: int, decoding_size: QSize):
+        """
+        Decode the images before and after an image in the image list, the
+        closest ones first.
+        """
+        rows = [row]
+        for offset in range(1, PREFETCH_IMAGE_COUNT + 1):
+            rows.extend((row + offset, row - offset))
+        image_paths = []
+        for row in rows:
+            if not 0 <= row < self.proxy_image_list_model.rowCount():
+                continue
+            image = self.proxy_image_list_model.data(
+                self.proxy_image_list_model.index(row, 0),
+                Qt.ItemDataRole.UserRole)
+            image_paths.append(image.path)
+        self.image_prefetcher.prefetch(image_paths, decoding_size)
+
+    @Slot(Path)
+    def handle_image_decoded(self, image_path: Path):
+        if (image_path != self.current_image_path
+                or image_path == self.shown_image_path):
+            return
+        self.show_image(
+            image_path, self.image_prefetcher.get_image(
+                image_path, self.get_decoding_size()))
 
     # Add new clipping-related methods
     def enterClippingMode(self):
         """Enable clipping mode"""
         self.image_label.enterClippingMode()
+        self.zoomable_image_view.enterClippingMode()
 
     def exitClippingMode(self):
         """Disable clipping mode"""
         self.image_label.exitClippingMode()
+        self.zoomable_image_view.exitClippingMode()
 
-    def handle_clip_created(self, clip_rect):
+    def handle_clip_created(self, clip_rect: QRect):
         """Handle the creation of a new clip"""
-        if not self.current_image_path:
+        # The clip is drawn on the shown image, which can still be the
+        # previous image while the current image is being decoded.
+        if not self.shown_image_path:
             return
-
-        try:
-            # Open the original image with PIL
-            with PILImage.open(str(self.current_image_path)) as img:
-                # Crop the image using the corrected coordinates
-                cropped = img.crop((
-                    max(0, clip_rect.x()),
-                    max(0, clip_rect.y()),
-                    min(img.width, clip_rect.x() + clip_rect.width()),
-                    min(img.height, clip_rect.y() + clip_rect.height())
-                ))
-
-                # Generate the new filename
-                base_path = os.path.splitext(str(self.current_image_path))[0]
-                extension = os.path.splitext(str(self.current_image_path))[1]
-
-                # Find the next available clip number
-                clip_num = 1
-                while True:
-                    new_path = f"{base_path}_clip{clip_num}{extension}"
-                    if not os.path.exists(new_path):
-                        break
-                    clip_num += 1
-
-                # Save the cropped image
-                cropped.save(new_path)
-                new_path = Path(new_path)
-
-                # Show the tagging dialog
-                dialog = ClippingTagDialog(new_path, self, tag_sorter=self.tag_sorter)  # Pass tag_sorter to dialog
-                dialog.tags_confirmed.connect(self.save_clip_tags)
-
-                if dialog.exec() == QDialog.DialogCode.Rejected:
-                    # If dialog was canceled, delete the saved clip
-                    try:
-                        os.remove(new_path)
-                    except OSError:
-                        pass
-                    return
-
-        except Exception as e:
+        image_path = self.shown_image_path
+        decoded_image = self.shown_decoded_image
+        if self.is_queueing_clips:
+            # Queued clips are only cropped from the file when they are saved.
+            clip = None
+            preview = crop_preview(decoded_image, clip_rect)
+        else:
+            clip = crop_image(image_path, clip_rect, decoded_image)
+            preview = clip
+        if preview.isNull():
             QMessageBox.critical(self, "Error",
-                                 f"Failed to save clip: {str(e)}")
+                                 f"Failed to crop {image_path.name}.")
+            return
+        clip_name_allocator = self.clip_extractor.clip_name_allocator
+        clip_path = clip_name_allocator.allocate(image_path)
+
+        # Show the tagging dialog. The clip is only saved, in the background,
+        # if the tags are confirmed.
+        dialog = ClippingTagDialog(
+            clip_path, self, tag_sorting_service=self.tag_sorting_service,
+            preview=preview)
+        dialog.tags_confirmed.connect(
+            lambda tags, path: self.add_clip(
+                QueuedClip(image_path, clip_rect, path, tags, clip)))
+        if dialog.exec() == QDialog.DialogCode.Rejected:
+            clip_name_allocator.release(image_path, clip_path)
+
+    def add_clip(self, queued_clip: QueuedClip):
+        """Queue a clip, or save it if clips are not queued."""
+        if not self.is_queueing_clips:
+            self.clip_extractor.save_clips([queued_clip])
+            return
+        self.queued_clips.append(queued_clip)
+        self.handle_queued_clips_changed()
 
-    def save_clip_tags(self, tags: dict, clip_path: Path):
-        """Save the JSON tags for the clip"""
-        try:
-            # Save JSON tags only
-            json_path = clip_path.with_suffix('.json')
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(tags, f, indent=2, ensure_ascii=False)
+    def handle_queued_clips_changed(self):
+        self.update_clip_rects()
+        self.queued_clips_changed.emit()
 
-            QMessageBox.information(self, "Success",
-                                    f"Clip saved as: {clip_path.name}")
+    def update_clip_rects(self):
+        """Outline the queued clips of the shown image."""
+        clip_rects = [queued_clip.clip_rect
+                      for queued_clip in self.queued_clips
+                      if queued_clip.image_path == self.shown_image_path]
+        self.image_label.set_clip_rects(clip_rects)
+        self.zoomable_image_view.set_clip_rects(clip_rects)
 
-        except Exception as e:
-            QMessageBox.critical(self, "Error",
-                                 f"Failed to save clip tags: {str(e)}")
-            import traceback
-            traceback.print_exc()
+    @Slot(bool)
+    def set_clip_queueing_enabled(self, is_queueing_clips: bool):
+        self.is_queueing_clips = is_queueing_clips
 
+    @Slot()
+    def save_queued_clips(self):
+        """Crop and save all queued clips together in the background."""
+        if not self.queued_clips:
+            return
+        self.clip_extractor.save_clips(self.queued_clips)
+        self.queued_clips = []
+        self.handle_queued_clips_changed()
 
+    @Slot()
+    def remove_last_queued_clip(self):
+        if not self.queued_clips:
+            return
+        queued_clip = self.queued_clips.pop()
+        self.clip_extractor.clip_name_allocator.release(
+            queued_clip.image_path, queued_clip.clip_path)
+        self.handle_queued_clips_changed()
+
+    @Slot()
+    def discard_queued_clips(self):
+        # Release the names from the latest, so that they can all be reused.
+        for queued_clip in reversed(self.queued_clips):
+            self.clip_extractor.clip_name_allocator.release(
+                queued_clip.image_path, queued_clip.clip_path)
+        self.queued_clips = []
+        self.handle_queued_clips_changed()
+
+    @Slot(Path, str)
+    def show_clip_saving_error(self, clip_path: Path, error_message: str):
+        QMessageBox.critical(self, "Error",
+                             f"Failed to save clip {clip_path.name}: "
+                             f"{error_message}")
 
     def _copy_associated_files(self, original_path, new_base_path):
         """Copy associated txt and json files for the clip"""
@@ -1,5 +1,6 @@
-from PySide6.QtCore import (QItemSelectionModel, QModelIndex, QStringListModel,
-                            QTimer, Qt, Signal, Slot)
+from PySide6.QtCore import (QItemSelectionModel, QModelIndex,
+                            QPersistentModelIndex, QStringListModel, QTimer,
+                            Qt, Signal, Slot)
 from PySide6.QtGui import QKeyEvent
 from PySide6.QtWidgets import (QAbstractItemView, QCompleter, QDockWidget,
                                QLabel, QLineEdit, QListView, QMessageBox,
@@ -10,21 +11,17 @@ from PySide6.QtGui import QBrush, QColor, QPen
 from PySide6.QtWidgets import (QStyledItemDelegate, QStyle, QLineEdit,
                               QStyleOptionViewItem)
 
-from transformers import PreTrainedTokenizerBase
-import json  # Add this import
-
-
 from models.proxy_image_list_model import ProxyImageListModel
 from models.tag_counter_model import TagCounterModel
+from utils.clip_tokenizer import count_clip_tokens
 from utils.image import Image
+from utils.json_tags import (copy_json_tags, get_display_tags,
+                             get_empty_json_tags, parse_display_tag)
+from utils.tag_category_cache import get_tag_category_cache
 from utils.text_edit_item_delegate import TextEditItemDelegate
-from utils.utils import get_confirmation_dialog_reply
-from widgets.image_list import ImageList
-
 from utils.utils import get_confirmation_dialog_reply, pluralize
-from pathlib import Path
-import json
-from typing import Dict, List
+from widgets.image_list import ImageList
+from typing import List
 
 
 MAX_TOKEN_COUNT = 75
@@ -112,19 +109,16 @@ class JsonTagsEditor(QDockWidget):
                  tag_counter_model: TagCounterModel,
                  image_tag_list_model: QStringListModel,
                  image_list: ImageList,
-                 tokenizer: PreTrainedTokenizerBase,
                  tag_separator: str):
         super().__init__()
         self.proxy_image_list_model = proxy_image_list_model
         self.image_tag_list_model = image_tag_list_model
-        self.tokenizer = tokenizer
         self.tag_separator = tag_separator
-        self.image_index = None
+        self.image_index: QPersistentModelIndex | None = None
         self.image_list = image_list
         self.tag_counter_model = tag_counter_model
 
-        # Initialize current_json_tags with empty structure
-        self.init_current_json_tags()
+        self.current_json_tags = get_empty_json_tags()
 
         self.setObjectName('json_tags_editor')
         self.setWindowTitle('JSON Tags')
@@ -139,9 +133,6 @@ class JsonTagsEditor(QDockWidget):
         self.image_tags_list.tag_deletion_requested.connect(self.handle_tag_deletion)
         self.image_tags_list.tag_edited.connect(self.handle_tag_edited)
 
-        # Debug print to verify signal connection
-        print("Connecting tag deletion signal")
-
         # Create layout
         container = QWidget()
         layout = QVBoxLayout(container)
@@ -166,95 +157,78 @@ class JsonTagsEditor(QDockWidget):
         if not self.image_index:
             return
 
-        try:
-            source_model = self.proxy_image_list_model.sourceModel()
-            image: Image = source_model.data(self.image_index, Qt.ItemDataRole.UserRole)
+        source_model = self.proxy_image_list_model.sourceModel()
+        image: Image = source_model.data(self.image_index, Qt.ItemDataRole.UserRole)
 
-            if not image:
-                return
+        if not image:
+            return
 
-            # Read current tags
-            current_tags = self.read_json_tags_from_disk(image.path)
-
-            # Parse old and new tags
-            old_category, old_value = old_tag.split(':', 1)
-            new_category, new_value = new_tag.split(':', 1)
-
-            # Update the appropriate category
-            if old_category == 'character':
-                current_tags["characters"].remove(old_value)
-                if new_category == 'character':
-                    current_tags["characters"].append(new_value)
-            elif old_category == 'setting':
-                current_tags["settings"].remove(old_value)
-                if new_category == 'setting':
-                    current_tags["settings"].append(new_value)
-            elif old_category == 'action':
-                current_tags["actions"].remove(old_value)
-                if new_category == 'action':
-                    current_tags["actions"].append(new_value)
-
-            # Write updated tags and refresh display
-            self.write_json_tags_to_disk(image.path, current_tags)
-            self.current_json_tags = current_tags
-            self.update_display()
+        current_tags = copy_json_tags(image.json_tags)
 
-        except Exception as e:
-            print(f"Error editing tag: {str(e)}")
+        # Parse old and new tags
+        old_category_and_tag = parse_display_tag(old_tag)
+        new_category_and_tag = parse_display_tag(new_tag)
+        if old_category_and_tag is None:
+            return
+        old_category, old_value = old_category_and_tag
+        if old_value in current_tags[old_category]:
+            current_tags[old_category].remove(old_value)
+        # A tag without a valid category is removed
+        if new_category_and_tag is not None:
+            new_category, new_value = new_category_and_tag
+            if new_category != old_category:
+                # Moving a tag to another category corrects the tag sorter
+                get_tag_category_cache().set_corrections(
+                    {new_value: new_category})
+            current_tags[new_category].append(new_value)
+
+        # Store the updated tags and refresh display
+        source_model.set_json_tags(self.image_index, current_tags,
+                                   action_name='Edit JSON Tag')
+        self.current_json_tags = current_tags
+        self.update_display()
 
     def handle_tag_deletion(self, tags_to_delete: list):
         """Handle deletion of tags from the JSON structure."""
         if not self.image_index:
             return
 
-        try:
-            # Get the current image
-            source_model = self.proxy_image_list_model.sourceModel()
-            image: Image = source_model.data(self.image_index, Qt.ItemDataRole.UserRole)
-
-            if not image:
-                return
-
-            # Read current tags
-            current_tags = self.read_json_tags_from_disk(image.path)
-            was_modified = False
-
-            # Process each tag for deletion
-            for tag in tags_to_delete:
-                try:
-                    category, value = tag.split(':', 1)
-                    json_category = f"{category}s"  # Convert to plural for JSON keys
-
-                    if json_category in current_tags and value in current_tags[json_category]:
-                        current_tags[json_category].remove(value)
-                        was_modified = True
-
-                except ValueError:
-                    print(f"Invalid tag format: {tag}")
-                    continue
-
-            if was_modified:
-                # Write updated tags back to disk
-                self.write_json_tags_to_disk(image.path, current_tags)
-
-                # Update the current tags
-                self.current_json_tags = current_tags
-                self.update_display()
+        # Get the current image
+        source_model = self.proxy_image_list_model.sourceModel()
+        image: Image = source_model.data(self.image_index, Qt.ItemDataRole.UserRole)
 
-                print(f"Tags deleted: {tags_to_delete}")  # Debug print
+        if not image:
+            return
 
-        except Exception as e:
-            print(f"Error deleting tags: {str(e)}")
-            import traceback
-            traceback.print_exc()
+        current_tags = copy_json_tags(image.json_tags)
+        was_modified = False
+
+        # Process each tag for deletion
+        for tag in tags_to_delete:
+            category_and_tag = parse_display_tag(tag)
+            if category_and_tag is None:
+                continue
+            category, value = category_and_tag
+            if value in current_tags[category]:
+                current_tags[category].remove(value)
+                was_modified = True
+
+        if was_modified:
+            source_model.set_json_tags(
+                self.image_index, current_tags,
+                action_name=f'Delete JSON '
+                            f'{pluralize("Tag", len(tags_to_delete))}')
+
+            # Update the current tags
+            self.current_json_tags = current_tags
+            self.update_display()
 
     @Slot()
     def count_tokens(self):
         """Count the total tokens in the current tags."""
         caption = self.tag_separator.join(
             self.image_tag_list_model.stringList())
-        # Subtract 2 for the `<|startoftext|>` and `<|endoftext|>` tokens
-        caption_token_count = len(self.tokenizer(caption).input_ids) - 2
+        caption_token_count = count_clip_tokens(caption)
         if caption_token_count > MAX_TOKEN_COUNT:
             self.token_count_label.setStyleSheet('color: red;')
         else:
@@ -264,128 +238,24 @@ class JsonTagsEditor(QDockWidget):
 
     @Slot(list, list)
     def handle_json_tags(self, tags: List[str], image_indices: List[QModelIndex]):
-        """Handle new JSON tags being added."""
-        if not image_indices:
-            return
-
-        # Process tags into categories
-        new_tags = {
-            "characters": [],
-            "settings": [],
-            "actions": []
-        }
-
-        # Categorize the tags
+        """
+        Remember the categories of manually added JSON tags. The tags are
+        added to the images by the main window.
+        """
+        # Manually categorized tags override the tag sorter
+        corrections = {}
         for tag in tags:
-            if tag.startswith("character:"):
-                new_tags["characters"].append(tag.replace("character:", "").strip())
-            elif tag.startswith("setting:"):
-                new_tags["settings"].append(tag.replace("setting:", "").strip())
-            elif tag.startswith("action:"):
-                new_tags["actions"].append(tag.replace("action:", "").strip())
-
-        # Get the currently selected image
-        current_image_index = self.image_index
-        if not current_image_index:
-            return
-
-        try:
-            # Get the current image
-            source_model = self.proxy_image_list_model.sourceModel()
-            current_image: Image = source_model.data(current_image_index, Qt.ItemDataRole.UserRole)
-
-            if not current_image or not hasattr(current_image, 'path'):
-                return
-
-            # Read existing JSON tags
-            existing_tags = self.read_json_tags_from_disk(current_image.path)
-
-            # Merge with new tags
-            merged_tags = {
-                "characters": existing_tags["characters"] + new_tags["characters"],
-                "settings": existing_tags["settings"] + new_tags["settings"],
-                "actions": existing_tags["actions"] + new_tags["actions"]
-            }
-
-            # Remove duplicates while preserving order
-            merged_tags = {
-                key: list(dict.fromkeys(value))
-                for key, value in merged_tags.items()
-            }
-
-            # Write the merged tags to disk
-            self.write_json_tags_to_disk(current_image.path, merged_tags)
-
-            # Update current tags and display
-            self.current_json_tags = merged_tags
-            self.update_display()
-
-        except Exception as e:
-            print(f"Error processing JSON tags: {str(e)}")
-            import traceback
-            traceback.print_exc()
-
-    def write_json_tags_to_disk(self, image_path: Path, tags: Dict[str, List[str]]):
-        """Write tags to a JSON file."""
-        try:
-            # Explicitly use .json extension
-            json_path = image_path.with_suffix('.json')
-            # Format the tags nicely
-            formatted_tags = {
-                "characters": sorted(list(set(tags["characters"]))),
-                "settings": sorted(list(set(tags["settings"]))),
-                "actions": sorted(list(set(tags["actions"])))
-            }
-            # Write formatted JSON with nice indentation
-            with json_path.open('w', encoding='utf-8') as f:
-                json.dump(formatted_tags, f, indent=2, ensure_ascii=False)
-        except OSError as e:
-            print(f"Error saving JSON tags: {str(e)}")
-
-    def read_json_tags_from_disk(self, image_path: Path) -> Dict[str, List[str]]:
-        """Read tags from a JSON file."""
-        empty_tags = {
-            "characters": [],
-            "settings": [],
-            "actions": []
-        }
-        try:
-            json_path = image_path.with_suffix('.json')
-            if json_path.exists():
-                with json_path.open('r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    return {
-                        "characters": list(data.get("characters", [])),
-                        "settings": list(data.get("settings", [])),
-                        "actions": list(data.get("actions", []))
-                    }
-        except (OSError, json.JSONDecodeError) as e:
-            print(f"Error reading JSON tags: {str(e)}")
-        return empty_tags
-
-    def init_current_json_tags(self):
-        """Initialize or reset current JSON tags structure."""
-        self.current_json_tags = {
-            "characters": [],
-            "settings": [],
-            "actions": []
-        }
-        return {
-            "characters": [],
-            "settings": [],
-            "actions": []
-        }
+            category_and_tag = parse_display_tag(tag)
+            if category_and_tag is not None:
+                category, value = category_and_tag
+                corrections[value] = category
+        get_tag_category_cache().set_corrections(corrections)
 
     def update_display(self):
         """Update display with only JSON tags"""
-        display_tags = []
-        for category, tags in self.current_json_tags.items():
-            category_singular = category[:-1]  # Remove 's' from plural form
-            for tag in tags:
-                display_tags.append(f"{category_singular}:{tag}")
-
         # Update the model with only JSON tags
-        self.image_tag_list_model.setStringList(display_tags)
+        self.image_tag_list_model.setStringList(
+            get_display_tags(self.current_json_tags))
         self.count_tokens()
 
     @Slot()
@@ -406,7 +276,9 @@ class JsonTagsEditor(QDockWidget):
         if not proxy_image_index.isValid():
             return
 
-        self.image_index = self.proxy_image_list_model.mapToSource(proxy_image_index)
+        # The row of the image changes when images are added or removed.
+        self.image_index = QPersistentModelIndex(
+            self.proxy_image_list_model.mapToSource(proxy_image_index))
 
         # Get image from source model
         source_model = self.proxy_image_list_model.sourceModel()
@@ -415,17 +287,8 @@ class JsonTagsEditor(QDockWidget):
         if image is None:
             return
 
-        # Only load tags from .json file
-        try:
-            json_path = image.path.with_suffix('.json')
-            if json_path.exists():
-                with json_path.open('r', encoding='utf-8') as f:
-                    self.current_json_tags = json.load(f)
-            else:
-                self.current_json_tags = self.init_current_json_tags()
-        except (OSError, json.JSONDecodeError) as e:
-            print(f"Error reading JSON tags: {str(e)}")
-            self.current_json_tags = self.init_current_json_tags()
+        # The JSON tags are loaded with the directory
+        self.current_json_tags = copy_json_tags(image.json_tags)
 
         self.update_display()
 
@@ -523,7 +386,6 @@ class JSONImageTagsList(QListView):
         self.setItemDelegate(self.delegate)
 
         # Connect delegate signals
-        print("Connecting delegate signals")  # Debug print
         self.delegate.deleteClicked.connect(self.handle_delete_clicked)
 
         self.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
@@ -558,10 +420,8 @@ class JSONImageTagsList(QListView):
 
     def handle_delete_clicked(self, index):
         """Handle delete button click"""
-        print("Delete clicked received")  # Debug print
         tag = self.model().data(index, Qt.ItemDataRole.DisplayRole)
         if tag:
-            print(f"Emitting deletion request for tag: {tag}")  # Debug print
             self.tag_deletion_requested.emit([tag])
 
     def handle_tag_edited(self, index, new_text):
@@ -626,7 +486,6 @@ class JSONTagItemDelegate(QStyledItemDelegate):
             )
 
             if button_rect.contains(event.pos()):
-                print(f"Delete button clicked at index {index.row()}")  # Debug print
                 self.deleteClicked.emit(index)
                 return True
         return super().editorEvent(event, model, option, index)
\ No newline at end of file
@@ -1,29 +1,33 @@
 from pathlib import Path
 from typing import List, Optional  # Add this import
-import json  # Add this import
 
 
-from PySide6.QtCore import QKeyCombination, QModelIndex, QUrl, Qt, Slot
+from PySide6.QtCore import QKeyCombination, QModelIndex, QTimer, QUrl, Qt, Slot
 from PySide6.QtGui import (QAction, QCloseEvent, QDesktopServices, QIcon,
                            QKeySequence, QPixmap, QShortcut)
 from PySide6.QtWidgets import (QApplication, QFileDialog, QMainWindow,
                                QMessageBox, QStackedWidget, QVBoxLayout,
                                QWidget)
-from transformers import AutoTokenizer
 
 from dialogs.batch_reorder_tags_dialog import BatchReorderTagsDialog
 from dialogs.find_and_replace_dialog import FindAndReplaceDialog
+from dialogs.json_tags_operation_dialog import JsonTagsOperationDialog
 from dialogs.settings_dialog import SettingsDialog
 from models.image_list_model import ImageListModel
 from models.image_tag_list_model import ImageTagListModel
+from models.json_tag_counter_model import JsonTagCounterModel
 from models.proxy_image_list_model import ProxyImageListModel
 from models.tag_counter_model import TagCounterModel
 from utils.big_widgets import BigPushButton
 from utils.image import Image
+from utils.json_tags import parse_display_tag
 from utils.key_press_forwarder import KeyPressForwarder
 from utils.settings import DEFAULT_SETTINGS, get_settings, get_tag_separator
 from utils.shortcut_remover import ShortcutRemover
-from utils.utils import get_resource_path, pluralize
+from utils.tag_category_cache import get_tag_category_cache
+from utils.utils import (get_confirmation_dialog_reply, get_resource_path,
+                         pluralize)
+from widgets.all_json_tags_editor import AllJsonTagsEditor
 from widgets.all_tags_editor import AllTagsEditor
 from widgets.auto_captioner import AutoCaptioner
 from widgets.image_list import ImageList
@@ -31,18 +35,23 @@ from widgets.image_tags_editor import ImageTagsEditor
 from widgets.json_tags_editor import JsonTagsEditor
 from widgets.image_viewer import ImageViewer
 
-from utils.tag_sorter import TagSorter
+from utils.tag_sorting_service import TagSortingService
 
 ICON_PATH = Path('images/icon.ico')
 GITHUB_REPOSITORY_URL = 'https://github.com/jhc13/taggui'
-TOKENIZER_DIRECTORY_PATH = Path('clip-vit-base-patch32')
 
 
 class MainWindow(QMainWindow):
-    def __init__(self, app: QApplication, tag_sorter=None):
+    def __init__(self, app: QApplication, tag_sorter_factory=None):
         super().__init__()
         self.app = app
-        self.tag_sorter = tag_sorter  # Store tag_sorter as instance variable
+        # Sort tags in a worker thread so that the GUI stays responsive. The
+        # tag sorting model is loaded when tags are first sorted.
+        self.tag_sorting_service = None
+        if tag_sorter_factory is not None:
+            self.tag_sorting_service = TagSortingService(tag_sorter_factory,
+                                                         parent=self)
+            self.tag_sorting_service.start()
         self.settings = get_settings()
         image_list_image_width = self.settings.value(
             'image_list_image_width',
@@ -50,13 +59,12 @@ class MainWindow(QMainWindow):
         tag_separator = get_tag_separator()
         self.image_list_model = ImageListModel(image_list_image_width,
                                                tag_separator)
-        tokenizer = AutoTokenizer.from_pretrained(
-            get_resource_path(TOKENIZER_DIRECTORY_PATH))
         self.proxy_image_list_model = ProxyImageListModel(
-            self.image_list_model, tokenizer, tag_separator)
+            self.image_list_model, tag_separator)
         self.image_list_model.proxy_image_list_model = (
             self.proxy_image_list_model)
         self.tag_counter_model = TagCounterModel()
+        self.json_tag_counter_model = JsonTagCounterModel()
         self.image_tag_list_model = ImageTagListModel()
 
         #self.text_tag_list_model = ImageTagListModel()
@@ -70,7 +78,7 @@ class MainWindow(QMainWindow):
         self.set_font_size()
         self.image_viewer = ImageViewer(
             self.proxy_image_list_model,
-            tag_sorter=self.tag_sorter  # Pass tag_sorter to ImageViewer
+            tag_sorting_service=self.tag_sorting_service
         )
         self.create_central_widget()
         self.image_list = ImageList(self.proxy_image_list_model,
@@ -79,12 +87,10 @@ class MainWindow(QMainWindow):
                            self.image_list)
         self.image_tags_editor = ImageTagsEditor(
             self.proxy_image_list_model, self.tag_counter_model,
-            self.image_tag_list_model, self.image_list, tokenizer,
-            tag_separator)
+            self.image_tag_list_model, self.image_list, tag_separator)
         self.json_tags_editor = JsonTagsEditor(
             self.proxy_image_list_model, self.tag_counter_model,
-            self.json_tag_list_model, self.image_list, tokenizer,
-            tag_separator)
+            self.json_tag_list_model, self.image_list, tag_separator)
 
 
 
@@ -97,6 +103,13 @@ class MainWindow(QMainWindow):
                                                 .all_tags_list)
         self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea,
                            self.all_tags_editor)
+        self.all_json_tags_editor = AllJsonTagsEditor(
+            self.json_tag_counter_model)
+        self.json_tag_counter_model.all_json_tags_list = (
+            self.all_json_tags_editor.all_json_tags_tree)
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea,
+                           self.all_json_tags_editor)
+        self.tabifyDockWidget(self.all_tags_editor, self.all_json_tags_editor)
         self.auto_captioner = AutoCaptioner(self.image_list_model,
                                             self.image_list)
         self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea,
@@ -118,12 +131,20 @@ class MainWindow(QMainWindow):
         self.auto_captioner.start_cancel_button.setDisabled(True)
         self.reload_directory_action = QAction('Reload Directory', parent=self)
         self.reload_directory_action.setDisabled(True)
+        self.convert_to_manifest_action = QAction(
+            'Convert Sidecar Files to Manifest...', parent=self)
+        self.convert_to_manifest_action.setDisabled(True)
+        self.convert_to_sidecars_action = QAction(
+            'Convert Manifest to Sidecar Files...', parent=self)
+        self.convert_to_sidecars_action.setDisabled(True)
         self.undo_action = QAction('Undo', parent=self)
         self.redo_action = QAction('Redo', parent=self)
         self.toggle_image_list_action = QAction('Images', parent=self)
         self.toggle_image_tags_editor_action = QAction('Image Tags',
                                                        parent=self)
         self.toggle_all_tags_editor_action = QAction('All Tags', parent=self)
+        self.toggle_all_json_tags_editor_action = QAction('All JSON Tags',
+                                                          parent=self)
         self.toggle_auto_captioner_action = QAction('Auto-Captioner',
                                                     parent=self)
         self.create_menus()
@@ -135,7 +156,12 @@ class MainWindow(QMainWindow):
         self.connect_image_list_signals()
         self.connect_image_tags_editor_signals()
         self.connect_all_tags_editor_signals()
+        self.connect_all_json_tags_editor_signals()
         self.connect_auto_captioner_signals()
+        self.image_viewer.clip_extractor.clips_saved.connect(
+            self.add_clip_images)
+        self.image_viewer.queued_clips_changed.connect(
+            self.update_queued_clips_actions)
         # Forward any unhandled image changing key presses to the image list.
         key_press_forwarder = KeyPressForwarder(
             parent=self, target=self.image_list.list_view,
@@ -218,8 +244,45 @@ class MainWindow(QMainWindow):
         """Save the window geometry and state before closing."""
         self.settings.setValue('geometry', self.saveGeometry())
         self.settings.setValue('window_state', self.saveState())
+        if self.tag_sorting_service is not None:
+            self.tag_sorting_service.stop()
+        # Model loading threads cannot be interrupted, and Qt aborts if a
+        # running thread is destroyed.
+        if self.auto_captioner.model_loading_threads:
+            self.statusBar().showMessage('Waiting for the model to load...')
+            self.statusBar().repaint()
+        self.auto_captioner.wait_for_model_preloads()
+        # Add the saved clips to the image list so that their tags are
+        # written.
+        self.image_viewer.clip_extractor.wait()
+        QApplication.sendPostedEvents(self)
+        self.write_pending_json_tags()
         super().closeEvent(event)
 
+    def write_pending_json_tags(self):
+        """Write the pending JSON tags and resolve any conflicts."""
+        json_tags_persister = self.image_list_model.json_tags_persister
+        json_tags_persister.wait()
+        # Handle the conflict signals queued by the worker thread now, and
+        # write the tags again if the user chooses to overwrite.
+        QApplication.sendPostedEvents(self)
+        json_tags_persister.wait()
+
+    @Slot(list)
+    def handle_json_tags_write_conflict(self, paths: list[Path]):
+        file_count = len(paths)
+        question = (f'{file_count} JSON {pluralize("file", file_count)} '
+                    f'{"was" if file_count == 1 else "were"} changed by '
+                    f'another program after being loaded. Overwrite '
+                    f'{"it" if file_count == 1 else "them"} with the tags in '
+                    f'TagGUI? Otherwise, the tags are reloaded from disk.')
+        reply = get_confirmation_dialog_reply(title='JSON Tags Conflict',
+                                              question=question)
+        if reply == QMessageBox.StandardButton.Yes:
+            self.image_list_model.overwrite_json_tags(paths)
+        else:
+            self.image_list_model.reload_json_tags(paths)
+
     def set_font_size(self):
         font = self.app.font()
         font_size = self.settings.value(
@@ -243,6 +306,12 @@ class MainWindow(QMainWindow):
     def load_directory(self, path: Path, select_index: int = 0):
         self.settings.setValue('directory_path', str(path))
         self.setWindowTitle(path.name)
+        # Save the queued clips and add the saved clips to the image list
+        # before it is replaced, so that their tags are written.
+        self.image_viewer.save_queued_clips()
+        self.image_viewer.clip_extractor.wait()
+        QApplication.sendPostedEvents(self)
+        self.write_pending_json_tags()
         self.image_list_model.load_directory(path)
         self.image_list.filter_line_edit.clear()
         self.all_tags_editor.filter_line_edit.clear()
@@ -253,6 +322,7 @@ class MainWindow(QMainWindow):
             self.proxy_image_list_model.index(select_index, 0))
         self.centralWidget().setCurrentWidget(self.image_viewer)
         self.reload_directory_action.setDisabled(False)
+        self.update_convert_tag_storage_actions()
         self.image_tags_editor.tag_input_box.setDisabled(False)
         self.json_tags_editor.tag_input_box.setDisabled(False)
         self.auto_captioner.start_cancel_button.setDisabled(False)
@@ -301,6 +371,12 @@ class MainWindow(QMainWindow):
             parent=self, image_list_model=self.image_list_model)
         find_and_replace_dialog.exec()
 
+    @Slot()
+    def show_json_tags_operation_dialog(self):
+        json_tags_operation_dialog = JsonTagsOperationDialog(
+            parent=self, image_list_model=self.image_list_model)
+        json_tags_operation_dialog.exec()
+
     @Slot()
     def show_batch_reorder_tags_dialog(self):
         batch_reorder_tags_dialog = BatchReorderTagsDialog(
@@ -336,6 +412,51 @@ class MainWindow(QMainWindow):
         message_box.setText(text)
         message_box.exec()
 
+    @Slot()
+    def seed_tag_category_cache(self):
+        json_tags_list = [image.json_tags
+                          for image in self.image_list_model.images
+                          if any(image.json_tags.values())]
+        seeded_tag_count = get_tag_category_cache().seed(json_tags_list)
+        message_box = QMessageBox()
+        message_box.setWindowTitle('Learn Tag Categories')
+        message_box.setIcon(QMessageBox.Icon.Information)
+        message_box.setText(
+            f'Learned the categories of {seeded_tag_count} '
+            f'{pluralize("tag", seeded_tag_count)} from '
+            f'{len(json_tags_list)} '
+            f'{pluralize("image", len(json_tags_list))} with JSON tags.')
+        message_box.exec()
+
+    def update_convert_tag_storage_actions(self):
+        is_using_manifest = self.image_list_model.is_using_manifest()
+        self.convert_to_manifest_action.setDisabled(is_using_manifest)
+        self.convert_to_sidecars_action.setDisabled(not is_using_manifest)
+
+    def convert_tag_storage(self, to_manifest: bool):
+        image_count = len(self.image_list_model.images)
+        if to_manifest:
+            title = 'Convert Sidecar Files to Manifest'
+            question = (f'Move the tags of {image_count} '
+                        f'{pluralize("image", image_count)} from their `.txt` '
+                        f'and `.json` files to a single manifest file? The '
+                        f'sidecar files will be deleted.')
+        else:
+            title = 'Convert Manifest to Sidecar Files'
+            question = (f'Move the tags of {image_count} '
+                        f'{pluralize("image", image_count)} from the manifest '
+                        f'file to `.txt` and `.json` files? The manifest file '
+                        f'will be deleted.')
+        reply = get_confirmation_dialog_reply(title, question)
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        try:
+            self.image_list_model.convert_tag_storage(to_manifest)
+        except OSError as exception:
+            QMessageBox.critical(self, 'Error',
+                                 f'Failed to convert the tags: {exception}')
+        self.update_convert_tag_storage_actions()
+
     def create_menus(self):
         menu_bar = self.menuBar()
 
@@ -347,6 +468,12 @@ class MainWindow(QMainWindow):
         self.reload_directory_action.setShortcut(QKeySequence('Ctrl+Shift+L'))
         self.reload_directory_action.triggered.connect(self.reload_directory)
         file_menu.addAction(self.reload_directory_action)
+        self.convert_to_manifest_action.triggered.connect(
+            lambda: self.convert_tag_storage(to_manifest=True))
+        file_menu.addAction(self.convert_to_manifest_action)
+        self.convert_to_sidecars_action.triggered.connect(
+            lambda: self.convert_tag_storage(to_manifest=False))
+        file_menu.addAction(self.convert_to_sidecars_action)
 
 
 
@@ -388,6 +515,11 @@ class MainWindow(QMainWindow):
         find_and_replace_action.triggered.connect(
             self.show_find_and_replace_dialog)
         edit_menu.addAction(find_and_replace_action)
+        json_tags_operation_action = QAction('Bulk Edit JSON Tags...',
+                                             parent=self)
+        json_tags_operation_action.triggered.connect(
+            self.show_json_tags_operation_dialog)
+        edit_menu.addAction(json_tags_operation_action)
         batch_reorder_tags_action = QAction('Batch Reorder Tags...',
                                             parent=self)
         batch_reorder_tags_action.setShortcut(QKeySequence('Ctrl+B'))
@@ -405,6 +537,11 @@ class MainWindow(QMainWindow):
         remove_empty_tags_action.triggered.connect(
             self.remove_empty_tags)
         edit_menu.addAction(remove_empty_tags_action)
+        seed_tag_category_cache_action = QAction(
+            'Learn Tag Categories from JSON Tags', parent=self)
+        seed_tag_category_cache_action.triggered.connect(
+            self.seed_tag_category_cache)
+        edit_menu.addAction(seed_tag_category_cache_action)
 
         # Add Clipping submenu
         clipping_menu = edit_menu.addMenu('Clipping')
@@ -413,6 +550,33 @@ class MainWindow(QMainWindow):
         self.start_clipping_action.setCheckable(True)
         self.start_clipping_action.triggered.connect(self.toggle_clipping_mode)
         clipping_menu.addAction(self.start_clipping_action)
+        queue_clips_action = QAction('Queue Clips', parent=self)
+        queue_clips_action.setCheckable(True)
+        queue_clips_action.setToolTip(
+            'Collect several clips with their tags and save them together.')
+        queue_clips_action.toggled.connect(
+            self.image_viewer.set_clip_queueing_enabled)
+        clipping_menu.addAction(queue_clips_action)
+        self.save_queued_clips_action = QAction('Save Queued Clips',
+                                                parent=self)
+        self.save_queued_clips_action.setShortcut(
+            QKeySequence('Ctrl+Shift+Return'))
+        self.save_queued_clips_action.triggered.connect(
+            self.image_viewer.save_queued_clips)
+        clipping_menu.addAction(self.save_queued_clips_action)
+        self.remove_last_queued_clip_action = QAction(
+            'Remove Last Queued Clip', parent=self)
+        self.remove_last_queued_clip_action.setShortcut(
+            QKeySequence('Ctrl+Shift+Backspace'))
+        self.remove_last_queued_clip_action.triggered.connect(
+            self.image_viewer.remove_last_queued_clip)
+        clipping_menu.addAction(self.remove_last_queued_clip_action)
+        self.discard_queued_clips_action = QAction('Discard Queued Clips',
+                                                   parent=self)
+        self.discard_queued_clips_action.triggered.connect(
+            self.image_viewer.discard_queued_clips)
+        clipping_menu.addAction(self.discard_queued_clips_action)
+        self.update_queued_clips_actions()
 
         # Add new action for JSON Tags editor
         self.toggle_json_tags_editor_action = QAction('JSON Tags', parent=self)
@@ -422,6 +586,7 @@ class MainWindow(QMainWindow):
         self.toggle_image_tags_editor_action.setCheckable(True)
         self.toggle_json_tags_editor_action.setCheckable(True)
         self.toggle_all_tags_editor_action.setCheckable(True)
+        self.toggle_all_json_tags_editor_action.setCheckable(True)
         self.toggle_auto_captioner_action.setCheckable(True)
         self.toggle_image_list_action.triggered.connect(
             lambda is_checked: self.image_list.setVisible(is_checked))
@@ -431,13 +596,31 @@ class MainWindow(QMainWindow):
             lambda is_checked: self.json_tags_editor.setVisible(is_checked))
         self.toggle_all_tags_editor_action.triggered.connect(
             lambda is_checked: self.all_tags_editor.setVisible(is_checked))
+        self.toggle_all_json_tags_editor_action.triggered.connect(
+            lambda is_checked: self.all_json_tags_editor.setVisible(
+                is_checked))
         self.toggle_auto_captioner_action.triggered.connect(
             lambda is_checked: self.auto_captioner.setVisible(is_checked))
         view_menu.addAction(self.toggle_image_list_action)
         view_menu.addAction(self.toggle_image_tags_editor_action)
         view_menu.addAction(self.toggle_json_tags_editor_action)
         view_menu.addAction(self.toggle_all_tags_editor_action)
+        view_menu.addAction(self.toggle_all_json_tags_editor_action)
         view_menu.addAction(self.toggle_auto_captioner_action)
+        view_menu.addSeparator()
+        zoom_image_action = QAction('Zoom and Pan Image', parent=self)
+        zoom_image_action.setCheckable(True)
+        zoom_image_action.setToolTip(
+            'Zoom the image with the mouse wheel and pan it by dragging.\n'
+            'Double-click the image to fit it to the window again.')
+        zoom_image_action.setChecked(self.settings.value(
+            'image_viewer_zoom_enabled', defaultValue=False, type=bool))
+        self.image_viewer.set_zoom_enabled(zoom_image_action.isChecked())
+        zoom_image_action.toggled.connect(self.image_viewer.set_zoom_enabled)
+        zoom_image_action.toggled.connect(
+            lambda is_checked: self.settings.setValue(
+                'image_viewer_zoom_enabled', is_checked))
+        view_menu.addAction(zoom_image_action)
 
         help_menu = menu_bar.addMenu('Help')
         open_github_repository_action = QAction('GitHub', parent=self)
@@ -468,9 +651,7 @@ class MainWindow(QMainWindow):
     @Slot()
     def set_image_list_filter(self):
         filter_ = self.image_list.filter_line_edit.parse_filter_text()
-        self.proxy_image_list_model.filter = filter_
-        # Apply the new filter.
-        self.proxy_image_list_model.invalidateFilter()
+        self.proxy_image_list_model.set_filter(filter_)
         if filter_ is None:
             all_tags_list_selection_model = (self.all_tags_editor
                                              .all_tags_list.selectionModel())
@@ -514,6 +695,8 @@ class MainWindow(QMainWindow):
         self.image_list_model.dataChanged.connect(
             lambda: self.tag_counter_model.count_tags(
                 self.image_list_model.images))
+        self.image_list_model.tags_changed.connect(
+            self.tag_counter_model.update_counts)
         self.image_list_model.dataChanged.connect(
             self.image_tags_editor.reload_image_tags_if_changed)
         self.image_list_model.dataChanged.connect(
@@ -528,8 +711,6 @@ class MainWindow(QMainWindow):
         self.proxy_image_list_model.rowsRemoved.connect(
             lambda: self.image_list.update_image_index_label(
                 self.image_list.list_view.currentIndex()))
-        self.image_list.list_view.directory_reload_requested.connect(
-            self.reload_directory)
         self.image_list.list_view.tags_paste_requested.connect(
             self.image_list_model.add_tags)
         # Connecting the signal directly without `isVisible()` causes the menu
@@ -610,85 +791,32 @@ class MainWindow(QMainWindow):
         self.image_list_model.add_tags(tags, image_indices)
         self.image_tags_editor.select_last_tag()
 
-    def read_json_tags(self, image_path: Path) -> dict:
-        """Read JSON tags from file"""
-        empty_tags = {
-            "characters": [],
-            "settings": [],
-            "actions": []
-        }
-
-        try:
-            json_path = image_path.with_suffix('.json')
-            if json_path.exists():
-                with json_path.open('r', encoding='utf-8') as f:
-                    return json.load(f)
-        except (OSError, json.JSONDecodeError) as e:
-            print(f"Error reading JSON tags: {str(e)}")
-
-        return empty_tags
-
     @Slot(list, list)
     def add_json_tags(self, tags: List[str], image_indices: List[QModelIndex]):
-        """Handle adding JSON tags"""
-        if not image_indices:
-            return
-
-        current_image_index = image_indices[0]  # Use the first selected image
-        image: Image = self.image_list_model.data(current_image_index, Qt.ItemDataRole.UserRole)
-
-        if not image:
+        """Add JSON tags, such as `character:woman`, to the selected images."""
+        category_tags = {}
+        for tag in tags:
+            category_and_tag = parse_display_tag(tag)
+            if category_and_tag is None or not category_and_tag[1]:
+                continue
+            category, value = category_and_tag
+            category_tags.setdefault(category, []).append(value)
+        if not category_tags or not image_indices:
             return
-
-        try:
-            # Read existing JSON tags
-            json_tags = self.read_json_tags(image.path)
-
-            # Process new tags
-            for tag in tags:
-                if tag.startswith("character:"):
-                    value = tag.replace("character:", "").strip()
-                    if value not in json_tags["characters"]:
-                        json_tags["characters"].append(value)
-                elif tag.startswith("setting:"):
-                    value = tag.replace("setting:", "").strip()
-                    if value not in json_tags["settings"]:
-                        json_tags["settings"].append(value)
-                elif tag.startswith("action:"):
-                    value = tag.replace("action:", "").strip()
-                    if value not in json_tags["actions"]:
-                        json_tags["actions"].append(value)
-
-            # Save updated JSON tags
-            self.write_json_tags(image.path, json_tags)
-
-            # Update the JSON tags display
-            self.json_tags_editor.current_json_tags = json_tags
-            self.json_tags_editor.update_display()
-
-        except Exception as e:
-            print(f"Error processing JSON tags: {str(e)}")
-
-    def write_json_tags(self, image_path: Path, tags: dict):
-        """Write JSON tags to file"""
-        try:
-            json_path = image_path.with_suffix('.json')
-            with json_path.open('w', encoding='utf-8') as f:
-                json.dump(tags, f, indent=2, ensure_ascii=False)
-        except OSError as e:
-            print(f"Error writing JSON tags: {str(e)}")
-
+        self.image_list_model.add_json_tags(category_tags,
+                                            image_indices=image_indices)
 
     @Slot()
-    def set_image_list_filter_text(self, selected_tag: str):
+    def set_image_list_filter_text(self, selected_tag: str,
+                                   filter_key: str = 'tag'):
         """
         Construct and set the image list filter text from the selected tag in
-        the all tags list.
+        the all tags list or the all JSON tags tree.
         """
         escaped_selected_tag = (selected_tag.replace('\\', '\\\\')
                                 .replace('"', r'\"').replace("'", r"\'"))
         self.image_list.filter_line_edit.setText(
-            f'tag:"{escaped_selected_tag}"')
+            f'{filter_key}:"{escaped_selected_tag}"')
 
     @Slot(str)
     def add_tag_to_selected_images(self, tag: str):
@@ -716,6 +844,32 @@ class MainWindow(QMainWindow):
             lambda: self.toggle_all_tags_editor_action.setChecked(
                 self.all_tags_editor.isVisible()))
 
+    def connect_all_json_tags_editor_signals(self):
+        self.image_list_model.modelReset.connect(
+            lambda: self.json_tag_counter_model.count_json_tags(
+                self.image_list_model.images))
+        self.image_list_model.json_tags_changed.connect(
+            self.json_tag_counter_model.update_counts)
+        (self.image_list_model.json_tags_persister.write_conflicted
+         .connect(self.handle_json_tags_write_conflict))
+        self.all_json_tags_editor.clear_filter_button.clicked.connect(
+            self.image_list.filter_line_edit.clear)
+        self.json_tag_counter_model.tags_renaming_requested.connect(
+            self.image_list_model.rename_json_tags)
+        self.json_tag_counter_model.tags_renaming_requested.connect(
+            self.image_list.filter_line_edit.clear)
+        all_json_tags_tree = self.all_json_tags_editor.all_json_tags_tree
+        all_json_tags_tree.image_list_filter_requested.connect(
+            lambda filter_key, tag: self.set_image_list_filter_text(
+                tag, filter_key))
+        all_json_tags_tree.tags_deletion_requested.connect(
+            self.image_list_model.delete_json_tags)
+        all_json_tags_tree.tags_deletion_requested.connect(
+            self.image_list.filter_line_edit.clear)
+        self.all_json_tags_editor.visibilityChanged.connect(
+            lambda: self.toggle_all_json_tags_editor_action.setChecked(
+                self.all_json_tags_editor.isVisible()))
+
     def connect_auto_captioner_signals(self):
         self.auto_captioner.caption_generated.connect(
             lambda image_index, _, tags:
@@ -772,59 +926,8 @@ class MainWindow(QMainWindow):
             self.image_list_model.add_to_undo_stack(
                 action_name='Delete Text Tags', should_ask_for_confirmation=False)
 
-        # Save to txt file
-        try:
-            txt_path = image.path.with_suffix('.txt')
-            txt_path.write_text('\n'.join(new_tags), encoding='utf-8')
-        except OSError as e:
-            print(f"Error saving text tags: {str(e)}")
-
         self.image_list_model.update_image_tags(image_index, new_tags)
 
-    @Slot()
-    def update_json_tags(self):
-        """Update only JSON-based tags, saving to .json files"""
-        image_index = self.json_tags_editor.image_index
-        if image_index is None:
-            return
-
-        try:
-            # Get the current image
-            image: Image = self.image_list_model.data(image_index, Qt.ItemDataRole.UserRole)
-            if not image:
-                return
-
-            # Get the current JSON tags from the model
-            display_tags = self.json_tag_list_model.stringList()
-
-            # Convert display tags to JSON structure
-            json_tags = {
-                "characters": [],
-                "settings": [],
-                "actions": []
-            }
-
-            # Parse the tags back into JSON structure
-            for tag in display_tags:
-                try:
-                    category, value = tag.split(':', 1)
-                    if category == 'character':
-                        json_tags['characters'].append(value)
-                    elif category == 'setting':
-                        json_tags['settings'].append(value)
-                    elif category == 'action':
-                        json_tags['actions'].append(value)
-                except ValueError:
-                    continue
-
-            # Write JSON tags to disk
-            json_path = image.path.with_suffix('.json')
-            with json_path.open('w', encoding='utf-8') as f:
-                json.dump(json_tags, f, indent=2, ensure_ascii=False)
-
-        except Exception as e:
-            print(f"Error updating JSON tags: {str(e)}")
-
     def restore(self):
         # Restore the window geometry and state.
         if self.settings.contains('geometry'):
@@ -832,6 +935,12 @@ class MainWindow(QMainWindow):
         else:
             self.showMaximized()
         self.restoreState(self.settings.value('window_state', type=bytes))
+        # Load the last loaded directory after the window is shown, so that
+        # the window does not stay blank while the directory is loading.
+        QTimer.singleShot(0, self.restore_directory)
+
+    @Slot()
+    def restore_directory(self):
         # Get the last index of the last selected image.
         if self.settings.contains('image_index'):
             image_index = self.settings.value('image_index', type=int)
@@ -929,6 +1038,27 @@ class MainWindow(QMainWindow):
         except ValueError:
             return None
 
+    @Slot()
+    def update_queued_clips_actions(self):
+        queued_clip_count = len(self.image_viewer.queued_clips)
+        for action in (self.save_queued_clips_action,
+                       self.remove_last_queued_clip_action,
+                       self.discard_queued_clips_action):
+            action.setDisabled(queued_clip_count == 0)
+        if queued_clip_count:
+            self.statusBar().showMessage(
+                f'{queued_clip_count} {pluralize("clip", queued_clip_count)} '
+                f'queued')
+        else:
+            self.statusBar().clearMessage()
+
+    @Slot(list)
+    def add_clip_images(self, images: list[Image]):
+        """Add saved clips to the image list without reloading it."""
+        self.image_list_model.add_images(images)
+        self.statusBar().showMessage(
+            f'Saved {len(images)} {pluralize("clip", len(images))}', 5000)
+
     # Add new method to MainWindow
     def toggle_clipping_mode(self, checked):
         """Toggle the clipping mode on/off"""
@@ -0,0 +1,411 @@
+import math
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from PySide6.QtCore import (QObject, QPointF, QRect, QRectF, QRunnable,
+                            QThreadPool, Qt, Signal, Slot)
+from PySide6.QtGui import (QColor, QImage, QImageIOHandler, QImageReader,
+                           QPainter, QPen, QPixmap, QResizeEvent, QWheelEvent)
+from PySide6.QtWidgets import (QGraphicsItem, QGraphicsPixmapItem,
+                               QGraphicsRectItem, QGraphicsScene, QGraphicsView, QMessageBox,
+                               QStyleOptionGraphicsItem)
+
+from utils.image_prefetcher import DecodedImage, get_orientation_transform
+
+# The width and height of tiles in the pixels of their level.
+TILE_SIZE = 512
+TILE_CACHE_SIZE = 256 * 1024 ** 2
+# Formats that cannot decode a region of an image are only tiled if the full
+# image fits in this many bytes, because every decode reads the full image.
+MAX_FULL_DECODE_SIZE = 1024 ** 3
+MAX_DECODE_THREAD_COUNT = 2
+ZOOM_FACTOR = 1.25
+# The maximum number of screen pixels per image pixel.
+MAX_ZOOM = 16
+# The minimum size of a clip in screen pixels.
+MIN_CLIP_SIZE = 10
+
+# The image path, the level, the column, and the row of a tile.
+TileKey = tuple[Path, int, int, int]
+
+
+def get_tile_rect(level_width: int, level_height: int, column: int,
+                  row: int) -> QRect:
+    """Get the rectangle of a tile in the pixels of its level."""
+    return QRect(column * TILE_SIZE, row * TILE_SIZE,
+                 TILE_SIZE, TILE_SIZE).intersected(
+        QRect(0, 0, level_width, level_height))
+
+
+class TileCache:
+    """
+    Least recently used cache of decoded tiles, bounded by the total number
+    of bytes of the tiles. Only used from the main thread.
+    """
+
+    def __init__(self):
+        self.tiles: OrderedDict[TileKey, QImage] = OrderedDict()
+        self.byte_count = 0
+
+    def get(self, key: TileKey) -> QImage | None:
+        tile = self.tiles.get(key)
+        if tile is not None:
+            self.tiles.move_to_end(key)
+        return tile
+
+    def put(self, key: TileKey, tile: QImage):
+        self.remove(key)
+        self.tiles[key] = tile
+        self.byte_count += tile.sizeInBytes()
+        while self.byte_count > TILE_CACHE_SIZE:
+            self.remove(next(iter(self.tiles)))
+
+    def remove(self, key: TileKey):
+        tile = self.tiles.pop(key, None)
+        if tile is not None:
+            self.byte_count -= tile.sizeInBytes()
+
+
+class DecodeTilesRunnable(QRunnable):
+    """
+    Decode tiles of one level of an image. If the image format supports
+    decoding regions, a single tile is decoded. Otherwise, the whole level is
+    decoded once and cut into tiles.
+    """
+
+    def __init__(self, tile_decoder: 'TileDecoder', image_path: Path,
+                 level: int, image_size: tuple[int, int],
+                 tile_positions: list[tuple[int, int]]):
+        super().__init__()
+        self.tile_decoder = tile_decoder
+        self.image_path = image_path
+        self.level = level
+        self.image_size = image_size
+        self.tile_positions = tile_positions
+
+    def run(self):
+        tiles = []
+        if self.tile_decoder.is_wanted(self.image_path, self.level):
+            tiles = self.decode_tiles()
+        keys = [(self.image_path, self.level, column, row)
+                for column, row in self.tile_positions]
+        self.tile_decoder.tiles_decoded.emit(keys, tiles)
+
+    def decode_tiles(self) -> list[QImage]:
+        width, height = self.image_size
+        level_width = math.ceil(width / 2 ** self.level)
+        level_height = math.ceil(height / 2 ** self.level)
+        tile_rects = [get_tile_rect(level_width, level_height, column, row)
+                      for column, row in self.tile_positions]
+        image_reader = QImageReader(str(self.image_path))
+        # The orientation is applied to the whole image by the view.
+        image_reader.setAutoTransform(False)
+        if self.level > 0:
+            image_reader.setScaledSize(QRect(0, 0, level_width,
+                                             level_height).size())
+        if len(tile_rects) == 1:
+            image_reader.setScaledClipRect(tile_rects[0])
+            return [image_reader.read()]
+        level_image = image_reader.read()
+        if level_image.isNull():
+            return []
+        return [level_image.copy(tile_rect) for tile_rect in tile_rects]
+
+
+class TileDecoder(QObject):
+    """Decode tiles in background threads."""
+    # The keys of the tiles and the decoded tiles, which are empty if the
+    # tiles could not be decoded. Emitted from the decoding threads.
+    tiles_decoded = Signal(list, list)
+
+    def __init__(self):
+        super().__init__()
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(
+            min(MAX_DECODE_THREAD_COUNT,
+                QThreadPool.globalInstance().maxThreadCount()))
+        self.requested_keys: set[TileKey] = set()
+        # The image and level whose tiles are still needed, read from the
+        # decoding threads.
+        self.wanted_level: tuple[Path, int] | None = None
+        self.wanted_level_lock = threading.Lock()
+        self.tiles_decoded.connect(self.handle_tiles_decoded)
+
+    def is_wanted(self, image_path: Path, level: int) -> bool:
+        with self.wanted_level_lock:
+            return self.wanted_level == (image_path, level)
+
+    def set_wanted_level(self, image_path: Path | None, level: int):
+        """Skip queued tiles of other images and levels."""
+        with self.wanted_level_lock:
+            self.wanted_level = (image_path, level)
+
+    def request_tiles(self, image_path: Path, level: int,
+                      image_size: tuple[int, int],
+                      tile_positions: list[tuple[int, int]],
+                      supports_regions: bool):
+        tile_positions = [
+            (column, row) for column, row in tile_positions
+            if (image_path, level, column, row) not in self.requested_keys]
+        if not tile_positions:
+            return
+        self.requested_keys.update((image_path, level, column, row)
+                                   for column, row in tile_positions)
+        if supports_regions:
+            for tile_position in tile_positions:
+                self.thread_pool.start(DecodeTilesRunnable(
+                    self, image_path, level, image_size, [tile_position]))
+        else:
+            self.thread_pool.start(DecodeTilesRunnable(
+                self, image_path, level, image_size, tile_positions))
+
+    @Slot(list, list)
+    def handle_tiles_decoded(self, keys: list[TileKey], _):
+        self.requested_keys.difference_update(keys)
+
+
+class TiledImageItem(QGraphicsItem):
+    """
+    Draw the tiles of an image at the level that matches the zoom, in the
+    pixel coordinates of the image as stored.
+    """
+
+    def __init__(self, view: 'ZoomableImageView'):
+        super().__init__()
+        self.view = view
+        self.image_size = (0, 0)
+        # The highest level whose resolution is still higher than the preview.
+        self.max_level = 0
+        self.is_tiling_enabled = False
+        self.setFlag(
+            QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
+
+    def boundingRect(self) -> QRectF:
+        return QRectF(0, 0, *self.image_size)
+
+    def get_level(self, level_of_detail: float) -> int | None:
+        """
+        Get the level to draw at a level of detail, or `None` if the preview
+        has enough resolution.
+        """
+        if not self.is_tiling_enabled or level_of_detail <= 0:
+            return None
+        level = max(0, math.floor(math.log2(1 / level_of_detail)))
+        if level > self.max_level:
+            return None
+        return level
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem,
+              widget=None):
+        level = self.get_level(option.levelOfDetailFromTransform(
+            painter.worldTransform()))
+        self.view.tile_decoder.set_wanted_level(self.view.image_path, level)
+        if level is None:
+            return
+        width, height = self.image_size
+        scale = 2 ** level
+        level_width = math.ceil(width / scale)
+        level_height = math.ceil(height / scale)
+        exposed_rect = option.exposedRect
+        first_column = max(0, int(exposed_rect.left() / scale) // TILE_SIZE)
+        last_column = min((level_width - 1) // TILE_SIZE,
+                          int(exposed_rect.right() / scale) // TILE_SIZE)
+        first_row = max(0, int(exposed_rect.top() / scale) // TILE_SIZE)
+        last_row = min((level_height - 1) // TILE_SIZE,
+                       int(exposed_rect.bottom() / scale) // TILE_SIZE)
+        missing_tile_positions = []
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                tile = self.view.tile_cache.get(
+                    (self.view.image_path, level, column, row))
+                if tile is None:
+                    missing_tile_positions.append((column, row))
+                    continue
+                tile_rect = get_tile_rect(level_width, level_height, column,
+                                          row)
+                # The preview is shown where tiles are missing.
+                painter.drawImage(
+                    QRectF(tile_rect.x() * scale, tile_rect.y() * scale,
+                           tile_rect.width() * scale,
+                           tile_rect.height() * scale), tile)
+        if missing_tile_positions:
+            if (not self.view.supports_regions and level_width * level_height
+                    * 4 <= TILE_CACHE_SIZE // 2):
+                # Every decode reads the whole level, so cut all of its tiles
+                # at once if they fit in the cache.
+                missing_tile_positions = [
+                    (column, row)
+                    for row in range((level_height - 1) // TILE_SIZE + 1)
+                    for column in range((level_width - 1) // TILE_SIZE + 1)]
+            self.view.tile_decoder.request_tiles(
+                self.view.image_path, level, self.image_size,
+                missing_tile_positions, self.view.supports_regions)
+
+
+class ZoomableImageView(QGraphicsView):
+    """
+    Image viewer that can be zoomed with the mouse wheel and panned by
+    dragging. Zoomed in regions are decoded on demand in tiles, so the memory
+    used does not depend on the size of the image.
+    """
+    clip_created = Signal(QRect)
+
+    def __init__(self):
+        super().__init__()
+        self.setScene(QGraphicsScene(self))
+        self.setTransformationAnchor(
+            QGraphicsView.ViewportAnchor.AnchorUnderMouse)
+        self.setResizeAnchor(QGraphicsView.ViewportAnchor.AnchorViewCenter)
+        self.setDragMode(QGraphicsView.DragMode.ScrollHandDrag)
+        self.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        self.setFrameShape(QGraphicsView.Shape.NoFrame)
+        self.image_path = None
+        self.supports_regions = False
+        self.is_fitted = True
+        self.is_clipping_mode = False
+        self.clip_scene_rect = QRectF()
+        self.clip_viewport_rect = QRect()
+        self.tile_cache = TileCache()
+        self.tile_decoder = TileDecoder()
+        self.preview_item = QGraphicsPixmapItem()
+        self.preview_item.setTransformationMode(
+            Qt.TransformationMode.SmoothTransformation)
+        self.scene().addItem(self.preview_item)
+        self.tiled_image_item = TiledImageItem(self)
+        self.scene().addItem(self.tiled_image_item)
+        # Outlines of the regions queued to be clipped.
+        self.clip_rect_items: list[QGraphicsRectItem] = []
+
+        self.tile_decoder.tiles_decoded.connect(self.handle_tiles_decoded)
+        self.rubberBandChanged.connect(self.handle_rubber_band_change)
+
+    def set_image(self, image_path: Path, decoded_image: DecodedImage):
+        """
+        Show an image. The decoded image is scaled down and is shown until the
+        tiles are decoded.
+        """
+        self.image_path = image_path
+        preview = decoded_image.image
+        width = decoded_image.original_size.width()
+        height = decoded_image.original_size.height()
+        self.supports_regions = QImageReader(str(image_path)).supportsOption(
+            QImageIOHandler.ImageOption.ClipRect)
+        orientation_transform = get_orientation_transform(
+            decoded_image.transformation, width, height)
+        self.tiled_image_item.prepareGeometryChange()
+        self.tiled_image_item.image_size = (width, height)
+        self.tiled_image_item.setTransform(orientation_transform)
+        # Tiles are only needed when zoomed in beyond the resolution of the
+        # preview.
+        display_rect = orientation_transform.mapRect(
+            QRectF(0, 0, width, height))
+        preview_scale = (preview.width() / display_rect.width()
+                         if not preview.isNull() else 0)
+        self.tiled_image_item.max_level = (
+            math.ceil(math.log2(1 / preview_scale)) - 1
+            if 0 < preview_scale < 1 else -1)
+        self.tiled_image_item.is_tiling_enabled = (
+            self.tiled_image_item.max_level >= 0
+            and (self.supports_regions
+                 or width * height * 4 <= MAX_FULL_DECODE_SIZE))
+        self.preview_item.setPixmap(QPixmap.fromImage(preview))
+        self.preview_item.setScale(1 / preview_scale if preview_scale else 1)
+        self.scene().setSceneRect(display_rect)
+        self.fit_image()
+
+    def set_clip_rects(self, clip_rects: list[QRect]):
+        """Outline the regions of the image that are queued to be clipped."""
+        for clip_rect_item in self.clip_rect_items:
+            self.scene().removeItem(clip_rect_item)
+        pen = QPen(QColor(255, 0, 0), 2)
+        pen.setCosmetic(True)
+        self.clip_rect_items = []
+        for clip_rect in clip_rects:
+            # The items are in the coordinates of the image as stored.
+            clip_rect_item = QGraphicsRectItem(QRectF(clip_rect),
+                                               self.tiled_image_item)
+            clip_rect_item.setPen(pen)
+            self.clip_rect_items.append(clip_rect_item)
+
+    def fit_image(self):
+        self.is_fitted = True
+        self.fitInView(self.sceneRect(), Qt.AspectRatioMode.KeepAspectRatio)
+
+    def resizeEvent(self, event: QResizeEvent):
+        super().resizeEvent(event)
+        if self.is_fitted:
+            self.fit_image()
+
+    def wheelEvent(self, event: QWheelEvent):
+        """Zoom in or out around the mouse cursor."""
+        if not self.image_path:
+            return
+        zoom_factor = ZOOM_FACTOR ** (event.angleDelta().y() / 120)
+        current_zoom = self.transform().m11()
+        fitted_zoom = min(self.viewport().width() / self.sceneRect().width(),
+                          self.viewport().height()
+                          / self.sceneRect().height())
+        new_zoom = min(max(current_zoom * zoom_factor, fitted_zoom), MAX_ZOOM)
+        if new_zoom == fitted_zoom:
+            self.fit_image()
+            return
+        self.is_fitted = False
+        self.scale(new_zoom / current_zoom, new_zoom / current_zoom)
+
+    def mouseDoubleClickEvent(self, event):
+        """Fit the image to the view again."""
+        self.fit_image()
+
+    @Slot(list, list)
+    def handle_tiles_decoded(self, keys: list[TileKey],
+                             tiles: list[QImage]):
+        for key, tile in zip(keys, tiles):
+            if not tile.isNull():
+                self.tile_cache.put(key, tile)
+        if any(key[0] == self.image_path for key in keys):
+            self.tiled_image_item.update()
+
+    def enterClippingMode(self):
+        self.is_clipping_mode = True
+        self.setDragMode(QGraphicsView.DragMode.RubberBandDrag)
+        self.viewport().setCursor(Qt.CursorShape.CrossCursor)
+
+    def exitClippingMode(self):
+        self.is_clipping_mode = False
+        self.setDragMode(QGraphicsView.DragMode.ScrollHandDrag)
+        self.viewport().unsetCursor()
+
+    @Slot(QRect, QPointF, QPointF)
+    def handle_rubber_band_change(self, viewport_rect: QRect,
+                                  from_scene_point: QPointF,
+                                  to_scene_point: QPointF):
+        # The signal is emitted with a null rectangle when the rubber band
+        # is released.
+        if viewport_rect.isNull():
+            return
+        self.clip_viewport_rect = viewport_rect
+        self.clip_scene_rect = QRectF(from_scene_point,
+                                      to_scene_point).normalized()
+
+    def mouseReleaseEvent(self, event):
+        super().mouseReleaseEvent(event)
+        if not self.is_clipping_mode or self.clip_scene_rect.isNull():
+            return
+        clip_scene_rect = self.clip_scene_rect
+        clip_viewport_rect = self.clip_viewport_rect
+        self.clip_scene_rect = QRectF()
+        if (clip_viewport_rect.width() < MIN_CLIP_SIZE
+                or clip_viewport_rect.height() < MIN_CLIP_SIZE):
+            QMessageBox.warning(self, "Invalid Selection",
+                                "Selection area is too small. Please make a "
+                                "larger selection.")
+            return
+        # Convert the selection to the pixel coordinates of the image as
+        # stored, which are used to crop it.
+        image_clip_rect = self.tiled_image_item.mapRectFromScene(
+            clip_scene_rect).toAlignedRect().intersected(
+            self.tiled_image_item.boundingRect().toAlignedRect())
+        if not image_clip_rect.isEmpty():
+            self.clip_created.emit(image_clip_rect)